@@ -0,0 +1,93 @@
+# bench_parsers.py
+#   Compares the scanner based parsers against parsing a line at a time.
+#   Both store lines the same compact way, so this measures the scanner on
+#   its own, not against the parser from before either change. Content
+#   dense with markers falls back to the per-line loop, "pound" and "xml"
+#   should come out about even and "sparse" well ahead.
+#
+#   Usage: python benchmarks/bench_parsers.py [number of lines]
+import sys
+from timeit import repeat
+
+from julienne.parsers import (Parser, parse_pound_content, parse_xml_content,
+    _split_content, POUND_STYLE, XML_STYLE)
+
+# ===========================================================================
+
+POUND_BLOCK = """\
+def handler(request):
+    value = compute(request)
+    value += 1  #@= 2-
+    #@+ 3-5 older behaviour
+    #@- value = legacy(value)
+    #@[ 6-
+    value = modern(value)
+    #@]
+
+    return value
+"""
+
+XML_BLOCK = """\
+<div class="row">
+  <p>Some text</p>
+  <p>New text</p> <!--@= 2- -->
+  <!--@+ 3-5
+  <p>Older text</p>
+  @+-->
+  <!--@[ 6- -->
+  <p>Modern text</p>
+  <!--@] -->
+</div>
+"""
+
+PLAIN_BLOCK = """\
+class Widget:
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f"Widget({self.name})"
+"""
+
+# ===========================================================================
+
+def per_line(style, content):
+    # The parse loop before the scanner, every line is handled separately
+    parser = Parser(style)
+    line_fn = style.line_fn
+    for line_no, text in enumerate(_split_content(content)):
+        line_fn(parser, line_no, text)
+
+    parser.finish()
+    return parser
+
+
+def bench(name, content, scanned, style, number=3):
+    # Best of several runs, per parse
+    before = min(repeat(lambda: per_line(style, content),
+        number=number, repeat=5)) / number
+    after = min(repeat(lambda: scanned(content), number=number,
+        repeat=5)) / number
+
+    print(f"{name:6} per-line {before * 1000:8.2f}ms   "
+        f"scanner {after * 1000:8.2f}ms   x{before / after:.2f}")
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"Parsing {lines} lines")
+
+    content = POUND_BLOCK * (lines // POUND_BLOCK.count('\n'))
+    bench('pound', content, parse_pound_content, POUND_STYLE)
+
+    content = XML_BLOCK * (lines // XML_BLOCK.count('\n'))
+    bench('xml', content, parse_xml_content, XML_STYLE)
+
+    # Typical source, mostly plain lines with the odd marker
+    block = POUND_BLOCK + PLAIN_BLOCK * 5
+    content = block * (lines // block.count('\n'))
+    bench('sparse', content, parse_pound_content, POUND_STYLE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# bench_writes.py
+#   Compares ways of writing a parsed file's chapters to disk: a line at a
+#   time through the text layer, one text write per file, and one binary
+#   write of content encoded once for every chapter with the same render.
+#
+#   Usage: python benchmarks/bench_writes.py [number of lines] [chapters]
+from pathlib import Path
+import sys
+from tempfile import TemporaryDirectory
+from timeit import repeat
+
+from julienne.parsers import parse_pound_content
+from julienne.writers import FileWriter
+
+# ===========================================================================
+
+BLOCK = """\
+def handler(request):
+    value = compute(request)
+    value += 1  #@= 2-
+    #@+ 3-5 older behaviour
+    #@- value = legacy(value)
+    #@[ 6-
+    value = modern(value)
+    #@]
+
+    return value
+
+
+class Widget:
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f"Widget({self.name})"
+"""
+
+# ===========================================================================
+
+def per_line(parser, dests):
+    # How files were written before renders, a write call per line
+    for chapter, dest in dests:
+        lines = parser.render(chapter).splitlines()
+        with open(dest, "w") as f:
+            for line in lines:
+                f.write(line + "\n")
+
+
+def text_write(parser, dests):
+    for chapter, dest in dests:
+        with open(dest, "w") as f:
+            f.write(parser.render(chapter))
+
+
+def writer_write(parser, dests):
+    writer = FileWriter()
+    for chapter, dest in dests:
+        index = parser.interval(chapter)
+        writer.write(dest, parser.renders[index], ('bench', index))
+
+
+def bench(name, fn, parser, dests, number=3):
+    best = min(repeat(lambda: fn(parser, dests), number=number,
+        repeat=5)) / number
+    print(f"{name:10} {best * 1000:8.2f}ms")
+    return best
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    chapters = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    content = BLOCK * (lines // BLOCK.count('\n'))
+    parser = parse_pound_content(content)
+    print(f"Writing {lines} lines into {chapters} chapters")
+
+    with TemporaryDirectory() as td:
+        tmp = Path(td)
+        dests = [(num, tmp / f"ch{num}.py") for num in range(1, chapters + 1)]
+
+        before = bench('per-line', per_line, parser, dests)
+        bench('text', text_write, parser, dests)
+        after = bench('binary', writer_write, parser, dests)
+        print(f"x{before / after:.2f}")
+
+
+if __name__ == '__main__':
+    main()
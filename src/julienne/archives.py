@@ -0,0 +1,275 @@
+# archives.py
+#   Output writers that put the chapters into archives instead of
+#   directories, each member is added straight from the in-memory render
+from contextlib import contextmanager
+import io
+import shutil
+import tarfile
+from tempfile import SpooledTemporaryFile
+import time
+import zipfile
+
+from julienne.writers import DEFAULT_ENCODING
+
+# ===========================================================================
+
+OUTPUT_FORMATS = ('dir', 'zip', 'tar.gz')
+
+ARCHIVE_SUFFIXES = {
+    'zip': '.zip',
+    'tar.gz': '.tar.gz',
+}
+
+# Streamed files are kept in memory up to this size while being written,
+# beyond it they spill into a temporary file
+SPOOL_SIZE = 16 * 1024 * 1024
+
+# Zip files can't represent anything earlier than this
+ZIP_EPOCH = time.mktime((1980, 1, 1, 0, 0, 0, 0, 0, -1))
+
+# ===========================================================================
+
+class _Archive:
+    # Wraps an open tar or zip file with a common interface for adding members
+    def __init__(self, output_format, path=None, stream=None):
+        self.is_zip = output_format == 'zip'
+        if self.is_zip:
+            self.handle = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        elif stream is not None:
+            self.handle = tarfile.open(fileobj=stream, mode='w|')
+        else:
+            self.handle = tarfile.open(path, 'w:gz')
+
+        # Maps content keys to the name of the first member with the content
+        self.firsts = {}
+
+    def add_dir(self, name, mtime):
+        if self.is_zip:
+            info = self._zip_info(name + '/', mtime, 0o755)
+            info.external_attr |= 0x10   # MS-DOS directory flag
+            self.handle.writestr(info, b'')
+        else:
+            info = self._tar_info(name, mtime, 0o755)
+            info.type = tarfile.DIRTYPE
+            self.handle.addfile(info)
+
+    def add_bytes(self, name, data, mtime, mode=0o644, key=None):
+        if self.is_zip:
+            self.handle.writestr(self._zip_info(name, mtime, mode), data)
+        elif not self._add_link(name, mtime, mode, key):
+            info = self._tar_info(name, mtime, mode)
+            info.size = len(data)
+            self.handle.addfile(info, io.BytesIO(data))
+
+    def add_file(self, name, src, key=None):
+        stat = src.stat()
+        if self.is_zip:
+            self.handle.write(src, name)
+        elif not self._add_link(name, stat.st_mtime, stat.st_mode, key):
+            self.handle.add(src, name, recursive=False)
+
+    def add_fileobj(self, name, f, size, mtime, mode=0o644):
+        if self.is_zip:
+            info = self._zip_info(name, mtime, mode)
+            with self.handle.open(info, 'w', force_zip64=True) as out:
+                shutil.copyfileobj(f, out)
+        else:
+            info = self._tar_info(name, mtime, mode)
+            info.size = size
+            self.handle.addfile(info, f)
+
+    def close(self):
+        self.handle.close()
+
+    # --- Utilities
+    def _add_link(self, name, mtime, mode, key):
+        # Identical content is stored once in a tar, later copies are hard
+        # link members that refer back to the first one
+        if key is None:
+            return False
+
+        first = self.firsts.get(key)
+        if first is None:
+            self.firsts[key] = name
+            return False
+
+        info = self._tar_info(name, mtime, mode)
+        info.type = tarfile.LNKTYPE
+        info.linkname = first
+        self.handle.addfile(info)
+        return True
+
+    def _tar_info(self, name, mtime, mode):
+        info = tarfile.TarInfo(name)
+        info.mtime = int(mtime)
+        info.mode = mode & 0o7777
+        return info
+
+    def _zip_info(self, name, mtime, mode):
+        stamp = time.localtime(max(mtime, ZIP_EPOCH))
+        info = zipfile.ZipInfo(name, stamp[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = (mode & 0xFFFF) << 16
+        return info
+
+
+class ArchiveWriter:
+    """Writes each chapter into an archive, in place of the
+    :class:`FileWriter` that writes them into directories. Members are named
+    relative to `output_dir`, so the chapter directory is the top level of
+    its archive.
+
+    :param output_dir: `Path` the chapter directories would have been
+        created in, the archives are written here instead
+    :param output_format: one of "zip" or "tar.gz", the archive for the
+        chapter directory "ch1" is named "ch1.zip" or "ch1.tar.gz"
+    :param formatter: optional :class:`Formatter`, Python files are passed
+        through it before they are added
+    :param encoding: encoding of the files added
+    :param stream: optional binary file object, when given all the chapters
+        are written into a single uncompressed tar stream on it instead of
+        separate archives. Files with the same content are stored once,
+        later copies are added as hard links.
+    """
+    def __init__(self, output_dir, output_format='tar.gz', formatter=None,
+            encoding=DEFAULT_ENCODING, stream=None):
+        if output_format not in ARCHIVE_SUFFIXES:
+            raise ValueError(f"Unknown output_format *{output_format}*, must "
+                "be one of " + ",".join(OUTPUT_FORMATS))
+
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.formatter = formatter
+        self.encoding = encoding
+        self.stream = stream
+
+        # Everything goes into a single archive when streaming, so chapters
+        # can't be written by separate processes
+        self.single_stream = stream is not None
+
+        # Counts of files added, nothing is ever left unchanged
+        self.written = 0
+        self.unchanged = 0
+
+        # Modification time for members rendered from templates
+        self.mtime = time.time()
+
+        # Open archives, keyed by chapter directory name
+        self._archives = {}
+
+    # --- Same interface as FileWriter
+    def mkdir(self, path):
+        archive, name = self._member(path)
+        archive.add_dir(name, self.mtime)
+
+    def is_current(self, src, dest):
+        return False
+
+    def write(self, dest, content, key=None):
+        archive, name = self._member(dest)
+        if self._formats(dest):
+            content = self.formatter.format(content, dest)
+
+        archive.add_bytes(name, content.encode(self.encoding), self.mtime,
+            key=key)
+        self.written += 1
+
+    def copy(self, src, dest):
+        archive, name = self._member(dest)
+        if self._formats(dest):
+            stat = src.stat()
+            code = src.read_text(encoding=self.encoding)
+            data = self.formatter.format(code, dest).encode(self.encoding)
+            archive.add_bytes(name, data, stat.st_mtime, stat.st_mode)
+        else:
+            archive.add_file(name, src, ('copy', src))
+
+        self.written += 1
+
+    def copy_text(self, src, dest, add_newline=False):
+        archive, name = self._member(dest)
+        data = src.read_bytes()
+        if add_newline:
+            data += b"\n"
+
+        key = ('text', src)
+        if self._formats(dest):
+            code = data.decode(self.encoding)
+            data = self.formatter.format(code, dest).encode(self.encoding)
+
+        archive.add_bytes(name, data, self.mtime, key=key)
+        self.written += 1
+
+    @contextmanager
+    def open_stream(self, dest):
+        """Context manager for adding `dest` a piece at a time, yields a
+        function that takes the strings to write. Tar members need their
+        size up front, so the content is spooled to memory or a temporary
+        file first."""
+        archive, name = self._member(dest)
+        with SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+            encoding = self.encoding
+            yield lambda text: f.write(text.encode(encoding))
+
+            if self._formats(dest):
+                f.seek(0)
+                code = f.read().decode(encoding)
+                data = self.formatter.format(code, dest).encode(encoding)
+                archive.add_bytes(name, data, self.mtime)
+            else:
+                size = f.tell()
+                f.seek(0)
+                archive.add_fileobj(name, f, size, self.mtime)
+
+        self.written += 1
+
+    def close_chapter(self, output_path):
+        """Finishes the archive for the chapter directory `output_path`."""
+        if self.single_stream:
+            return
+
+        archive = self._archives.pop(output_path.name, None)
+        if archive is not None:
+            archive.close()
+
+    def close(self):
+        """Finishes all the open archives."""
+        for archive in self._archives.values():
+            archive.close()
+
+        self._archives = {}
+
+    # --- Results from worker processes
+    def take_results(self):
+        results = (self.written, self.unchanged)
+        self.written = 0
+        self.unchanged = 0
+        return results
+
+    def merge_results(self, results):
+        written, unchanged = results
+        self.written += written
+        self.unchanged += unchanged
+
+    # --- Utilities
+    def _formats(self, dest):
+        return self.formatter is not None and self.formatter.applies(dest)
+
+    def _member(self, dest):
+        # Returns the archive and member name for a path in the output
+        rel = dest.relative_to(self.output_dir)
+        chapter = '' if self.single_stream else rel.parts[0]
+
+        archive = self._archives.get(chapter)
+        if archive is None:
+            if self.single_stream:
+                archive = _Archive('tar', stream=self.stream)
+            else:
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                path = self.output_dir / (chapter +
+                    ARCHIVE_SUFFIXES[self.output_format])
+                archive = _Archive(self.output_format, path)
+
+            self._archives[chapter] = archive
+
+        return archive, rel.as_posix()
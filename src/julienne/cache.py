@@ -0,0 +1,93 @@
+# cache.py
+#   Persistent cache of parse results, keyed by file content
+import hashlib
+import os
+from pathlib import Path
+import pickle
+
+from julienne.parsers import PARSER_VERSION
+
+# ===========================================================================
+
+DEFAULT_CACHE_SIZE = 100    # in MB
+
+# ===========================================================================
+
+class ParseCache:
+    """Stores parse results on disk so unchanged files don't need to be
+    parsed again. Entries are keyed by a hash of the file's content, the
+    parser that was used, and the parser version, so they never go out of
+    date. Once the cache directory grows beyond `max_size` the least
+    recently used entries are removed by :meth:`evict`.
+
+    :param path: `Path` of the cache directory, created if needed
+    :param max_size: maximum size of the cache in megabytes
+    """
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE):
+        self.path = Path(path)
+        self.max_size = int(max_size * 1024 * 1024)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def key(self, data, kind):
+        """Returns the cache key for the bytes `data` parsed by the parser
+        named `kind`."""
+        digest = hashlib.sha256(data)
+        digest.update(f":{kind}:{PARSER_VERSION}".encode())
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return self.path / key[:2] / f"{key}.pickle"
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None if there isn't one."""
+        entry = self._entry(key)
+        try:
+            with open(entry, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupt or out of date entry, treat it as missing
+            entry.unlink(missing_ok=True)
+            return None
+
+        # Touch the entry so eviction knows it was recently used
+        os.utime(entry)
+        return value
+
+    def put(self, key, value):
+        entry = self._entry(key)
+        entry.parent.mkdir(exist_ok=True)
+
+        # Write to a temporary then move it so that parallel runs never see
+        # a partial entry
+        temp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        with open(temp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp, entry)
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is below
+        its maximum size.
+
+        :returns: number of entries removed
+        """
+        entries = []
+        total = 0
+        for entry in self.path.glob('*/*.pickle'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+        removed = 0
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+
+            entry.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+
+        return removed
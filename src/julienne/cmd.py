@@ -1,6 +1,10 @@
 import argparse
+from contextlib import redirect_stdout
+import sys
+
 from julienne.filemodel import (generate_files, display_pound_files,
     display_xml_files)
+from julienne.watch import watch
 
 # ===========================================================================
 
@@ -26,8 +30,62 @@ parser.add_argument('-v', '--verbose', help="Print info while processing",
 parser.add_argument('-i', '--info', help="Only show info, don't process",
     action='store_true', default=False)
 
-parser.add_argument('-c', '--chapter', help="Only process a specific chapter",
-    type=int, default=None)
+chapter_group = parser.add_mutually_exclusive_group()
+chapter_group.add_argument('-c', '--chapter', type=int, default=None,
+    help="Only process a specific chapter")
+
+chapter_group.add_argument('--chapters', type=str, default=None,
+    help=("Only process the chapters in a comma separated list of ranges, "
+        "for example '3-7,12,30-'"))
+
+parser.add_argument('-j', '--jobs', type=int, default=None,
+    help=("Number of processes used to generate chapters, 0 means use all "
+        "CPUs. Overrides the 'jobs' value in the config file"))
+
+parser.add_argument('--file-major', action='store_true', default=None,
+    help=("Render one file at a time into every chapter, keeping only that "
+        "file's parse results in memory"))
+
+parser.add_argument('--incremental', action='store_true', default=None,
+    help=("Only rewrite outputs that changed since the last run, tracked in a "
+        "manifest in the output directory"))
+
+parser.add_argument('--skip-unchanged', action='store_true', default=None,
+    help=("Leave outputs that already have the right content untouched, "
+        "keeping their modification times"))
+
+parser.add_argument('--cache-dir', type=str, default=None,
+    help=("Directory for caching parse results between runs. Overrides the "
+        "'cache_dir' value in the config file"))
+
+stream_group = parser.add_mutually_exclusive_group()
+stream_group.add_argument('--stdout', action='store_true', default=False,
+    help=("Write all the chapters as a single tar stream to stdout instead "
+        "of the output directory, messages go to stderr"))
+
+stream_group.add_argument('--git-output', action='store_true', default=False,
+    help=("Write the chapters to stdout as a 'git fast-import' stream with a "
+        "commit per chapter, messages go to stderr"))
+
+parser.add_argument('--diff', type=int, nargs=2, default=None,
+    metavar=('OLD', 'NEW'),
+    help=("Print a unified diff between two chapters, worked out from the "
+        "parse results, instead of generating them"))
+
+parser.add_argument('--changes', type=int, default=None, metavar='CHAPTER',
+    help=("List the files, and line numbers within them, that are added or "
+        "removed in CHAPTER compared to the one before it"))
+
+parser.add_argument('--patches', type=str, default=None, metavar='DIR',
+    help=("Write a patch between each pair of consecutive chapters into DIR "
+        "instead of generating them, limited by --chapters if given"))
+
+parser.add_argument('-w', '--watch', action='store_true', default=False,
+    help=("After generating, keep watching the source and config file, "
+        "regenerating whatever changes"))
+
+parser.add_argument('--poll', action='store_true', default=False,
+    help="When watching, scan for changes instead of using inotify")
 
 parser.add_argument('-d', '--debug', type=str, default='',
     help="Show full debug for file names that match the argument")
@@ -54,5 +112,34 @@ def main():
                 "-p or -x")
             exit()
 
+        if args.chapter is not None and (args.diff or args.patches or
+                args.changes is not None):
+            parser.error("--diff, --patches and --changes compare chapters, "
+                "they can't be used with --chapter")
+
+        if args.stdout or args.git_output:
+            if args.watch:
+                parser.error("--stdout and --git-output can't be used with "
+                    "--watch")
+
+            # Keep messages out of the stream
+            stream = sys.stdout.buffer
+            kwargs = {'git_stream' if args.git_output else 'tar_stream': stream}
+            with redirect_stdout(sys.stderr):
+                generate_files(args.config_file, args.verbose, args.info,
+                    args.chapter, args.debug, args.jobs, args.file_major,
+                    args.incremental, args.cache_dir, args.chapters, **kwargs)
+
+            stream.flush()
+            return
+
+        if args.watch:
+            watch(args.config_file, args.verbose, args.chapter, args.jobs,
+                args.file_major, args.incremental, args.cache_dir,
+                args.chapters, args.skip_unchanged, polling=args.poll)
+            return
+
         generate_files(args.config_file, args.verbose, args.info, args.chapter, 
-            args.debug)
+            args.debug, args.jobs, args.file_major, args.incremental,
+            args.cache_dir, args.chapters, args.skip_unchanged,
+            diff=args.diff, patch_dir=args.patches, changes=args.changes)
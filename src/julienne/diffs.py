@@ -0,0 +1,414 @@
+# diffs.py
+#   Unified diffs between chapters, worked out from the node and line ranges
+#   instead of comparing generated output
+from collections import namedtuple
+
+from julienne.nodes import (DirNode, ConditionalCopyOnlyFileNode,
+    ConditionalFileNodeMixin, _BaseFileNode)
+
+# ===========================================================================
+
+# Lines of unchanged content shown around each change
+CONTEXT = 3
+
+NO_FILE = '/dev/null'
+
+# What happens to a file at a chapter: its `status` is one of "added",
+# "removed" or "changed". For changed files `added` and `removed` are lists of
+# the `(first, last)` line numbers that are new in the chapter's output, and
+# that are gone from the previous chapter's output
+ChapterChange = namedtuple('ChapterChange', ['path', 'status', 'added',
+    'removed'])
+
+# ===========================================================================
+
+def _format_range(start, length):
+    # Hunk header range, same conventions as "diff -u": `start` is zero
+    # based, empty ranges give the line before them
+    if length == 1:
+        return f'{start + 1}'
+
+    if length == 0:
+        return f'{start},0'
+
+    return f'{start + 1},{length}'
+
+
+def _split(text):
+    # Lines of newline terminated text
+    if not text:
+        return []
+
+    return text[:-1].split('\n')
+
+
+def _groups(changes, context):
+    # Splits the changed lines into the runs that share a hunk, changes are
+    # in the same hunk when their context would touch
+    group = [changes[0]]
+    for change in changes[1:]:
+        _, prev_old, _, prev_in_old = group[-1]
+        between = change[1] - prev_old - prev_in_old
+        if between > 2 * context:
+            yield group
+            group = []
+
+        group.append(change)
+
+    yield group
+
+
+def _hunks(parser, old, new, context=CONTEXT):
+    # Yields the hunks between two chapters of a parsed file. The changed
+    # lines come from the line ranges, only the lines around them are
+    # looked at to fill in the context
+    changes = parser.changes(old, new)
+    if not changes:
+        return
+
+    both = lambda index: parser.present(index, old) and parser.present(
+        index, new)
+    count = len(parser.lines)
+
+    for group in _groups(changes, context):
+        first = group[0][0]
+        last = group[-1][0]
+
+        before = []
+        index = first - 1
+        while index >= 0 and len(before) < context:
+            if both(index):
+                before.append(index)
+            index -= 1
+
+        body = []
+        for index in range(first, last + 1):
+            in_old = parser.present(index, old)
+            in_new = parser.present(index, new)
+            if in_old and in_new:
+                body.append(' ' + parser.content(index))
+            elif in_old:
+                body.append('-' + parser.content(index))
+            elif in_new:
+                body.append('+' + parser.content(index))
+
+        after = []
+        index = last + 1
+        while index < count and len(after) < context:
+            if both(index):
+                after.append(index)
+            index += 1
+
+        lines = [' ' + parser.content(index) for index in reversed(before)]
+        lines.extend(body)
+        lines.extend(' ' + parser.content(index) for index in after)
+
+        old_len = sum(1 for line in lines if line[0] != '+')
+        new_len = sum(1 for line in lines if line[0] != '-')
+        old_start = group[0][1] - len(before)
+        new_start = group[0][2] - len(before)
+
+        yield (f'@@ -{_format_range(old_start, old_len)} '
+            f'+{_format_range(new_start, new_len)} @@')
+        yield from lines
+
+
+def _whole(lines, tag, newline=True):
+    # Hunk for a file that is only in one of the chapters
+    if not lines:
+        return
+
+    old = _format_range(0, len(lines) if tag == '-' else 0)
+    new = _format_range(0, len(lines) if tag == '+' else 0)
+    yield f'@@ -{old} +{new} @@'
+    yield from (tag + line for line in lines)
+
+    if not newline:
+        yield '\\ No newline at end of file'
+
+# ===========================================================================
+
+def _parsed(node):
+    # Returns the node's parser and whether it was parsed just for this,
+    # streamed files and those released in file major mode don't keep one
+    if node.parser is not None:
+        return node.parser, False
+
+    node.parse_file(node.cache, fast_path=False)
+    return node.parser, True
+
+
+def _files(node, old, new, in_old=True, in_new=True):
+    # Yields `(node, in_old, in_new)` for every file in either chapter
+    for child in node.children:
+        if isinstance(child, DirNode):
+            child_old = in_old and child.should_traverse(old)
+            child_new = in_new and child.should_traverse(new)
+            if child_old or child_new:
+                yield from _files(child, old, new, child_old, child_new)
+        else:
+            child_old = in_old and child.in_chapter(old)
+            child_new = in_new and child.in_chapter(new)
+            if child_old or child_new:
+                yield child, child_old, child_new
+
+
+def _file_diff(node, old, new, in_old, in_new, context, encoding):
+    # Yields the header and hunks for one file, nothing if it is the same
+    # in both chapters
+    if in_old and in_new and not isinstance(node, _BaseFileNode):
+        # Copied as is, content never changes between chapters
+        return
+
+    if isinstance(node, _BaseFileNode):
+        if node.verbatim:
+            if in_old and in_new:
+                return
+
+            chapter = old if in_old else new
+            yield from _whole(_split(node.render(chapter)),
+                '-' if in_old else '+')
+            return
+
+        parser, parsed = _parsed(node)
+        try:
+            if in_old and in_new:
+                yield from _hunks(parser, old, new, context)
+            else:
+                chapter = old if in_old else new
+                yield from _whole(_split(parser.render(chapter)),
+                    '-' if in_old else '+')
+        finally:
+            if parsed:
+                node.release()
+
+        return
+
+    # Copy only files that come and go
+    data = node.path.read_bytes()
+    try:
+        text = data.decode(encoding)
+    except UnicodeDecodeError:
+        yield None
+        return
+
+    newline = text.endswith('\n')
+    lines = _split(text if newline else text + '\n')
+    yield from _whole(lines, '-' if in_old else '+', newline)
+
+
+def _check_tree(tree):
+    # Trees built for a single chapter are missing the files of the others
+    if tree.chapter is not None:
+        raise ValueError(f"Tree was built for chapter {tree.chapter} only, "
+            "chapters can't be compared")
+
+
+def iter_diff(tree, old, new, context=CONTEXT):
+    """Yields the lines of a unified diff between chapters `old` and `new`
+    of a :class:`FileTree`, without newlines. Changes within files come
+    from the per-line chapter ranges and files coming and going from the
+    node ranges, so neither chapter is rendered or written out. Paths are
+    labelled with the chapter directory names.
+
+    Diffs are of the content before any formatting with isort or black.
+
+    :param tree: :class:`FileTree` to compare chapters of
+    :param old: chapter number the diff goes from
+    :param new: chapter number the diff goes to
+    :param context: number of unchanged lines shown around changes
+    :raises ValueError: if the tree was built for a single chapter
+    """
+    _check_tree(tree)
+    old_name = tree.chapter_name(old)
+    new_name = tree.chapter_name(new)
+    parent_path = tree.base_dir.parent
+
+    for node, in_old, in_new in _files(tree.root, old, new):
+        lines = _file_diff(node, old, new, in_old, in_new, context,
+            tree.encoding)
+        first = next(lines, False)
+        if first is False and (in_old and in_new):
+            continue
+
+        rel = node.path.relative_to(parent_path).as_posix()
+        old_label = f'{old_name}/{rel}' if in_old else NO_FILE
+        new_label = f'{new_name}/{rel}' if in_new else NO_FILE
+
+        if first is None:
+            yield f'Binary files {old_label} and {new_label} differ'
+            continue
+
+        yield f'--- {old_label}'
+        yield f'+++ {new_label}'
+        if first is not False:
+            yield first
+            yield from lines
+
+
+def chapter_diff(tree, old, new, context=CONTEXT):
+    """Returns the unified diff between chapters `old` and `new` of a
+    :class:`FileTree` as a string, see :func:`iter_diff`."""
+    return ''.join(line + '\n' for line in iter_diff(tree, old, new,
+        context))
+
+
+def write_patches(tree, patch_dir, selection=None, context=CONTEXT):
+    """Writes a patch file for each pair of consecutive chapters into
+    `patch_dir`, named after the two chapter directories, like
+    "ch01-ch02.patch". Applying them in order with `patch -p1` inside a
+    copy of the first chapter steps it through the rest.
+
+    :param tree: :class:`FileTree` to compare chapters of
+    :param patch_dir: `Path` of the directory to write into, created if
+        needed
+    :param selection: optional list of chapter numbers, see
+        :meth:`FileTree.select_chapters`. Consecutive entries in the list
+        are compared. Defaults to all the chapters.
+    :param context: number of unchanged lines shown around changes
+    :returns: list of the patch file `Path` objects written
+    :raises ValueError: if the tree was built for a single chapter
+    """
+    _check_tree(tree)
+    if selection is None:
+        selection = range(1, tree.biggest + 1)
+
+    patch_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    selection = list(selection)
+    for old, new in zip(selection, selection[1:]):
+        name = f'{tree.chapter_name(old)}-{tree.chapter_name(new)}.patch'
+        path = patch_dir / name
+        with open(path, 'w', encoding=tree.encoding, newline='') as f:
+            for line in iter_diff(tree, old, new, context):
+                f.write(line + '\n')
+
+        paths.append(path)
+
+    return paths
+
+# ===========================================================================
+# Change Index
+# ===========================================================================
+
+def _bounds(lower, upper):
+    # Chapters where something in the range lower-upper comes or goes
+    points = {lower}
+    if upper is not None:
+        points.add(upper + 1)
+
+    return points
+
+
+def _spans(numbers):
+    # Groups sorted line numbers into (first, last) runs
+    spans = []
+    for number in numbers:
+        if spans and spans[-1][1] + 1 == number:
+            spans[-1] = (spans[-1][0], number)
+        else:
+            spans.append((number, number))
+
+    return spans
+
+
+class ChangeIndex:
+    """Index of what appears and disappears at each chapter of a
+    :class:`FileTree`, see :meth:`FileTree.changes`. Building it finds the
+    chapters where each file or any of its lines come or go, using the
+    directory, node and line ranges. Only the files listed under a chapter
+    are looked at when asked about it, and nothing is rendered.
+
+    :param tree: :class:`FileTree` to index
+    """
+    def __init__(self, tree):
+        self.tree = tree
+
+        # Maps chapters to the (node, parent directories) pairs for the
+        # files that may change there
+        self.boundaries = {}
+        self._index(tree.root, ())
+
+    def _index(self, node, parents, points=frozenset()):
+        for child in node.children:
+            if isinstance(child, DirNode):
+                child_points = points
+                if child.lower is not None:
+                    child_points = points | _bounds(child.lower, child.upper)
+
+                self._index(child, parents + (child,), child_points)
+                continue
+
+            # Every file is new in the first chapter
+            for chapter in points | self._file_bounds(child) | {1}:
+                self.boundaries.setdefault(chapter, []).append((child,
+                    parents))
+
+    def _file_bounds(self, node):
+        if isinstance(node, ConditionalCopyOnlyFileNode):
+            return _bounds(node.lower, node.upper)
+
+        if not isinstance(node, _BaseFileNode):
+            return set()
+
+        points = set()
+        if isinstance(node, ConditionalFileNodeMixin):
+            points |= _bounds(node.lower, node.upper)
+
+        node.ensure_loaded()
+
+        if node.verbatim:
+            return points
+
+        if node.all_conditional and node.bottom is not None:
+            points |= _bounds(node.bottom, node.top)
+
+        parser, parsed = _parsed(node)
+        points |= parser.boundaries()
+        if parsed:
+            node.release()
+
+        return points
+
+    def _present(self, node, parents, chapter):
+        return all(parent.should_traverse(chapter) for parent in parents) \
+            and node.in_chapter(chapter)
+
+    def changes(self, chapter):
+        """Returns the list of :class:`ChapterChange` tuples for the files
+        that are added, removed or changed in `chapter` compared to the one
+        before it, in tree order. Everything in the first chapter is
+        added."""
+        parent_path = self.tree.base_dir.parent
+
+        results = []
+        for node, parents in self.boundaries.get(chapter, []):
+            in_new = self._present(node, parents, chapter)
+            in_old = chapter > 1 and self._present(node, parents,
+                chapter - 1)
+
+            rel = node.path.relative_to(parent_path).as_posix()
+            if in_old and in_new:
+                if not isinstance(node, _BaseFileNode) or node.verbatim:
+                    continue
+
+                parser, parsed = _parsed(node)
+                lines = parser.changes(chapter - 1, chapter)
+                if parsed:
+                    node.release()
+
+                if not lines:
+                    continue
+
+                added = _spans(new_pos + 1 for _, _, new_pos, in_old_line
+                    in lines if not in_old_line)
+                removed = _spans(old_pos + 1 for _, old_pos, _, in_old_line
+                    in lines if in_old_line)
+                results.append(ChapterChange(rel, 'changed', added, removed))
+            elif in_new:
+                results.append(ChapterChange(rel, 'added', [], []))
+            elif in_old:
+                results.append(ChapterChange(rel, 'removed', [], []))
+
+        return results
@@ -1,14 +1,28 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 from math import log, ceil
+import multiprocessing
+import os
 from pathlib import Path
 import shutil
-import sys
 
 import tomli
 
-from julienne.parsers import range_token
+from julienne.parsers import (range_token, chapter_in_range, chapter_ranges,
+    CommentStyle, COMMENT_STYLES, POUND_STYLE, XML_STYLE)
 from julienne.nodes import (DirNode, ConditionalDirNode, PoundFileNode,
-    ConditionalPoundFileNode, ConditionalCopyOnlyFileNode, CopyOnlyFileNode,
-    XMLFileNode, ConditionalXMLFileNode, _BaseFileNode)
+    ConditionalCopyOnlyFileNode, CopyOnlyFileNode, XMLFileNode,
+    _BaseFileNode, make_file_node)
+from julienne import __version__
+from julienne.archives import ArchiveWriter, OUTPUT_FORMATS
+from julienne.cache import ParseCache, DEFAULT_CACHE_SIZE
+from julienne.diffs import chapter_diff, write_patches, ChangeIndex
+from julienne.formatters import Formatter
+from julienne.gitstream import GitWriter, DEFAULT_BRANCH
+from julienne.manifest import Manifest
+from julienne.matching import compile_globs, IgnoreRules
+from julienne.views import ChapterView
+from julienne.writers import FileWriter, DEFAULT_ENCODING
 
 # ===========================================================================
 # Utilities
@@ -21,6 +35,14 @@ def _convert_path(base_path, path):
     mixed = base_path / path
     return mixed.resolve()
 
+def _manifest_hash(config_text, formatter):
+    # Identifies what a manifest's outputs were generated with
+    identity = __version__ + config_text
+    if formatter.enabled:
+        identity += formatter.kind
+
+    return hashlib.sha256(identity.encode()).hexdigest()
+
 def _traverse(chapter, node, cmd, *args):
     fn = getattr(node, cmd)
     fn(*args)
@@ -33,6 +55,67 @@ def _traverse(chapter, node, cmd, *args):
             fn(*args)
 
 
+def _render_chapter(tree, chapter, output_path, writer):
+    # Call the "copy" command, traversing the tree to generate the output
+    parent_path = tree.base_dir.parent
+    _traverse(chapter, tree.root, 'copy', chapter, parent_path, output_path,
+        writer)
+    writer.close_chapter(output_path)
+
+
+def _render_file_major(node, chapters, parent_path, writer):
+    # Renders everything under the DirNode `node` into each of the (chapter,
+    # output_path) pairs in `chapters`. Files are loaded, written into all of
+    # the chapters and then released, so only one file's parse results are in
+    # memory at a time
+    for num, output_path in chapters:
+        node.copy(num, parent_path, output_path, writer)
+
+    for child in node.children:
+        if isinstance(child, DirNode):
+            subset = [(num, output_path) for num, output_path in chapters
+                if child.should_traverse(num)]
+            if subset:
+                _render_file_major(child, subset, parent_path, writer)
+
+            continue
+
+        if not isinstance(child, _BaseFileNode):
+            for num, output_path in chapters:
+                child.copy(num, parent_path, output_path, writer)
+
+            continue
+
+        loaded = child.loaded
+        child.copy_chapters(chapters, parent_path, writer)
+
+        if not loaded:
+            child.release()
+
+# Process pool workers get their copy of the tree and writer once, when they
+# start. With "fork" the already parsed tree is inherited from the parent,
+# otherwise it is pickled a single time per worker instead of once per chapter
+_worker_tree = None
+_worker_writer = None
+
+def _init_worker(tree, writer):
+    global _worker_tree, _worker_writer
+    _worker_tree = tree
+    _worker_writer = writer
+
+
+def _render_chapter_worker(chapter, output_path):
+    _render_chapter(_worker_tree, chapter, output_path, _worker_writer)
+    return _worker_writer.take_results()
+
+
+def _pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+
+    return multiprocessing.get_context()
+
+
 def _walk_node(node):
     if isinstance(node, DirNode):
         for child in node.children:
@@ -44,32 +127,85 @@ def _walk_node(node):
 def _print_node_contents(node):
     print("***", node.path)
     if isinstance(node, _BaseFileNode):
+        if node.parser is None:
+            node.parse_file(fast_path=False)
+
         for line in node.parser.lines:
             lower = '*' if line.lower is None else str(line.lower)
             upper = '*' if line.upper is None else str(line.upper)
             print(f"{lower:>2}-{upper:2} |", line.content)
 
+
+def _format_spans(sign, spans):
+    return sign + ','.join(str(first) if first == last else
+        f'{first}-{last}' for first, last in spans)
+
+
+def _print_changes(tree, chapter):
+    print(f"*** Chapter {chapter} ({tree.chapter_name(chapter)})")
+    for change in tree.changes(chapter):
+        line = f"{change.status:8} {change.path}"
+        if change.added:
+            line += ' ' + _format_spans('+', change.added)
+        if change.removed:
+            line += ' ' + _format_spans('-', change.removed)
+
+        print(line)
+
 # ===========================================================================
 # File Tree
 # ===========================================================================
 
 class FileTree:
-    def __init__(self, config, base_path, base_dir, verbose=False):
+    def __init__(self, config, base_path, base_dir, verbose=False,
+            file_major=None, cache=None, chapter=None):
         self.base_path = base_path
         self.base_dir = base_dir
         self.verbose = verbose
+        self.cache = cache
+
+        # When built for a single chapter, ranged files and directories
+        # outside of it are left out of the tree, and files are only loaded
+        # when they are first rendered
+        self.chapter = chapter
+
+        # In file major mode the parse results are only kept long enough to
+        # find the file's chapter range, files are re-parsed one at a time
+        # during generation
+        if file_major is None:
+            file_major = config.get('file_major', False)
+        self.file_major = file_major
+
+        # Parsed files bigger than this many bytes are never held in memory,
+        # they are streamed line by line each time they are written
+        self.stream_size = config.get('stream_size', None)
+
+        # Source files are read, and the output written, in this encoding
+        self.encoding = config.get('encoding', DEFAULT_ENCODING)
+
+        # Patterns for the Python style and XML style files that participate
+        # in the parsing, matched against paths relative to base_dir
+        self.pound_match = compile_globs(config.get('pound_globs',
+            ['**/*.py', ]))
+        self.xml_match = compile_globs(config.get('xml_globs',
+            ['**/*.xml', '**/*.htm', '**/*.html' ]))
+
+        # Files are parsed with the first comment style whose patterns match,
+        # the Python and XML styles are checked before any others
+        self.styles = [(self.pound_match, POUND_STYLE),
+            (self.xml_match, XML_STYLE)]
+        for name, spec in config.get('comment_styles', {}).items():
+            if 'opener' in spec:
+                style = CommentStyle(name, spec['opener'], spec.get('closer'))
+            else:
+                try:
+                    style = COMMENT_STYLES[name]
+                except KeyError:
+                    raise ValueError(f"Unknown comment style *{name}*, must "
+                        "specify an opener or be one of " 
+                        + ",".join(COMMENT_STYLES.keys()))
 
-        # Find the Python style files that participate in the parsing
-        self.pound_files = []
-        globs = config.get('pound_globs', ['**/*.py', ])
-        for pattern in globs:
-            self.pound_files.extend(base_dir.glob(pattern))
-
-        # Find the XML style files that participate in the parsing
-        self.xml_files = []
-        globs = config.get('xml_globs', ['**/*.xml', '**/*.htm', '**/*.html' ])
-        for pattern in globs:
-            self.xml_files.extend(base_dir.glob(pattern))
+            self.styles.append((compile_globs(spec.get('globs', [])), style))
 
         # Find the files that specify a participation range
         self.ranged_files_map = {}
@@ -79,11 +215,25 @@ class FileTree:
                 ranged_path = _convert_path(base_path, Path(path))
                 self.ranged_files_map[ranged_path] = token
 
+        # Walking the tree compares string paths
+        self._ranged_lookup = {str(path): token for path, token in
+            self.ranged_files_map.items()}
+
         # Find the directories to skip
-        self.skip_dirs = []
+        self.skip_dirs = set()
         for dirname in config.get('skip_dirs', []):
             path = _convert_path(base_dir, Path(dirname))
-            self.skip_dirs.append(path)
+            self.skip_dirs.add(str(path))
+
+        # Load any gitignore style files
+        ignore_files = config.get('ignore_file', [])
+        if isinstance(ignore_files, str):
+            ignore_files = [ignore_files, ]
+
+        self.ignore_rules = []
+        for filename in ignore_files:
+            path = _convert_path(base_path, Path(filename))
+            self.ignore_rules.append(IgnoreRules.from_file(path))
 
         # Other values from the config
         self.skip_patterns = config.get('skip_patterns', [])
@@ -92,69 +242,157 @@ class FileTree:
 
         # Build the file tree
         self.root = DirNode(self.base_dir)
-        self._process_dir_node(self.root, base_dir)
-        self._find_biggest()
+        self._process_dir_node(self.root, str(base_dir))
+
+        # Finding the biggest chapter means loading every file, it is only
+        # done when asked for
+        self._biggest = None
+        self._digits = None
+
+        # Built the first time changes() is called
+        self._change_index = None
 
         if self.verbose:
             print('\n** File tree:')
-            _traverse(self.biggest, self.root, 'info')
-
-    def _process_dir_node(self, parent, dir_path):
-        for path in dir_path.iterdir():
-            # Skip any paths that are in our ignore_substrings list
-            skip = False
-            for pattern in self.skip_patterns:
-                if pattern in str(path):
-                    skip = True
-                    break
-
-            if skip:
-                # Path contained a skip pattern, don't process it
+            if self.chapter is not None:
+                _traverse(self.chapter, self.root, 'info')
+            else:
+                _traverse(self.biggest, self.root, 'info')
+
+    def _process_dir_node(self, parent, dir_path, rel_dir=''):
+        # Single pass over the tree, each entry is classified as it is found.
+        # Paths stay as strings until a node is created for them, `rel_dir`
+        # is the "/" separated path of dir_path relative to base_dir
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                self._process_entry(parent, entry, rel_dir)
+
+    def _skip_reason(self, name, is_dir):
+        # Returns why the string path `name` should be skipped, or None. Done
+        # before a directory is entered, so nothing underneath a skipped
+        # directory is ever looked at
+        for pattern in self.skip_patterns:
+            if pattern in name:
+                return f"of pattern={pattern}"
+
+        if is_dir and name in self.skip_dirs:
+            return "it is in skip_dirs"
+
+        for rules in self.ignore_rules:
+            if rules.ignored(name, is_dir):
+                return "it matches ignore_file"
+
+        return None
+
+    def _process_entry(self, parent, entry, rel_dir):
+        name = entry.path
+
+        try:
+            is_dir = entry.is_dir()
+            reason = self._skip_reason(name, is_dir)
+            if reason is not None:
+                if self.verbose:
+                    print(f"Skipping {name} because {reason}")
+                return
+
+            if self._out_of_chapter(name):
                 if self.verbose:
-                    print(f"Skipping {path} because of pattern={pattern}")
-                continue
-
-            try:
-                if path.is_dir():
-                    if path in self.skip_dirs:
-                        if self.verbose:
-                            print(f"Skipping {path} because it is in skip_dirs")
-
-                        continue
-                    elif path in self.ranged_files_map.keys():
-                        token = self.ranged_files_map[path]
-                        node = ConditionalDirNode(path, token)
-                    else:
-                        node = DirNode(path)
-
-                    parent.children.append(node)
-                    self._process_dir_node(node, node.path)
+                    print(f"Skipping {name} because it is not in chapter "
+                        f"{self.chapter}")
+                return
+
+            token = self._ranged_lookup.get(name)
+
+            if is_dir:
+                if token is not None:
+                    node = ConditionalDirNode(Path(name), token)
                 else:
-                    if path in self.pound_files:
-                        if path in self.ranged_files_map.keys():
-                            token = self.ranged_files_map[path]
-                            node = ConditionalPoundFileNode(path, token)
-                        else:
-                            node = PoundFileNode(path)
-
-                        node.parse_file()
-                    elif path in self.xml_files:
-                        if path in self.ranged_files_map.keys():
-                            token = self.ranged_files_map[path]
-                            node = ConditionalXMLFileNode(path, token)
-                        else:
-                            node = XMLFileNode(path)
-
-                        node.parse_file()
-                    elif path in self.ranged_files_map.keys():
-                        token = self.ranged_files_map[path]
-                        node = ConditionalCopyOnlyFileNode(path, token)
-                    else:
-                        node = CopyOnlyFileNode(path)
-
-                    parent.children.append(node)
-            except Exception as e:
-                raise e.__class__(f"Error parsing {path}. " + str(e))
+                    node = DirNode(Path(name))
+
+                parent.children.append(node)
+                self._process_dir_node(node, name, rel_dir + entry.name + '/')
+                return
+
+            rel = rel_dir + entry.name
+            style = self._match_style(rel)
+            if style is not None:
+                node = make_file_node(Path(name), style, token)
+                self._parse_node(node)
+            elif token is not None:
+                node = ConditionalCopyOnlyFileNode(Path(name), token)
+            else:
+                node = CopyOnlyFileNode(Path(name))
+
+            parent.children.append(node)
+        except Exception as e:
+            raise e.__class__(f"Error parsing {name}. " + str(e))
+
+    def _out_of_chapter(self, name):
+        # True if the tree is for a single chapter and the string path `name`
+        # has a range that doesn't include it
+        token = self._ranged_lookup.get(name)
+        if token is None or self.chapter is None:
+            return False
+
+        lower, upper = range_token(token)
+        return not chapter_in_range(self.chapter, True, lower, upper)
+
+    def includes(self, name, is_dir):
+        """Returns True if the string path `name`, a directory if `is_dir`,
+        would be part of the tree when it is in one of the tree's
+        directories."""
+        return self._skip_reason(name, is_dir) is None and \
+            not self._out_of_chapter(name)
+
+    def _match_style(self, rel):
+        # Returns the comment style for the relative path, None if the file
+        # isn't parsed
+        for match, style in self.styles:
+            if match and match.fullmatch(rel):
+                return style
+
+        return None
+
+    def _parse_node(self, node):
+        node.cache = self.cache
+        node.stream_size = self.stream_size
+        node.encoding = self.encoding
+        if self.chapter is not None:
+            # Loaded when it is first rendered
+            return
+
+        self._load_node(node)
+
+    def _load_node(self, node):
+        node.load()
+        if self.file_major:
+            # Only the range summary is needed until the file gets rendered.
+            # Rendering parses the file a second time, or loads it from the
+            # parse cache if there is one, which trades time for memory
+            node.release()
+
+    def invalidate(self):
+        """Forgets everything worked out from the files' contents, like the
+        biggest chapter and the change index. Call it after reloading a
+        node whose file has changed."""
+        self._biggest = None
+        self._digits = None
+        self._change_index = None
+
+    @property
+    def biggest(self):
+        """Largest chapter number used anywhere in the tree."""
+        if self._biggest is None:
+            self._find_biggest()
+
+        return self._biggest
+
+    @property
+    def digits(self):
+        if self._digits is None:
+            self._find_biggest()
+
+        return self._digits
 
     def _find_biggest(self):
         # Need to find the biggest upper bound, might be in the nodes, in the
@@ -174,8 +412,8 @@ class FileTree:
                 max_ranged = upper
 
         # Find biggest chapter and how many digits are in it for padding
-        self.biggest = max(max_node, max_ranged, max_chapter)
-        self.digits = int(ceil(log(self.biggest + 1, 10)))
+        self._biggest = max(max_node, max_ranged, max_chapter)
+        self._digits = int(ceil(log(self._biggest + 1, 10)))
 
     def _find_biggest_in_nodes(self, node, biggest=1):
         result = biggest
@@ -191,6 +429,10 @@ class FileTree:
                     if subresult > result:
                         result = subresult
                 elif isinstance(child, _BaseFileNode):
+                    if not hasattr(child, 'biggest'):
+                        # Tree was built lazily, file hasn't been loaded
+                        self._load_node(child)
+
                     if child.biggest is not None and child.biggest > result:
                         result = child.biggest
 
@@ -200,43 +442,160 @@ class FileTree:
 
         return result
 
-    def generate(self, output_dir, single_chapter=None):
-        parent_path = self.base_dir.parent
+    def chapter_name(self, num):
+        """Returns the name of the output directory for the given chapter"""
+        # If this chapter is in the map, use the mapped suffix instead
+        if str(num) in self.chapter_map:
+            # Filename based on mapped suffix
+            return f"{self.prefix}{self.chapter_map[str(num)]}"
+
+        # Filename based chapter number, padded based on largest number
+        return f"{self.prefix}{num:0{self.digits}}"
+
+    def render(self, chapter, formatter=None):
+        """Returns the chapter's files as a read-only mapping of paths,
+        relative to the chapter directory, to the bytes :meth:`generate`
+        would write for them. Nothing is written, and each file is only
+        rendered when it is looked up, see :class:`ChapterView`.
+
+        :param chapter: chapter number to render
+        :param formatter: optional :class:`Formatter`, Python files are
+            passed through it
+        """
+        if self.chapter is not None and chapter != self.chapter:
+            raise ValueError(f"Tree was built for chapter {self.chapter} "
+                "only")
+
+        return ChapterView(self, chapter, formatter)
+
+    def changes(self, chapter):
+        """Returns what is new or gone in `chapter` compared to the chapter
+        before it, as a list of :class:`ChapterChange` tuples. Files and
+        lines are found from their ranges, no chapter is rendered. The
+        index this uses is built on the first call, loading any files that
+        haven't been.
+
+        :raises ValueError: if the tree was built for a single chapter
+        """
+        if self.chapter is not None:
+            raise ValueError(f"Tree was built for chapter {self.chapter} "
+                "only")
+
+        if self._change_index is None:
+            self._change_index = ChangeIndex(self)
+
+        return self._change_index.changes(chapter)
+
+    def select_chapters(self, expression):
+        """Returns the chapter numbers chosen by a chapter range expression
+        like "3-7,30-", limited to the chapters that exist."""
+        ranges = chapter_ranges(expression)
+        return [num for num in range(1, self.biggest + 1) if
+            any(chapter_in_range(num, True, lower, upper) for lower, upper
+                in ranges)]
+
+    def chapter_targets(self, output_dir, single_chapter=None, selection=None):
+        """Returns the list of `(chapter, output_path)` pairs that
+        :meth:`generate` writes to for the same arguments."""
+        if self.chapter is not None and single_chapter != self.chapter:
+            raise ValueError(f"Tree was built for chapter {self.chapter} "
+                "only")
 
         if single_chapter is not None:
-            output_path = output_dir / Path(f"ch{single_chapter}")
-            _traverse(single_chapter, self.root, 'copy', single_chapter, 
-                parent_path, output_path)
-            return
-
-        # Generate whole range of chapters
-        for num in range(1, self.biggest + 1):
-            print(f'Creating chapter {num}')
-
-            # If this chapter is in the map, use the mapped suffix instead
-            if str(num) in self.chapter_map:
-                # Filename based on mapped suffix
-                filename = f"{self.prefix}{self.chapter_map[str(num)]}"
-            else:
-                # Filename based chapter number, padded based on largest number
-                filename = f"{self.prefix}{num:0{self.digits}}"
-
-            # Call the "copy" command, traversing the tree to generate the
-            # output
-            output_path = output_dir / Path(filename)
-            _traverse(num, self.root, 'copy', num, parent_path, output_path)
+            return [(single_chapter, output_dir / Path(f"ch{single_chapter}"))]
+
+        if selection is None:
+            selection = range(1, self.biggest + 1)
+
+        return [(num, output_dir / Path(self.chapter_name(num)))
+            for num in selection]
+
+    def generate(self, output_dir, single_chapter=None, jobs=1, writer=None,
+            selection=None):
+        """Writes the chapters to `output_dir`.
+
+        :param output_dir: `Path` to write the chapter directories into
+        :param single_chapter: if not None, only generate this chapter
+        :param jobs: number of processes to render chapters with. Chapters
+            are independent of each other, so with more than one job they
+            are spread across a process pool. Values less than 1 mean use
+            all the available CPUs. Not used when the tree was built in file
+            major mode, as that walks the tree only once.
+        :param writer: :class:`FileWriter` used to create the output,
+            defaults to one that copies everything. An
+            :class:`ArchiveWriter` writes the chapters into archives
+            instead.
+        :param selection: if not None, a list of chapter numbers to generate
+            instead of all of them, see :meth:`select_chapters`. Chapter
+            directories are named the same as in a full run.
+        :returns: list of the chapter directory `Path` objects generated
+        """
+        if writer is None:
+            writer = FileWriter()
+
+        chapters = self.chapter_targets(output_dir, single_chapter, selection)
+        if not chapters:
+            return []
+
+        if jobs < 1:
+            jobs = os.cpu_count() or 1
+        jobs = min(jobs, len(chapters))
+
+        if writer.single_stream:
+            # Everything goes to one output, chapters are written in order
+            jobs = 1
+
+        if self.file_major:
+            # Walk the tree once, writing each file to every chapter
+            for num, _ in chapters:
+                print(f'Creating chapter {num}')
+
+            _render_file_major(self.root, chapters, self.base_dir.parent,
+                writer)
+        elif single_chapter is not None:
+            _render_chapter(self, single_chapter, chapters[0][1], writer)
+        elif jobs == 1:
+            # Generate whole range of chapters
+            for num, output_path in chapters:
+                print(f'Creating chapter {num}')
+                _render_chapter(self, num, output_path, writer)
+        else:
+            self._generate_parallel(chapters, jobs, writer)
+
+        writer.close()
+        return [output_path for _, output_path in chapters]
+
+    def _generate_parallel(self, chapters, jobs, writer):
+        # Generate the chapters in parallel, each worker process has its own
+        # copy of the tree
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=_pool_context(),
+                initializer=_init_worker,
+                initargs=(self, writer)) as executor:
+            futures = []
+            for num, output_path in chapters:
+                print(f'Creating chapter {num}')
+                futures.append(executor.submit(_render_chapter_worker, num,
+                    output_path))
+
+            # Wait for everything, raising any problems from the workers
+            for future in futures:
+                writer.merge_results(future.result())
 
 # ===========================================================================
 # File Generation
 # ===========================================================================
 
 def generate_files(config_file, verbose=False, info_only=False, 
-        single_chapter=None, debug=''):
+        single_chapter=None, debug='', jobs=None, file_major=None,
+        incremental=None, cache_dir=None, chapters=None, skip_unchanged=None,
+        tar_stream=None, git_stream=None, diff=None, patch_dir=None,
+        changes=None):
     path = Path(config_file)
     path.resolve()
     base_path = path.parent
 
-    config = tomli.loads(path.read_text())
+    config_text = path.read_text()
+    config = tomli.loads(config_text)
 
     # Check for / create output directory
     output_dir = _convert_path(base_path, Path(config['output_dir']))
@@ -244,7 +603,8 @@ def generate_files(config_file, verbose=False, info_only=False,
         if not output_dir.is_dir():
             raise AttributeError(('The value for "output_dir" in the config '
                 'file pointed to an existing path that was not a directory'))
-    else:
+    elif tar_stream is None and git_stream is None and diff is None and \
+            patch_dir is None and changes is None:
         output_dir.mkdir()
 
     # Check for source directory
@@ -258,8 +618,26 @@ def generate_files(config_file, verbose=False, info_only=False,
         # If only showing info force verbose
         verbose = True
 
-    # Build the tree and then generate the output
-    tree = FileTree(config, base_path, base_dir, verbose)
+    # Optional cache of parse results, command line value overrides config
+    cache = None
+    if cache_dir is None and 'cache_dir' in config:
+        cache_dir = _convert_path(base_path, Path(config['cache_dir']))
+
+    if cache_dir is not None:
+        cache = ParseCache(cache_dir, config.get('cache_size',
+            DEFAULT_CACHE_SIZE))
+
+    # Build the tree and then generate the output. For a single chapter the
+    # tree only has what is in that chapter, debug and info need everything
+    chapter = None
+    if not (debug or info_only):
+        chapter = single_chapter
+
+    tree = FileTree(config, base_path, base_dir, verbose, file_major, cache,
+        chapter)
+
+    if cache is not None:
+        cache.evict()
 
     if debug:
         # Debug mode, show all the line info for everything in matching files
@@ -279,42 +657,118 @@ def generate_files(config_file, verbose=False, info_only=False,
         print('\n**Info only, no chapters generated**')
         exit()
 
-    # Optionally remove the output directory before processing
-    if config.get('delete_output', False):
+    if changes is not None:
+        # Show what comes and goes at a chapter instead of generating
+        _print_changes(tree, changes)
+        return tree
+
+    if diff is not None:
+        # Show the changes between two chapters instead of generating them
+        old, new = diff
+        print(chapter_diff(tree, old, new), end='')
+        return tree
+
+    if patch_dir is not None:
+        # Write patches between consecutive chapters instead of the chapters
+        selection = None
+        if chapters is not None:
+            selection = tree.select_chapters(chapters)
+
+        paths = write_patches(tree, Path(patch_dir), selection)
+        print(f'\n**Wrote {len(paths)} patches')
+        return tree
+
+    # Chapters can be written into archives instead of directories, those
+    # are always written in full
+    output_format = config.get('output_format', 'dir')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output_format *{output_format}*, must be "
+            "one of " + ",".join(OUTPUT_FORMATS))
+
+    stream = tar_stream or git_stream
+    to_archive = output_format != 'dir' or stream is not None
+    if to_archive:
+        incremental = False
+        skip_unchanged = False
+
+    # Incremental runs keep track of what was generated in a manifest, any
+    # change to the config or to julienne invalidates it
+    if incremental is None:
+        incremental = config.get('incremental', False)
+
+    # Python output is optionally formatted with isort and black as it is
+    # written, results are cached along with the parse results. Project
+    # settings for them are found from the output directory
+    formatter = Formatter(config.get('isort', False), config.get('black',
+        False), cache, output_dir)
+
+    manifest = None
+    if incremental:
+        manifest = Manifest(output_dir, _manifest_hash(config_text,
+            formatter))
+
+    # Outputs that already have the right content can be left untouched,
+    # keeping their modification times
+    if skip_unchanged is None:
+        skip_unchanged = config.get('skip_unchanged', False)
+
+    # Optionally remove the output directory before processing, incremental
+    # runs remove out of date files instead, and runs that skip unchanged
+    # files remove whatever they didn't produce afterwards
+    delete_output = config.get('delete_output', False) and not incremental \
+        and stream is None
+    if delete_output and not skip_unchanged:
         print('\n**Removing existing output directory')
         if output_dir.exists():
             shutil.rmtree(output_dir)
 
+    # Command line value for the number of processes overrides the config
+    if jobs is None:
+        jobs = config.get('jobs', 1)
+
+    if git_stream is not None:
+        writer = GitWriter(output_dir, git_stream, config.get('git_branch',
+            DEFAULT_BRANCH), formatter, tree.encoding)
+    elif tar_stream is not None:
+        writer = ArchiveWriter(output_dir, formatter=formatter,
+            encoding=tree.encoding, stream=tar_stream)
+    elif to_archive:
+        writer = ArchiveWriter(output_dir, output_format, formatter,
+            tree.encoding)
+    else:
+        writer = FileWriter(config.get('link_mode', 'copy'), manifest,
+            formatter, skip_unchanged, tree.encoding)
+
+    # Optional subset of the chapters, like "3-7,30-"
+    selection = None
+    if chapters is not None:
+        selection = tree.select_chapters(chapters)
+        if not selection:
+            print(f'\n**No chapters match *{chapters}*')
+
     if verbose:
         print('\n**Processing')
-    tree.generate(output_dir, single_chapter)
+    chapter_paths = tree.generate(output_dir, single_chapter, jobs, writer,
+        selection)
 
-    # Optionally run isort on the output
-    if config.get('isort', False):
-        print('\n**Calling isort')
-        sys.argv = ['isrot', str(output_dir)]
-        try:
-            # import only if being used
-            from isort.main import main as isort_main
-            isort_main()
-        except SystemExit:
-            # black calls quit(), ignore it
-            pass
-
-    # Optionally run black on the output
-    if config.get('black', False):
-        print('\n**Calling black')
-        #sys.argv = ['black', str(output_dir), '-l', 80, '--diff']
-        sys.argv = ['black', str(output_dir), '-l', 80]
-        try:
-            import black    # import only if being used
-            black.main()
-        except SystemExit:
-            # black calls quit(), ignore it
-            pass
+    if manifest is not None:
+        chapter_dirs = None
+        if single_chapter is not None or selection is not None:
+            chapter_dirs = {path.name for path in chapter_paths}
+
+        deleted = manifest.finish(chapter_dirs)
+        if verbose:
+            print(f'\n**Removed {deleted} out of date files')
 
+    if delete_output and skip_unchanged:
+        deleted = writer.remove_others(output_dir)
+        if verbose:
+            print(f'\n**Removed {deleted} old files')
+
+    print(f'\n**Wrote {writer.written} files, {writer.unchanged} unchanged')
     return tree
 
+
 # ===========================================================================
 # File Display
 # ===========================================================================
@@ -323,7 +777,7 @@ def display_pound_files(files):
     for filename in files:
         path = Path(filename)
         node = PoundFileNode(path)
-        node.parse_file()
+        node.parse_file(fast_path=False)
         _print_node_contents(node)
 
 
@@ -331,5 +785,5 @@ def display_xml_files(files):
     for filename in files:
         path = Path(filename)
         node = XMLFileNode(path)
-        node.parse_file()
+        node.parse_file(fast_path=False)
         _print_node_contents(node)
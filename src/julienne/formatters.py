@@ -0,0 +1,221 @@
+# formatters.py
+#   Runs isort and black on generated Python files through their APIs
+import hashlib
+from pathlib import Path
+
+# ===========================================================================
+
+BLACK_LINE_LENGTH = 80
+
+# ===========================================================================
+
+def format_code(code, use_isort=False, use_black=False, isort_config=None,
+        black_mode=None):
+    """Returns `code` after passing it through isort and then black. Files
+    with an isort "skip_file" comment are left alone by isort, black still
+    formats them.
+
+    :param isort_config: optional `isort.Config`, defaults to isort's own
+        defaults
+    :param black_mode: optional `black.Mode`, defaults to black's defaults
+        with a line length of 80
+    :raises Exception: anything the formatters raise for code they can't
+        handle, like black's `InvalidInput` for syntax errors
+    """
+    # Formatters are only imported if used
+    if use_isort:
+        import isort
+        from isort.exceptions import FileSkipComment
+
+        if isort_config is None:
+            isort_config = isort.Config()
+
+        try:
+            code = isort.code(code, config=isort_config)
+        except FileSkipComment:
+            pass
+
+    if use_black:
+        import black
+        if black_mode is None:
+            black_mode = black.Mode(line_length=BLACK_LINE_LENGTH)
+
+        code = black.format_str(code, mode=black_mode)
+
+    return code
+
+
+def _isort_config(settings_path):
+    # Returns the isort.Config found from settings_path and the paths of the
+    # files it was read from
+    import isort
+    if settings_path is None:
+        return isort.Config(), []
+
+    # Discovery has to start from a directory that exists, the output may
+    # not have been created
+    path = Path(settings_path).resolve()
+    while not path.exists():
+        path = path.parent
+
+    config = isort.Config(settings_path=str(path))
+    sources = [source['source'] for source in config.sources
+        if source.get('source', 'defaults') != 'defaults']
+    return config, sources
+
+
+def _black_mode(settings_path):
+    # Returns the black.Mode for the project's pyproject.toml, found the same
+    # way the black command finds it, and the paths of the files it was read
+    # from. The line length is always 80, as it was on the command line
+    import black
+    options = {}
+    sources = []
+    if settings_path is not None:
+        root = black.find_project_root((str(settings_path), ))
+        if isinstance(root, tuple):
+            # Newer versions also say why it is the root
+            root = root[0]
+
+        path = root / 'pyproject.toml'
+        if path.is_file():
+            options = black.parse_pyproject_toml(str(path))
+            sources.append(str(path))
+
+    target_versions = {black.TargetVersion[version.upper()] for version in
+        options.get('target_version', [])}
+    mode = black.Mode(target_versions=target_versions,
+        line_length=BLACK_LINE_LENGTH,
+        string_normalization=not options.get('skip_string_normalization',
+            False),
+        magic_trailing_comma=not options.get('skip_magic_trailing_comma',
+            False),
+        preview=options.get('preview', False))
+    return mode, sources
+
+
+class Formatter:
+    """Formats Python files in memory before the :class:`FileWriter` writes
+    them, so each output is only written once. Results are remembered by a
+    hash of the code, identical copies of a file in different chapters are
+    only formatted once.
+
+    :param use_isort: if True, imports are sorted with isort
+    :param use_black: if True, code is formatted with black, this happens
+        after isort
+    :param cache: optional :class:`ParseCache`, formatted results are
+        stored in it keyed by the hash of the code, the formatter versions
+        and their options, so that later runs don't format them again
+    :param settings_path: optional directory the formatters' project
+        configuration is looked for from, the same way the isort and black
+        commands look for it from the files they are given. The black line
+        length is always 80.
+    """
+    def __init__(self, use_isort=False, use_black=False, cache=None,
+            settings_path=None):
+        self.use_isort = use_isort
+        self.use_black = use_black
+        self.cache = cache
+        self.settings_path = settings_path
+
+        # Maps the hash of code to its formatted version for this run, only
+        # code that was formatted, or skipped on purpose, is in it
+        self._memo = {}
+        self._kind = None
+
+        # Project configuration, loaded when first needed
+        self._settings = None
+
+    @property
+    def enabled(self):
+        return self.use_isort or self.use_black
+
+    def applies(self, dest):
+        """Returns True if the file `dest` gets formatted."""
+        return self.enabled and dest.suffix == '.py'
+
+    def _load_settings(self):
+        # Returns (isort config, black mode, config file paths)
+        if self._settings is None:
+            isort_config = black_mode = None
+            sources = []
+            if self.use_isort:
+                isort_config, found = _isort_config(self.settings_path)
+                sources.extend(found)
+
+            if self.use_black:
+                black_mode, found = _black_mode(self.settings_path)
+                sources.extend(found)
+
+            self._settings = (isort_config, black_mode, sources)
+
+        return self._settings
+
+    @property
+    def kind(self):
+        """Identifies the formatters, their versions and their options,
+        including the contents of any project configuration they use."""
+        if self._kind is None:
+            parts = ['format']
+            if self.use_isort:
+                import isort
+                parts.append(f'isort-{isort.__version__}')
+
+            if self.use_black:
+                import black
+                parts.append(f'black-{black.__version__}-'
+                    f'l{BLACK_LINE_LENGTH}')
+
+            sources = self._load_settings()[2]
+            if sources:
+                digest = hashlib.sha256()
+                for source in sorted(set(sources)):
+                    digest.update(Path(source).read_bytes())
+
+                parts.append(f'config-{digest.hexdigest()[:16]}')
+
+            self._kind = ':'.join(parts)
+
+        return self._kind
+
+    def format(self, code, dest=None):
+        """Returns the formatted version of `code`. Code the formatters
+        can't handle is reported and returned unchanged.
+
+        :param dest: name of the file the code is for, used in messages
+        """
+        data = code.encode()
+        digest = hashlib.sha256(data).digest()
+        result = self._memo.get(digest)
+        if result is not None:
+            return result
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(data, self.kind)
+            result = self.cache.get(key)
+
+        if result is None:
+            try:
+                isort_config, black_mode, _ = self._load_settings()
+                result = format_code(code, self.use_isort, self.use_black,
+                    isort_config, black_mode)
+            except Exception as e:
+                # Not a result, nothing is remembered so every file with
+                # the problem gets reported
+                print(f'error: cannot format {dest}: '
+                    f'{str(e) or e.__class__.__name__}')
+                return code
+
+            if key is not None:
+                self.cache.put(key, result)
+
+        self._memo[digest] = result
+        return result
+
+    def format_file(self, path, encoding='utf-8'):
+        """Formats the file at `path` in place."""
+        code = path.read_text(encoding=encoding)
+        result = self.format(code, path)
+        if result != code:
+            path.write_bytes(result.encode(encoding))
@@ -0,0 +1,241 @@
+# gitstream.py
+#   Output writer that turns the chapters into a git fast-import stream, one
+#   commit per chapter
+from contextlib import contextmanager
+import hashlib
+import time
+
+from julienne.writers import DEFAULT_ENCODING
+
+# ===========================================================================
+
+DEFAULT_BRANCH = 'main'
+
+COMMITTER = b'Julienne <julienne@localhost>'
+
+# git file modes
+NORMAL_MODE = '100644'
+EXECUTABLE_MODE = '100755'
+
+# ===========================================================================
+
+def _quote(path):
+    # fast-import takes paths as is unless they start with a quote or contain
+    # a newline, those need C style quoting
+    if not path.startswith('"') and '\n' not in path:
+        return path
+
+    escaped = path.replace('\\', '\\\\').replace('"', '\\"').replace('\n',
+        '\\n')
+    return f'"{escaped}"'
+
+
+def _mode(path):
+    if path.stat().st_mode & 0o111:
+        return EXECUTABLE_MODE
+
+    return NORMAL_MODE
+
+
+class GitWriter:
+    """Writes the chapters as a `git fast-import` stream, in place of the
+    :class:`FileWriter` that writes them into directories. Each chapter
+    becomes a commit on `branch`, tagged with the chapter directory's name.
+
+    Every distinct file content is sent once as a blob, later copies refer
+    back to it. Commits after the first only list the paths that differ
+    from the previous chapter, so the size of the stream follows the
+    changes between chapters rather than their number.
+
+    :param output_dir: `Path` the chapter directories would have been
+        created in, used to name the files in each commit
+    :param stream: binary file object the stream is written to
+    :param branch: name of the branch the commits are made on
+    :param formatter: optional :class:`Formatter`, Python files are passed
+        through it before they are added
+    :param encoding: encoding of the files added
+    """
+    def __init__(self, output_dir, stream, branch=DEFAULT_BRANCH,
+            formatter=None, encoding=DEFAULT_ENCODING):
+        self.output_dir = output_dir
+        self.stream = stream
+        self.branch = branch
+        self.formatter = formatter
+        self.encoding = encoding
+
+        # Commits have to be made in chapter order
+        self.single_stream = True
+
+        # Counts of files that differ from the previous chapter, and those
+        # that are the same
+        self.written = 0
+        self.unchanged = 0
+
+        self.when = int(time.time())
+
+        self._mark = 0
+        self._key_marks = {}
+        self._hash_marks = {}
+
+        # Chapters being written, each maps paths to their (mode, mark)
+        self._chapters = {}
+
+        # Files and commit mark of the last chapter committed
+        self._previous = None
+        self._last_commit = None
+
+    # --- Same interface as FileWriter
+    def mkdir(self, path):
+        # git doesn't track directories, but the chapter needs a commit even
+        # if it is empty
+        self._entry(path)
+
+    def is_current(self, src, dest):
+        return False
+
+    def write(self, dest, content, key=None):
+        mark = self._key_marks.get(key) if key is not None else None
+        if mark is None:
+            if self._formats(dest):
+                content = self.formatter.format(content, dest)
+
+            mark = self._blob(content.encode(self.encoding), key)
+
+        self._add(dest, NORMAL_MODE, mark)
+
+    def copy(self, src, dest):
+        self.copy_text(src, dest)
+
+    def copy_text(self, src, dest, add_newline=False):
+        key = ('text', src, add_newline)
+        mark = self._key_marks.get(key)
+        if mark is None:
+            data = src.read_bytes()
+            if add_newline:
+                data += b"\n"
+
+            if self._formats(dest):
+                code = data.decode(self.encoding)
+                data = self.formatter.format(code, dest).encode(self.encoding)
+
+            mark = self._blob(data, key)
+
+        self._add(dest, _mode(src), mark)
+
+    @contextmanager
+    def open_stream(self, dest):
+        """Context manager for adding `dest` a piece at a time, yields a
+        function that takes the strings to write. Blobs need their size up
+        front, so the pieces are collected first."""
+        pieces = []
+        yield pieces.append
+
+        content = ''.join(pieces)
+        if self._formats(dest):
+            content = self.formatter.format(content, dest)
+
+        self._add(dest, NORMAL_MODE, self._blob(content.encode(
+            self.encoding)))
+
+    def close_chapter(self, output_path):
+        """Commits the chapter directory `output_path`."""
+        files = self._chapters.pop(output_path.name, {})
+        self._commit(output_path.name, files)
+
+    def close(self):
+        """Commits any chapters still open, in the order they were started,
+        this is the case when files are written to all the chapters at
+        once."""
+        for name, files in self._chapters.items():
+            self._commit(name, files)
+
+        self._chapters = {}
+        self.stream.flush()
+
+    # --- Results from worker processes, chapters are never split up
+    def take_results(self):
+        return None
+
+    def merge_results(self, results):
+        pass
+
+    # --- Stream building
+    def _formats(self, dest):
+        return self.formatter is not None and self.formatter.applies(dest)
+
+    def _entry(self, path):
+        # Returns the chapter's file map and the path within the chapter
+        rel = path.relative_to(self.output_dir)
+        files = self._chapters.setdefault(rel.parts[0], {})
+        return files, '/'.join(rel.parts[1:])
+
+    def _add(self, dest, mode, mark):
+        files, path = self._entry(dest)
+        files[path] = (mode, mark)
+
+    def _next_mark(self):
+        self._mark += 1
+        return self._mark
+
+    def _blob(self, data, key=None):
+        # Sends the content unless the same bytes have been sent before,
+        # returns the mark that refers to it
+        digest = hashlib.sha1(data).digest()
+        mark = self._hash_marks.get(digest)
+        if mark is None:
+            mark = self._next_mark()
+            self._hash_marks[digest] = mark
+            self.stream.write(b'blob\nmark :%d\ndata %d\n' % (mark,
+                len(data)))
+            self.stream.write(data)
+            self.stream.write(b'\n')
+
+        if key is not None:
+            self._key_marks[key] = mark
+
+        return mark
+
+    def _commit(self, name, files):
+        mark = self._next_mark()
+        message = name.encode()
+
+        lines = [
+            f'commit refs/heads/{self.branch}'.encode(),
+            b'mark :%d' % mark,
+            b'committer %s %d +0000' % (COMMITTER, self.when),
+            b'data %d' % len(message),
+            message,
+        ]
+
+        if self._previous is None:
+            # Start from an empty tree, the branch may already have content
+            # from an earlier import
+            previous = {}
+            lines.append(b'deleteall')
+        else:
+            previous = self._previous
+            lines.append(b'from :%d' % self._last_commit)
+
+        for path, entry in sorted(files.items()):
+            if previous.get(path) == entry:
+                self.unchanged += 1
+                continue
+
+            self.written += 1
+            mode, blob = entry
+            lines.append(f'M {mode} :{blob} {_quote(path)}'.encode())
+
+        for path in sorted(previous.keys() - files.keys()):
+            lines.append(f'D {_quote(path)}'.encode())
+
+        # Lightweight tag for the chapter
+        lines.extend([
+            b'',
+            f'reset refs/tags/{name}'.encode(),
+            b'from :%d' % mark,
+            b'',
+        ])
+
+        self.stream.write(b'\n'.join(lines) + b'\n')
+        self._previous = files
+        self._last_commit = mark
@@ -0,0 +1,217 @@
+# manifest.py
+#   Build manifest, records what was generated so that later runs only need
+#   to rewrite what changed
+import hashlib
+import json
+import os
+
+# ===========================================================================
+
+MANIFEST_NAME = '.julienne_manifest.json'
+MANIFEST_VERSION = 1
+
+# ===========================================================================
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+# ===========================================================================
+
+class Manifest:
+    """Tracks the source files and generated outputs of a run, stored as
+    JSON in the output directory. Sources are recorded with their
+    modification time, size and content hash, outputs with the hash of what
+    was written. On the next run, outputs whose source is unchanged can be
+    skipped without being rendered, and rendered outputs that are the same as
+    last time aren't rewritten.
+
+    :param output_dir: `Path` of the directory the chapters are written to
+    :param config_hash: hash of the configuration, if it doesn't match the
+        one from the previous run nothing recorded is trusted
+    """
+    def __init__(self, output_dir, config_hash):
+        self.output_dir = output_dir
+        self.path = output_dir / MANIFEST_NAME
+        self.config_hash = config_hash
+
+        # Results from the previous run
+        self.old_sources = {}
+        self.old_outputs = {}
+
+        # Results from this run
+        self.sources = {}
+        self.outputs = {}
+        self.dirs = set()
+
+        # Source path -> (whether it changed since the last run, its entry),
+        # kept when the results are taken so workers only hash files once
+        self._changed = {}
+
+        self.load()
+
+    def load(self):
+        try:
+            data = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            return
+
+        if data.get('version') != MANIFEST_VERSION:
+            return
+
+        # Outputs are always remembered so they can be cleaned up, but if the
+        # configuration changed none of the sources can be trusted
+        self.old_outputs = data['outputs']
+        if data['config'] == self.config_hash:
+            self.old_sources = data['sources']
+        else:
+            self.old_outputs = {key: None for key in self.old_outputs}
+
+    def save(self):
+        data = {
+            'version': MANIFEST_VERSION,
+            'config': self.config_hash,
+            'sources': self.sources,
+            'outputs': self.outputs,
+        }
+
+        temp = self.path.with_name(self.path.name + '.tmp')
+        temp.write_text(json.dumps(data, sort_keys=True))
+        os.replace(temp, self.path)
+
+    # --- Checks used while generating
+    def _key(self, dest):
+        return dest.relative_to(self.output_dir).as_posix()
+
+    def source_hash(self, src):
+        """Returns the content hash of a source file, only reading it if its
+        size or modification time are different from the last run."""
+        self.source_changed(src)
+        return self._changed[str(src)][1][2]
+
+    def source_changed(self, src):
+        """Returns True if the source file is new or its content changed
+        since the last run."""
+        key = str(src)
+        if key in self._changed:
+            changed, entry = self._changed[key]
+            self.sources[key] = entry
+            return changed
+
+        stat = src.stat()
+        old = self.old_sources.get(key)
+        if old and old[0] == stat.st_mtime_ns and old[1] == stat.st_size:
+            entry = old
+            changed = False
+        else:
+            digest = hash_bytes(src.read_bytes())
+            entry = [stat.st_mtime_ns, stat.st_size, digest]
+            changed = old is None or old[2] != digest
+
+        self.sources[key] = entry
+        self._changed[key] = (changed, entry)
+        return changed
+
+    def is_current(self, src, dest):
+        """Returns True if `dest` was generated from `src` last time, `src`
+        hasn't changed since, and `dest` still exists."""
+        if self.source_changed(src):
+            return False
+
+        key = self._key(dest)
+        digest = self.old_outputs.get(key)
+        if digest is None or not dest.exists():
+            return False
+
+        self.outputs[key] = digest
+        return True
+
+    def add_dir(self, path):
+        self.dirs.add(self._key(path))
+
+    def output_unchanged(self, dest, digest):
+        """Records `digest` as the content hash for `dest`, returning True
+        if the same content was written there last time and still exists."""
+        key = self._key(dest)
+        self.outputs[key] = digest
+        return self.old_outputs.get(key) == digest and dest.exists()
+
+    # --- Combining results
+    def take_results(self):
+        """Returns and resets the results recorded so far, used to pass
+        results from a worker process back to the main one."""
+        results = (self.sources, self.outputs, self.dirs)
+        self.sources = {}
+        self.outputs = {}
+        self.dirs = set()
+        return results
+
+    def merge_results(self, results):
+        sources, outputs, dirs = results
+        self.sources.update(sources)
+        self.outputs.update(outputs)
+        self.dirs.update(dirs)
+
+    def update(self, removed=()):
+        """Saves the manifest with the results recorded so far replacing the
+        previous run's entries for the same files, everything else is kept
+        as is. Used when only some of the sources were written again.
+
+        :param removed: `Path` objects of outputs that were deleted
+        """
+        sources = dict(self.old_sources)
+        sources.update(self.sources)
+        outputs = dict(self.old_outputs)
+        outputs.update(self.outputs)
+        for dest in removed:
+            outputs.pop(self._key(dest), None)
+
+        self.sources = sources
+        self.outputs = outputs
+        self.save()
+
+    def finish(self, chapter_dirs=None):
+        """Removes outputs from the previous run that weren't generated this
+        time and saves the manifest.
+
+        :param chapter_dirs: if given, only outputs within these chapter
+            directory names were generated this run, anything recorded for
+            other chapters is kept as is.
+        :returns: number of stale files deleted
+        """
+        deleted = 0
+        for key, digest in self.old_outputs.items():
+            if key in self.outputs:
+                continue
+
+            chapter = key.split('/', 1)[0]
+            if chapter_dirs is not None and chapter not in chapter_dirs:
+                # Not part of this run, carry it forward
+                if digest is not None:
+                    self.outputs[key] = digest
+
+                continue
+
+            path = self.output_dir / key
+            path.unlink(missing_ok=True)
+            deleted += 1
+
+            # Remove any directories left empty that weren't part of this run
+            parent = path.parent
+            while parent != self.output_dir:
+                if self._key(parent) in self.dirs:
+                    break
+
+                try:
+                    parent.rmdir()
+                except OSError:
+                    break
+
+                parent = parent.parent
+
+        # Carry forward sources that weren't looked at in a partial run
+        if chapter_dirs is not None:
+            for key, entry in self.old_sources.items():
+                self.sources.setdefault(key, entry)
+
+        self.save()
+        return deleted
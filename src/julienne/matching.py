@@ -0,0 +1,155 @@
+# matching.py
+#   Glob style pattern matching of relative paths, used to classify files
+#   while walking the source tree instead of globbing it repeatedly
+import os
+import re
+
+# ===========================================================================
+
+def _translate_part(part):
+    # Translates a single path component of a glob into a regex, wildcards
+    # never match across a "/"
+    result = ''
+    index = 0
+    while index < len(part):
+        char = part[index]
+        index += 1
+
+        if char == '*':
+            result += '[^/]*'
+        elif char == '?':
+            result += '[^/]'
+        elif char == '[':
+            end = index
+            if end < len(part) and part[end] == '!':
+                end += 1
+            if end < len(part) and part[end] == ']':
+                end += 1
+            end = part.find(']', end)
+
+            if end == -1:
+                # No closing bracket, treat it as a literal
+                result += re.escape(char)
+                continue
+
+            chars = part[index:end].replace('\\', '\\\\')
+            index = end + 1
+            if chars[0] == '!':
+                chars = '^' + chars[1:]
+            elif chars[0] == '^':
+                chars = '\\' + chars
+
+            result += f'[{chars}]'
+        else:
+            result += re.escape(char)
+
+    return result
+
+
+def glob_to_regex(pattern):
+    """Returns a regex string that matches the same relative file paths as
+    `Path.glob(pattern)` would. Paths are expected to use "/" as the
+    separator."""
+    parts = [part for part in pattern.split('/') if part not in ('', '.')]
+
+    result = ''
+    for index, part in enumerate(parts):
+        last = index == len(parts) - 1
+        if part == '**':
+            # Zero or more directories
+            result += '(?:[^/]+/)*'
+        else:
+            result += _translate_part(part)
+            if not last:
+                result += '/'
+
+    return result
+
+
+def compile_globs(patterns):
+    """Compiles a list of glob patterns into a single regex. Use its
+    `fullmatch` method against relative "/" separated paths. Returns None
+    if there are no patterns."""
+    if not patterns:
+        return None
+
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    combined = '|'.join(f'(?:{glob_to_regex(pattern)})' for pattern in
+        patterns)
+    return re.compile(combined, flags)
+
+# ===========================================================================
+# Ignore Files
+# ===========================================================================
+
+class IgnoreRules:
+    """Rules from a gitignore style file. Supports comments, "!" negation,
+    trailing "/" for directory only rules, leading or middle "/" anchoring
+    the rule to the file's directory, and "*", "?", "[]" and "**" wildcards.
+
+    :param root: string path of the directory the rules are relative to
+    :param lines: iterable of the lines in the ignore file
+    """
+    def __init__(self, root, lines):
+        self.root = root.rstrip(os.sep) + os.sep
+        self.rules = []
+
+        flags = re.IGNORECASE if os.name == 'nt' else 0
+        for line in lines:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            elif line.startswith('\\'):
+                # Escaped leading "#" or "!"
+                line = line[1:]
+
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+
+            # A slash anywhere but the end anchors the pattern, otherwise it
+            # matches at any depth
+            anchored = '/' in line
+            line = line.lstrip('/')
+
+            if line.endswith('/**'):
+                # Everything inside the directory
+                regex = glob_to_regex(line[:-3]) + '/.+'
+            else:
+                regex = glob_to_regex(line)
+
+            if not anchored:
+                regex = '(?:[^/]+/)*' + regex
+
+            self.rules.append((re.compile(regex, flags), negate, dir_only))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(str(path.parent), f)
+
+    def ignored(self, path, is_dir):
+        """Returns True if the string `path` is excluded by the rules. Paths
+        outside of the rules' root are never ignored. The last matching rule
+        wins, same as git."""
+        if not path.startswith(self.root):
+            return False
+
+        rel = path[len(self.root):]
+        if os.sep != '/':
+            rel = rel.replace(os.sep, '/')
+
+        result = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+
+            if regex.fullmatch(rel):
+                result = not negate
+
+        return result
@@ -1,7 +1,9 @@
-import shutil
+from contextlib import ExitStack
+import io
 
-from julienne.parsers import (parse_pound_content, parse_xml_content, 
-    range_token, chapter_in_range)
+from julienne.parsers import (parse_content, range_token, chapter_in_range,
+    iter_lines, emit_lines, POUND_STYLE, XML_STYLE)
+from julienne.writers import DEFAULT_ENCODING
 
 # ===========================================================================
 # Base
@@ -31,10 +33,10 @@ class DirNode(_BaseNode):
     def should_traverse(self, chapter):
         return True
 
-    def copy(self, chapter, base_path, output_path):
+    def copy(self, chapter, base_path, output_path, writer):
         rel = self.path.relative_to(base_path)
         new_dir = output_path / rel
-        new_dir.mkdir(parents=True, exist_ok=True)
+        writer.mkdir(new_dir)
 
 
 class ConditionalDirNode(DirNode):
@@ -50,12 +52,12 @@ class ConditionalDirNode(DirNode):
     def should_traverse(self, chapter):
         return chapter_in_range(chapter, True, self.lower, self.upper)
 
-    def copy(self, chapter, base_path, output_path):
+    def copy(self, chapter, base_path, output_path, writer):
         rel = self.path.relative_to(base_path)
         new_dir = output_path / rel
 
         if chapter_in_range(chapter, True, self.lower, self.upper):
-            new_dir.mkdir(parents=True, exist_ok=True)
+            writer.mkdir(new_dir)
 
 # ===========================================================================
 # Copy Only Nodes
@@ -67,11 +69,14 @@ class CopyOnlyFileNode(_BaseNode):
         print('CopyOnlyFileNode')
         print(f'   {self.path}')
 
-    def copy(self, chapter, base_path, output_path):
+    def in_chapter(self, chapter):
+        return True
+
+    def copy(self, chapter, base_path, output_path, writer):
         rel = self.path.relative_to(base_path)
         dest = output_path / rel
 
-        shutil.copy2(self.path, dest)
+        writer.copy(self.path, dest)
 
 
 class ConditionalCopyOnlyFileNode(_BaseNode):
@@ -87,26 +92,173 @@ class ConditionalCopyOnlyFileNode(_BaseNode):
     def should_traverse(self, chapter):
         return chapter_in_range(chapter, True, self.lower, self.upper)
 
-    def copy(self, chapter, base_path, output_path):
+    def in_chapter(self, chapter):
+        return self.should_traverse(chapter)
+
+    def copy(self, chapter, base_path, output_path, writer):
         rel = self.path.relative_to(base_path)
         dest = output_path / rel
 
         if chapter_in_range(chapter, True, self.lower, self.upper):
-            shutil.copy2(self.path, dest)
+            writer.copy(self.path, dest)
 
 # ===========================================================================
 # Parsing Node Base Classes
 # ===========================================================================
 
 class _BaseFileNode(_BaseNode):
-    def __init__(self, path):
+    def __init__(self, path, style):
         self.path = path
-        self._parser_fn = None
+        self.style = style
+        self.parser = None
+        self._parser_fn = parse_content
+        self._stream_fn = iter_lines
+
+        # Set for files with no markers, they are copied instead of parsed
+        self.verbatim = False
+        self._add_newline = False
+
+        # Set for files too big to keep in memory, they are parsed again
+        # line by line each time they are written
+        self.streamed = False
+
+        # Used by load(), files bigger than stream_size bytes are streamed
+        self.cache = None
+        self.stream_size = None
+
+        # Encoding the file is read with, also sets `_markers`
+        self.encoding = DEFAULT_ENCODING
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, encoding):
+        self._encoding = encoding
+
+        # Byte strings whose presence means the file needs parsing. Looking
+        # at the raw bytes only works when the markers, "\r" and "\n" are
+        # the same bytes as in ASCII, for other encodings (UTF-16, UTF-32)
+        # it is None and every file gets parsed
+        self._markers = None
+        tokens = self.style.tokens + ('\r', '\n')
+        try:
+            if all(token.encode(encoding) == token.encode('ascii')
+                    for token in tokens):
+                self._markers = tuple(token.encode('ascii') for token in
+                    self.style.tokens)
+        except UnicodeError:
+            pass
+
+    @property
+    def loaded(self):
+        """True if the node is ready to be copied without parsing."""
+        return self.parser is not None or self.verbatim or self.streamed
+
+    def load(self):
+        """Prepares the file for copying using the node's `cache` and
+        `stream_size` settings. It is either parsed or, if it is too big,
+        scanned so it can be streamed."""
+        if self.stream_size is not None and \
+                self.path.stat().st_size > self.stream_size:
+            self.scan_file()
+        else:
+            self.parse_file(self.cache)
+
+    def ensure_loaded(self):
+        """Calls :meth:`load` if the file isn't loaded yet, used when files
+        are loaded as they are needed rather than when the tree is built.
+        Errors name the file, the same as when the tree is built."""
+        if not self.loaded:
+            self._load_reporting()
+
+    def _load_reporting(self):
+        try:
+            self.load()
+        except Exception as e:
+            raise e.__class__(f"Error parsing {self.path}. " + str(e))
+
+    def parse_file(self, cache=None, fast_path=True):
+        """Parses the node's file.
+
+        :param cache: optional :class:`ParseCache`, if the file's content is
+            found in it the parser isn't run at all
+        :param fast_path: if True, files without any markers aren't parsed,
+            they are marked as `verbatim` and get copied as is
+        """
+        data = self.path.read_bytes()
+        if fast_path and self._is_verbatim(data):
+            # Same results as parsing, minus all the work
+            self.verbatim = True
+            self._add_newline = not data.endswith(b'\n')
+            self.parser = None
+            self.bottom = self.top = self.biggest = None
+            self.all_conditional = False
+            return
+
+        key = None
+        if cache is not None:
+            key = cache.key(data, f'{self.style.key}:{self.encoding}')
+            cached = cache.get(key)
+            if cached is not None:
+                (self.bottom, self.top, self.biggest, self.all_conditional,
+                    self.parser) = cached
+                return
 
-    def parse_file(self):
         ### Done as a separate step to make testing easier, allows for
         # testing the ._parse_content() method without having an actual file
-        self._parse_content(self.path.read_text())
+        #
+        # Decode the same way read_text() does
+        self._parse_content(io.TextIOWrapper(io.BytesIO(data),
+            encoding=self.encoding).read())
+
+        if cache is not None:
+            cache.put(key, (self.bottom, self.top, self.biggest,
+                self.all_conditional, self.parser))
+
+    def _is_verbatim(self, data):
+        # Parsing a file without markers gives back the same content with a
+        # trailing newline guaranteed. Reading as text translates "\r\n" to
+        # "\n" though, so only files without a "\r" can be copied directly
+        if self._markers is None or b'\r' in data:
+            return False
+
+        for marker in self._markers:
+            if marker in data:
+                return False
+
+        return True
+
+    def reset(self):
+        """Forgets everything loaded from the file, used when it has changed
+        on disk. Call :meth:`load` before using the node again."""
+        self.parser = None
+        self.verbatim = False
+        self._add_newline = False
+        self.streamed = False
+
+        for name in ('bottom', 'top', 'biggest', 'all_conditional'):
+            self.__dict__.pop(name, None)
+
+    def scan_file(self):
+        """Reads the file with a streaming parser to get its range summary,
+        without keeping any of its content. The node is marked as `streamed`
+        and is parsed again as it is written."""
+        with open(self.path, encoding=self.encoding) as f:
+            stream = self._stream_fn(f, self.style)
+            for _ in stream:
+                pass
+
+        self.parser = None
+        self.streamed = True
+        self.bottom, self.top, self.biggest = stream.get_range()
+        self.all_conditional = stream.all_conditional
+
+    def release(self):
+        """Drops the parsed lines, keeping only the range summary. Call
+        :meth:`parse_file` again before copying."""
+        self.parser = None
 
     def _parse_content(self, content):
         """Sets the list of parsed Line objects, one for each line in the 
@@ -114,7 +266,7 @@ class _BaseFileNode(_BaseNode):
 
         :param content: string to parse
         """
-        self.parser = self._parser_fn(content)
+        self.parser = self._parser_fn(content, self.style)
 
         self.bottom, self.top, self.biggest = self.parser.get_range()
         self.all_conditional = self.parser.all_conditional
@@ -127,32 +279,130 @@ class _BaseFileNode(_BaseNode):
         print(f'{self.__class__.__name__}', bottom, top, all_cond)
         print(f'   {self.path}')
 
-    def copy(self, chapter, base_path, output_path):
-        rel = self.path.relative_to(base_path)
+    def in_range(self, chapter):
+        # True if the node's own range, if it has one, includes the chapter,
+        # doesn't need the file to be loaded
+        return True
 
+    def should_write(self, chapter):
         # If the file is all conditional, only write it in the chapter range,
         # If the file is not all conditional, some parts will appear in every
         # chapter, so write it
-        if not self.all_conditional or (self.all_conditional and \
-                chapter_in_range(chapter, True, self.bottom, self.top)):
+        return not self.all_conditional or (self.all_conditional and \
+            chapter_in_range(chapter, True, self.bottom, self.top))
+
+    def in_chapter(self, chapter):
+        """True if the file is written in the chapter, not counting its
+        directories. Loads the file if its range summary isn't known."""
+        if not self.in_range(chapter):
+            return False
+
+        if not hasattr(self, 'all_conditional'):
+            self._load_reporting()
+
+        return self.should_write(chapter)
+
+    def render(self, chapter):
+        """Returns the file's content for the chapter as a string, the same
+        as :meth:`copy` writes before any formatting. Files that aren't
+        loaded are loaded first, streamed files are parsed again."""
+        self.ensure_loaded()
+
+        if self.verbatim:
+            text = self.path.read_text(encoding=self.encoding)
+            if self._add_newline:
+                text += "\n"
+
+            return text
+
+        if self.streamed:
+            parts = []
+            with open(self.path, encoding=self.encoding) as f:
+                emit_lines(self._stream_fn(f, self.style),
+                    {chapter: parts.append})
+
+            return ''.join(parts)
+
+        return self.parser.render(chapter)
+
+    def copy(self, chapter, base_path, output_path, writer):
+        self.copy_chapters([(chapter, output_path)], base_path, writer)
+
+    def copy_chapters(self, chapters, base_path, writer):
+        """Writes the file into each of the `(chapter, output_path)` pairs in
+        `chapters`. Streamed files are read once for all of them. Files that
+        haven't been loaded yet are loaded first."""
+        if not self.loaded:
+            if not any(self.in_range(chapter) for chapter, _ in chapters):
+                # Not part of any of these chapters, no need to read it
+                return
+
+            self.ensure_loaded()
+
+        rel = self.path.relative_to(base_path)
+
+        targets = []
+        for chapter, output_path in chapters:
+            if not self.should_write(chapter):
+                continue
+
             # Write file if within chapter range
             dest = output_path / rel
-            with open(dest, "w") as f:
-                for line in self.parser.lines:
-                    content = line.get_content(chapter)
-                    if content is not None:
-                        f.write(content + "\n")
+            if writer.is_current(self.path, dest):
+                continue
+
+            if self.streamed:
+                targets.append((chapter, dest))
+            elif self.verbatim:
+                writer.copy_text(self.path, dest, self._add_newline)
+            else:
+                # Every chapter in the same interval has the same content, key
+                # on it so the writer can link identical copies
+                index = self.parser.interval(chapter)
+                writer.write(dest, self.parser.renders[index],
+                    (self.path, index))
+
+        if targets:
+            self._copy_streamed(targets, writer)
+
+    def _copy_streamed(self, targets, writer):
+        with ExitStack() as stack, open(self.path,
+                encoding=self.encoding) as f:
+            outputs = {chapter: stack.enter_context(writer.open_stream(dest))
+                for chapter, dest in targets}
+            emit_lines(self._stream_fn(f, self.style), outputs)
 
 class ConditionalFileNodeMixin:
     def info(self):
         print(f'{self.__class__.__name__} {self.lower} - {self.upper}')
         print(f'   {self.path}')
 
-    def copy(self, chapter, base_path, output_path):
-        if not chapter_in_range(chapter, True, self.lower, self.upper):
-            return
+    def in_range(self, chapter):
+        return chapter_in_range(chapter, True, self.lower, self.upper)
+
+    def should_write(self, chapter):
+        if not self.in_range(chapter):
+            return False
+
+        return super().should_write(chapter)
+
+# ===========================================================================
+# Comment Style Nodes
+# ===========================================================================
+
+class StyledFileNode(_BaseFileNode):
+    """Node for files using any :class:`CommentStyle`. These are parsed and
+    processed for every chapter."""
+    def __init__(self, path, style):
+        super().__init__(path, style)
 
-        super().copy(chapter, base_path, output_path)
+
+class ConditionalStyledFileNode(ConditionalFileNodeMixin, StyledFileNode):
+    """Node for files using any :class:`CommentStyle`. These are parsed and
+    processed conditionally."""
+    def __init__(self, path, style, token):
+        super().__init__(path, style)
+        self.lower, self.upper = range_token(token)
 
 # ===========================================================================
 # Python File Nodes
@@ -162,8 +412,7 @@ class PoundFileNode(_BaseFileNode):
     """Node for Python style files, those with comments that are a #. These
     are parsed and processed for every chapter."""
     def __init__(self, path):
-        super().__init__(path)
-        self._parser_fn = parse_pound_content
+        super().__init__(path, POUND_STYLE)
 
 
 class ConditionalPoundFileNode(ConditionalFileNodeMixin, PoundFileNode):
@@ -181,8 +430,7 @@ class XMLFileNode(_BaseFileNode):
     """Node for XML style files, those with comments that are a <!-- -->.
     These are parsed and processed for every chapter."""
     def __init__(self, path):
-        super().__init__(path)
-        self._parser_fn = parse_xml_content
+        super().__init__(path, XML_STYLE)
 
 
 class ConditionalXMLFileNode(ConditionalFileNodeMixin, XMLFileNode):
@@ -191,3 +439,25 @@ class ConditionalXMLFileNode(ConditionalFileNodeMixin, XMLFileNode):
     def __init__(self, path, token):
         super().__init__(path)
         self.lower, self.upper = range_token(token)
+
+# ===========================================================================
+
+def make_file_node(path, style, token=None):
+    """Returns a node for the file at `path` that gets parsed using
+    `style`, conditional if a range `token` is given."""
+    if style is POUND_STYLE:
+        if token is None:
+            return PoundFileNode(path)
+
+        return ConditionalPoundFileNode(path, token)
+
+    if style is XML_STYLE:
+        if token is None:
+            return XMLFileNode(path)
+
+        return ConditionalXMLFileNode(path, token)
+
+    if token is None:
+        return StyledFileNode(path, style)
+
+    return ConditionalStyledFileNode(path, style, token)
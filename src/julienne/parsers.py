@@ -1,7 +1,12 @@
 # parser.py
 #   Contains the line parser for conditional content
+from array import array
+from bisect import bisect_right
 from collections import namedtuple
+from collections.abc import Sequence
 from enum import Enum
+import io
+import re
 
 # ===========================================================================
 
@@ -9,23 +14,143 @@ ParseMode = Enum('ParseMode', ['NORMAL', 'BLOCK_COMMENT', 'BLOCK_OPEN'])
 
 Marker = namedtuple('Marker', ["jtype", "lower", "upper", "comment"])
 
+# Increase whenever parse results change, invalidates the parse cache
+PARSER_VERSION = 5
+
+# Stored in place of None for a line's lower and upper bounds
+NO_BOUND = -1
+
 ALL_JTYPES = ('@', '=', '+', '-', '[', ']', '*')
 RANGED_JTYPES = ('@', '=', '+', '[')
 
+# Memo tables for tokens, the same few markers and ranges are repeated
+# throughout a source tree. Tables stop growing once they hit MEMO_SIZE
+MEMO_SIZE = 10000
+_range_tokens = {}
+_markers = {}
+
+# Content with a marker token for every DENSE_LINES lines or fewer is parsed
+# a line at a time, with markers that close together the scanner is slower
+DENSE_LINES = 3
+
+# ===========================================================================
+# Comment Styles
+# ===========================================================================
+
+class CommentStyle:
+    """Describes how comments are written in a kind of file. Styles with only
+    an `opener` are line comments, they use the same markers as Python files
+    with the "#" replaced: "#@=" becomes "//@=" for an opener of "//".
+    Styles with a `closer` wrap their comments and use the XML markers: for
+    "/*" and "*/" the "<!--@=" marker becomes "/*@=" and "@+-->" becomes
+    "@+*/".
+
+    :param name: name of the style, used in the TOML configuration
+    :param opener: string that starts a comment
+    :param closer: string that ends a comment, None for line comments
+    """
+    def __init__(self, name, opener, closer=None):
+        if not opener:
+            raise ValueError(f"Comment style *{name}* must have an opener")
+
+        self.name = name
+        self.opener = opener
+        self.closer = closer or None
+        self.marker = opener + '@'
+
+        if self.closer is None:
+            self.block_closer = None
+            self.tokens = (self.marker, )
+        else:
+            self.block_closer = '@+' + self.closer
+            self.tokens = (self.marker, self.block_closer)
+
+        # Finds the text that makes a line need more than a plain copy, each
+        # match runs to the end of its line so a line is only found once
+        self.scanner = re.compile('(?:' +
+            '|'.join(re.escape(token) for token in self.tokens) + ').*')
+
+        # Identifies the style's parse results in the parse cache
+        self.key = f"{name}:{opener}:{self.closer}"
+
+    def __repr__(self):
+        return f"CommentStyle({self.name!r}, {self.opener!r}, {self.closer!r})"
+
+    def comment(self, text):
+        """Returns `text` as a comment in this style."""
+        if self.closer is None:
+            return f"{self.opener} {text}"
+
+        return f"{self.opener} {text} {self.closer}"
+
+    @property
+    def line_fn(self):
+        # Parses a single line, adding it to a Parser
+        if self.closer is None:
+            return _parse_line_comment
+
+        return _parse_wrapped_comment
+
+    @property
+    def run_fn(self):
+        # Adds a run of lines without any markers to a Parser
+        if self.closer is None:
+            return _add_line_comment_run
+
+        return _add_wrapped_run
+
+
+# Registry of known styles, by name
+COMMENT_STYLES = {}
+
+def register_style(style):
+    """Adds a :class:`CommentStyle` to the registry, making it available
+    by name in the TOML configuration. Returns the style."""
+    COMMENT_STYLES[style.name] = style
+    return style
+
+
+POUND_STYLE = register_style(CommentStyle('pound', '#'))
+XML_STYLE = register_style(CommentStyle('xml', '<!--', '-->'))
+register_style(CommentStyle('js', '//'))
+register_style(CommentStyle('css', '/*', '*/'))
+register_style(CommentStyle('sql', '--'))
+register_style(CommentStyle('jinja', '{#', '#}'))
+
 # ===========================================================================
 
 class Parser:
-    CONTENT_TYPES = Enum('ParserContentTypes', ['POUND', 'XML'])
 
     class Context:
         def __init__(self, mode, marker):
             self.mode = mode
             self.marker = marker
 
-    def __init__(self, content_type):
-        self.lines = []
+    def __init__(self, style):
         self.all_conditional = True
-        self.content_type = content_type
+        self.style = style
+
+        # Lines are stored compactly: their content, each followed by a
+        # newline, in a single string with the start offset of every line,
+        # and the range info in parallel arrays. Content is collected in
+        # _chunks while parsing and joined by finish()
+        self._chunks = []
+        self._size = 0
+        self._buffer = None
+        self._starts = array('q')
+        self._conditionals = array('b')
+        self._lowers = array('i')
+        self._uppers = array('i')
+
+        # Range summary, maintained as lines are added
+        self._bottom = None
+        self._top = None
+        self._biggest = None
+
+        # Set by compile()
+        self.breakpoints = None
+        self.renders = None
+        self._conditional_index = None
 
         context = Parser.Context(ParseMode.NORMAL, None)
         self.stack = [context, ]
@@ -48,55 +173,227 @@ class Parser:
 
     # --- Line management
     def add_line(self, text, conditional, lower, upper):
-        line = Line(text, conditional, lower, upper)
-        self.lines.append(line)
+        self._chunks.append(text)
+        self._starts.append(self._size)
+        self._size += len(text) + 1
+
+        self._conditionals.append(conditional)
+        self._lowers.append(NO_BOUND if lower is None else lower)
+        self._uppers.append(NO_BOUND if upper is None else upper)
+        self._update_range(lower, upper)
+
+    def add_lines(self, texts, conditional, lower, upper):
+        """Adds a run of lines that all have the same range info."""
+        count = len(texts)
+        size = self._size
+        starts = self._starts
+        for text in texts:
+            starts.append(size)
+            size += len(text) + 1
+
+        self._size = size
+        self._chunks.extend(texts)
+
+        self._conditionals.extend(array('b', [conditional]) * count)
+        self._lowers.extend(array('i',
+            [NO_BOUND if lower is None else lower]) * count)
+        self._uppers.extend(array('i',
+            [NO_BOUND if upper is None else upper]) * count)
+
+        # Same summary as adding the lines one at a time, a second update
+        # with the same bounds can still change "biggest", more can't
+        for _ in range(min(count, 2)):
+            self._update_range(lower, upper)
+
+    def finish(self):
+        """Joins the content collected while parsing into a single buffer,
+        called once all the lines have been added."""
+        if self._buffer is None:
+            self._buffer = "\n".join(self._chunks)
+            if self._chunks:
+                self._buffer += "\n"
+
+            self._chunks = None
+
+    def content(self, index):
+        """Returns the text of the line at `index`."""
+        self.finish()
+        start = self._starts[index]
+        if index + 1 < len(self._starts):
+            return self._buffer[start:self._starts[index + 1] - 1]
+
+        return self._buffer[start:-1]
+
+    @property
+    def lines(self):
+        """Read-only sequence of :class:`Line` objects for the parsed
+        content."""
+        return LineView(self)
 
     def add_if_commented(self, text, index, marker):
         line_text = ''
         if marker.comment:
             # Marker line has a comment, preserve leading spaces and insert
-            if self.content_type == self.CONTENT_TYPES.POUND:
-                line_text = text[0:index] + f"# {marker.comment}"
-            else:
-                line_text = text[0:index] + f"<!-- {marker.comment} -->"
+            line_text = text[0:index] + self.style.comment(marker.comment)
 
         if line_text:
             self.add_line(line_text, True, marker.lower, marker.upper)
 
+    def _update_range(self, lower, upper):
+        # Bottom is the largest lower bound, top the largest upper bound, and
+        # biggest the largest chapter number mentioned
+        if self._bottom is None:
+            self._bottom = lower
+        if lower is not None and self._bottom < lower:
+            self._bottom = lower
+
+        if self._top is None:
+            self._top = upper
+        if upper is not None and upper > self._top:
+            self._top = upper
+
+        if self._biggest is None:
+            if lower is not None:
+                self._biggest = lower
+
+            if upper is not None:
+                self._biggest = upper
+        else:
+            if lower is not None and lower > self._biggest:
+                self._biggest = lower
+            elif upper is not None and upper > self._biggest:
+                self._biggest = upper
+
     def get_range(self):
         """Returns range information about parsed file as a tuple (bottom,
         top, biggest). Where bottom is the lowest chapter the file uses, top
         is the highest chapter and None indicates limitless, and biggest is the
         largest chapter number mentioned.
         """
-        bottom = None
-        top = None
-        biggest = None
-
-        for line in self.lines:
-            if bottom is None:
-                bottom = line.lower
-            if line.lower is not None and bottom < line.lower:
-                bottom = line.lower
-
-            if top is None:
-                top = line.upper
-            if line.upper is not None and line.upper > top:
-                top = line.upper
-
-            if biggest is None:
-                if line.lower is not None:
-                    biggest = line.lower
-
-                if line.upper is not None:
-                    biggest = line.upper
-            else:
-                if line.lower is not None and line.lower > biggest:
-                    biggest = line.lower
-                elif line.upper is not None and line.upper > biggest:
-                    biggest = line.upper
+        return self._bottom, self._top, self._biggest
+
+    # --- Rendering
+    def compile(self):
+        """Pre-renders the parsed lines. The output only changes at the
+        chapters where a conditional line starts or stops, so the content is
+        joined once for each of these intervals. Neighbouring intervals with
+        the same output are merged. Results are stored in `breakpoints`, the
+        sorted list of first chapters for each interval, and `renders`, the
+        output for the corresponding interval.
+        """
+        self.finish()
+        buffer = self._buffer
+        starts = self._starts
+        conditionals = self._conditionals
+        lowers = self._lowers
+        uppers = self._uppers
+        count = len(starts)
+
+        points = self.boundaries() | {1}
+
+        self.breakpoints = []
+        self.renders = []
+        for chapter in sorted(points):
+            # Lines are newline terminated in the buffer, so each run of
+            # consecutive included lines is a single slice
+            parts = []
+            run = None
+            for index in range(count):
+                upper = uppers[index]
+                if not conditionals[index] or (lowers[index] <= chapter and
+                        (upper == NO_BOUND or chapter <= upper)):
+                    if run is None:
+                        run = starts[index]
+                elif run is not None:
+                    parts.append(buffer[run:starts[index]])
+                    run = None
+
+            if run is not None:
+                parts.append(buffer[run:])
+
+            content = "".join(parts)
+            if self.renders and self.renders[-1] == content:
+                # Same as the previous interval, extend it instead
+                continue
+
+            self.breakpoints.append(chapter)
+            self.renders.append(content)
+
+    def interval(self, chapter):
+        """Returns the index into `renders` for the given chapter."""
+        if self.breakpoints is None:
+            self.compile()
+
+        index = bisect_right(self.breakpoints, chapter) - 1
+        return max(index, 0)
+
+    def render(self, chapter):
+        """Returns the content of the parsed file for the given chapter."""
+        index = self.interval(chapter)
+        return self.renders[index]
+
+    # --- Differences between chapters
+    def _conditional_lines(self):
+        # Indices of the conditional lines, the only ones that can differ
+        # between chapters
+        if self._conditional_index is None:
+            self._conditional_index = array('q', (index for index,
+                conditional in enumerate(self._conditionals) if conditional))
+
+        return self._conditional_index
+
+    def boundaries(self):
+        """Returns the set of chapters where lines appear or disappear: the
+        first chapter of each conditional line's range, and the chapter
+        after it ends."""
+        lowers = self._lowers
+        uppers = self._uppers
+
+        points = set()
+        for index in self._conditional_lines():
+            points.add(lowers[index])
+            if uppers[index] != NO_BOUND:
+                points.add(uppers[index] + 1)
+
+        return points
+
+    def present(self, index, chapter):
+        """True if the line at `index` is part of the given chapter."""
+        if not self._conditionals[index]:
+            return True
+
+        upper = self._uppers[index]
+        return self._lowers[index] <= chapter and (upper == NO_BOUND or
+            chapter <= upper)
+
+    def changes(self, old, new):
+        """Returns the lines that are in only one of the chapters `old` and
+        `new`, found from the line ranges without rendering either chapter.
+        Only conditional lines can differ, so only those are looked at.
+
+        :returns: list of `(index, old_pos, new_pos, in_old)` tuples in file
+            order. `old_pos` and `new_pos` are the number of lines before
+            this one in each chapter's output, `in_old` is True for lines
+            that are removed and False for those that are added.
+        """
+        results = []
+        if self.breakpoints is not None and \
+                self.interval(old) == self.interval(new):
+            return results
+
+        missing_old = 0
+        missing_new = 0
+        for index in self._conditional_lines():
+            in_old = self.present(index, old)
+            in_new = self.present(index, new)
+            if in_old != in_new:
+                results.append((index, index - missing_old,
+                    index - missing_new, in_old))
+
+            missing_old += not in_old
+            missing_new += not in_new
 
-        return bottom, top, biggest
+        return results
 
 # ===========================================================================
 
@@ -106,6 +403,18 @@ chapter_in_range = lambda chapter, conditional, lower, upper: \
 
 
 def range_token(token):
+    """Returns the `(lower, upper)` bounds for a range token such as "3",
+    "2-4", "2-" or "-4". Results are memoized."""
+    result = _range_tokens.get(token)
+    if result is None:
+        result = _parse_range_token(token)
+        if len(_range_tokens) < MEMO_SIZE:
+            _range_tokens[token] = result
+
+    return result
+
+
+def _parse_range_token(token):
     lower = None
     upper = None
 
@@ -131,7 +440,41 @@ def range_token(token):
     return lower, upper
 
 
+def chapter_ranges(expression):
+    """Returns a list of `(lower, upper)` bounds for a comma separated list
+    of range tokens, like "3-7,12,30-". An upper bound of None means the
+    range has no end."""
+    ranges = []
+    for token in expression.split(','):
+        token = token.strip()
+        if not token:
+            continue
+
+        try:
+            ranges.append(range_token(token))
+        except (ValueError, IndexError):
+            raise ValueError(f"Bad chapter range *{token}* in *{expression}*")
+
+    if not ranges:
+        raise ValueError(f"No chapter ranges found in *{expression}*")
+
+    return ranges
+
+
 def parse_marker(text, line_no):
+    """Tokenizes the text following a marker's "@" into a :class:`Marker`.
+    Results are memoized, errors are raised with `line_no` in the message.
+    """
+    marker = _markers.get(text)
+    if marker is None:
+        marker = _parse_marker(text, line_no)
+        if len(_markers) < MEMO_SIZE:
+            _markers[text] = marker
+
+    return marker
+
+
+def _parse_marker(text, line_no):
     # First character is the julienne type
     try:
         jtype = text[0]
@@ -167,6 +510,8 @@ def parse_marker(text, line_no):
 # ---------------------------------------------------------------------------
 
 class Line:
+    __slots__ = ('content', 'conditional', 'lower', 'upper')
+
     def __init__(self, content, conditional, lower, upper):
         self.content = content
         self.conditional = conditional
@@ -185,10 +530,128 @@ class Line:
         # Line not in chapter range
         return None
 
+
+class LineView(Sequence):
+    """Read-only sequence of :class:`Line` objects, built on demand from a
+    :class:`Parser`'s compact storage."""
+    def __init__(self, parser):
+        self.parser = parser
+
+    def __len__(self):
+        return len(self.parser._starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        parser = self.parser
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+
+        lower = parser._lowers[index]
+        upper = parser._uppers[index]
+        return Line(parser.content(index), bool(parser._conditionals[index]),
+            None if lower == NO_BOUND else lower,
+            None if upper == NO_BOUND else upper)
+
 # ===========================================================================
 # Parsers
 # ===========================================================================
 
+def _split_content(content):
+    # Strip trailing newlines before parsing
+    if content and content[-1] == '\n':
+        content = content[:-1]
+
+    return content.split('\n')
+
+
+def _iter_source(source, encoding=None):
+    # Yields the lines from an iterable of strings or a binary file handle
+    # without their line endings, giving the same result as _split_content()
+    # does for the whole content. Binary files are decoded the same way as
+    # reading in text mode, including newline translation
+    wrapper = None
+    if isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+        source = wrapper = io.TextIOWrapper(source, encoding=encoding)
+
+    try:
+        empty = True
+        for text in source:
+            empty = False
+            if text.endswith('\n'):
+                text = text[:-1]
+
+            yield text
+
+        if empty:
+            # Empty content is a single empty line
+            yield ''
+    finally:
+        if wrapper is not None:
+            # Closing the wrapper would close the caller's handle
+            wrapper.detach()
+
+
+def scan_lines(content, scanner):
+    """Finds every match of the compiled regex `scanner` in `content` in a
+    single pass. Returns a sorted list of the numbers of the lines that
+    contain one. Matches shouldn't span lines, and to list each line once
+    they should run to its end."""
+    hits = []
+    line_no = 0
+    last = 0
+    count = content.count
+    for match in scanner.finditer(content):
+        pos = match.start()
+        line_no += count('\n', last, pos)
+        last = pos
+        hits.append(line_no)
+
+    return hits
+
+
+def parse_content(content, style):
+    """Parses a multi-line string containing code that uses the given
+    :class:`CommentStyle`. Every style is handled by the same engine: the
+    style's scanner finds the lines with markers, those are parsed one at a
+    time and the runs of plain lines between them are added in bulk. Content
+    dense with markers is parsed a line at a time instead. Returns a
+    :class:`Parser`.
+    """
+    parser = Parser(style)
+    line_fn = style.line_fn
+    run_fn = style.run_fn
+
+    lines = _split_content(content)
+    markers = sum(content.count(token) for token in style.tokens)
+    if markers * DENSE_LINES >= len(lines):
+        for line_no, text in enumerate(lines):
+            line_fn(parser, line_no, text)
+
+        parser.finish()
+        return parser
+
+    start = 0
+    for line_no in scan_lines(content, style.scanner):
+        if start + 1 == line_no:
+            # Single plain line, not worth setting up a run
+            line_fn(parser, start, lines[start])
+        elif start < line_no:
+            run_fn(parser, lines, start, line_no, line_fn)
+
+        line_fn(parser, line_no, lines[line_no])
+        start = line_no + 1
+
+    if start < len(lines):
+        run_fn(parser, lines, start, len(lines), line_fn)
+
+    parser.finish()
+    return parser
+
+# ---------------------------------------------------------------------------
 # Python (pound-style comment) Parser
 
 def parse_pound_content(content):
@@ -197,95 +660,110 @@ def parse_pound_content(content):
     list of Line objects along with whether all the lines are conditional or
     not, and the ultimate lower and upper chapter boundaries on the content.
     """
+    return parse_content(content, POUND_STYLE)
+
+
+def _add_line_comment_run(parser, lines, start, end, line_fn):
+    # Adds lines[start:end], none of which have a marker
+    if parser.mode == ParseMode.BLOCK_COMMENT:
+        # First plain line closes the block comment
+        line_fn(parser, start, lines[start])
+        start += 1
+        if start == end:
+            return
+
+    texts = lines[start:end]
+    if parser.mode != ParseMode.BLOCK_OPEN and len(parser.stack) == 1:
+        parser.add_lines(texts, False, None, None)
+        parser.all_conditional = False
+    else:
+        parent = parser.parent_marker
+        parser.add_lines(texts, True, parent.lower, parent.upper)
+
+
+def _parse_line_comment(parser, line_no, text):
+    # Parses a single line of content using a line comment style, like the
+    # pound-style, adding the results to `parser`
+    style = parser.style
+    index = text.find(style.marker)
+    if index == -1:
+        if parser.mode == ParseMode.BLOCK_OPEN:
+            # Inside an open block, add conditional line based on parent
+            parent = parser.parent_marker
+            parser.add_line(text, True, parent.lower, parent.upper)
+        else:
+            # No juli comment, could be closing the block
+            if parser.mode == ParseMode.BLOCK_COMMENT:
+                parser.close_nest()
 
-    # Strip trailing newlines before parsing
-    if content and content[-1] == '\n':
-        content = content[:-1]
-
-    parser = Parser(Parser.CONTENT_TYPES.POUND)
-
-    # Loop through lines in content
-    for line_no, text in enumerate(content.split('\n')):
-        index = text.find("#@")
-        if index == -1:
-            if parser.mode == ParseMode.BLOCK_OPEN:
-                # Inside an open block, add conditional line based on parent
+            if len(parser.stack) == 1:
+                # Not nested, keep the line unconditionally
+                parser.add_line(text, False, None, None)
+                parser.all_conditional = False
+            else:
+                # Nested, keep the line using parent's conditions
                 parent = parser.parent_marker
                 parser.add_line(text, True, parent.lower, parent.upper)
-            else:
-                # No juli comment, could be closing the block
-                if parser.mode == ParseMode.BLOCK_COMMENT:
-                    parser.close_nest()
-
-                if len(parser.stack) == 1:
-                    # Not nested, keep the line unconditionally
-                    parser.add_line(text, False, None, None)
-                    parser.all_conditional = False
-                else:
-                    # Nested, keep the line using parent's conditions
-                    parent = parser.parent_marker
-                    parser.add_line(text, True, parent.lower, parent.upper)
 
-            continue
+        return
 
-        # Found a conditional line, behaviour changes based on the type of
-        # conditional
-        line_text = ''
-        marker = parse_marker(text[index+2:], line_no)
+    # Found a conditional line, behaviour changes based on the type of
+    # conditional
+    line_text = ''
+    marker = parse_marker(text[index+len(style.marker):], line_no)
 
-        # Determine line text based on jtype
-        if parser.mode == ParseMode.BLOCK_COMMENT and marker.jtype != '-':
-            # Anything besides a "-" marker pops the context stack
-            parser.close_nest()
+    # Determine line text based on jtype
+    if parser.mode == ParseMode.BLOCK_COMMENT and marker.jtype != '-':
+        # Anything besides a "-" marker pops the context stack
+        parser.close_nest()
 
-        if marker.jtype == '=':
-            # Inline conditional, comment after the code
-            line_text = text[:index]
-            if marker.comment:
-                line_text += f"# {marker.comment}"
-            else:
-                # Remove any trailing spaces if there was no comment,
-                # especially useful if you're running black after
-                line_text = line_text.rstrip()
+    if marker.jtype == '=':
+        # Inline conditional, comment after the code
+        line_text = text[:index]
+        if marker.comment:
+            line_text += style.comment(marker.comment)
+        else:
+            # Remove any trailing spaces if there was no comment,
+            # especially useful if you're running black after
+            line_text = line_text.rstrip()
 
-            if line_text:
-                parser.add_line(line_text, True, marker.lower, marker.upper)
-        elif marker.jtype == '@':
-            # Inline conditional, comment before code (code is commented out)
-            # For other types, the comment comes after the type and the
-            # boundary, in this case the "comment" is the code to be used
-            if marker.comment:
-                parser.add_line(marker.comment, True, marker.lower,
-                    marker.upper)
-        elif marker.jtype == '+':
-            # Header for a block comment
-            parser.nest(ParseMode.BLOCK_COMMENT, marker)
-            parser.add_if_commented(text, index, marker)
-        elif marker.jtype == '-':
-            # Body for a block comment
-            if parser.mode != ParseMode.BLOCK_COMMENT:
-                error = (f"Block marker found without header on line "
-                    f"{line_no} *{text}*")
-                raise ValueError(error)
+        if line_text:
+            parser.add_line(line_text, True, marker.lower, marker.upper)
+    elif marker.jtype == '@':
+        # Inline conditional, comment before code (code is commented out)
+        # For other types, the comment comes after the type and the
+        # boundary, in this case the "comment" is the code to be used
+        if marker.comment:
+            parser.add_line(marker.comment, True, marker.lower,
+                marker.upper)
+    elif marker.jtype == '+':
+        # Header for a block comment
+        parser.nest(ParseMode.BLOCK_COMMENT, marker)
+        parser.add_if_commented(text, index, marker)
+    elif marker.jtype == '-':
+        # Body for a block comment
+        if parser.mode != ParseMode.BLOCK_COMMENT:
+            error = (f"Block marker found without header on line "
+                f"{line_no} *{text}*")
+            raise ValueError(error)
 
-            # Remove the "#@- " token from the text, preserve any leading
-            # spaces
-            line_text = text[0:index] + text[index+4:]
-            parent = parser.parent_marker
-            parser.add_line(line_text, True, parent.lower, parent.upper)
-        elif marker.jtype == '[':
-            # Header for an open block
-            parser.nest(ParseMode.BLOCK_OPEN, marker)
-            parser.add_if_commented(text, index, marker)
-        elif marker.jtype == ']':
-            # Closing marker for open blocks, reset to normal
-            parser.close_nest()
-            parser.add_if_commented(text, index, marker)
-        elif marker.jtype == '*':
-            # Juli comment, do nothing
-            pass
+        # Remove the "#@- " token from the text, preserve any leading
+        # spaces
+        line_text = text[0:index] + text[index+len(style.marker)+2:]
+        parent = parser.parent_marker
+        parser.add_line(line_text, True, parent.lower, parent.upper)
+    elif marker.jtype == '[':
+        # Header for an open block
+        parser.nest(ParseMode.BLOCK_OPEN, marker)
+        parser.add_if_commented(text, index, marker)
+    elif marker.jtype == ']':
+        # Closing marker for open blocks, reset to normal
+        parser.close_nest()
+        parser.add_if_commented(text, index, marker)
+    elif marker.jtype == '*':
+        # Juli comment, do nothing
+        pass
 
-    return parser
 
 # ---------------------------------------------------------------------------
 # XML Style parser
@@ -298,83 +776,176 @@ def parse_xml_content(content):
     boundaries on the content.
     """
 
-    # Strip trailing newlines before parsing
-    if content and content[-1] == '\n':
-        content = content[:-1]
+    return parse_content(content, XML_STYLE)
 
-    parser = Parser(Parser.CONTENT_TYPES.XML)
 
-    # Loop through lines in content
-    for line_no, text in enumerate(content.split('\n')):
-        index = text.find("<!--@")
-        if index == -1:
-            # Check for block comment ending
-            pos = text.find("@+-->")
-            if pos != -1:
-                if parser.mode != ParseMode.BLOCK_COMMENT:
-                    error = ("Block closing marker '@+-->' found without "
-                        f"opener on line {line_no} *{text}*")
-                    raise ValueError(error)
+def _add_wrapped_run(parser, lines, start, end, line_fn):
+    # Adds lines[start:end], none of which have an opening or closing marker
+    texts = lines[start:end]
+    if parser.mode in (ParseMode.BLOCK_OPEN, ParseMode.BLOCK_COMMENT):
+        parent = parser.parent_marker
+        parser.add_lines(texts, True, parent.lower, parent.upper)
+    else:
+        parser.add_lines(texts, False, None, None)
+        parser.all_conditional = False
+
+
+def _parse_wrapped_comment(parser, line_no, text):
+    # Parses a single line of content using a style with a comment closer,
+    # like the XML-style, adding the results to `parser`
+    style = parser.style
+    index = text.find(style.marker)
+    if index == -1:
+        # Check for block comment ending
+        pos = text.find(style.block_closer)
+        if pos != -1:
+            if parser.mode != ParseMode.BLOCK_COMMENT:
+                error = (f"Block closing marker '{style.block_closer}' found "
+                    f"without opener on line {line_no} *{text}*")
+                raise ValueError(error)
 
-                # Remove the "@+--> " token from the text
-                line_text = text[0:pos].strip()
+            # Remove the "@+--> " token from the text
+            line_text = text[0:pos].strip()
 
-                if line_text:
-                    parent = parser.parent_marker
-                    parser.add_line(line_text, True, parent.lower, parent.upper)
+            if line_text:
+                parent = parser.parent_marker
+                parser.add_line(line_text, True, parent.lower, parent.upper)
 
-                parser.close_nest()
-                continue
+            parser.close_nest()
+            return
 
-            # No marker, check if we're in an open block mode
-            if parser.mode in (ParseMode.BLOCK_OPEN, ParseMode.BLOCK_COMMENT):
-                # add conditional line based on parent
-                parent = parser.parent_marker
-                parser.add_line(text, True, parent.lower, parent.upper)
-                continue
+        # No marker, check if we're in an open block mode
+        if parser.mode in (ParseMode.BLOCK_OPEN, ParseMode.BLOCK_COMMENT):
+            # add conditional line based on parent
+            parent = parser.parent_marker
+            parser.add_line(text, True, parent.lower, parent.upper)
+            return
+
+        # ELSE: not a juli comment, keep the line unconditionally
+        parser.add_line(text, False, None, None)
+        parser.all_conditional = False
+        return
+
+    # Found a conditional line, behaviour changes based on the type of
+    # conditional, start by removing the marker's comment closer, then parse
+    # the marker text
+    line_text = ''
+    start = index + len(style.marker)
+    closer = text.find(style.closer, start)
+    if closer != -1:
+        text = text[0:closer].rstrip()
+
+    marker = parse_marker(text[start:], line_no)
+
+    # Determine line text based on jtype
+    if marker.jtype == '=':
+        # Inline conditional, just this line
+        line_text = text[:index]
+        if marker.comment:
+            line_text += style.comment(marker.comment)
 
-            # ELSE: not a juli comment, keep the line unconditionally
-            parser.add_line(text, False, None, None)
-            parser.all_conditional = False
-            continue
+        if line_text:
+            parser.add_line(line_text, True, marker.lower, marker.upper)
+    elif marker.jtype == '+':
+        # Header for a block comment
+        parser.nest(ParseMode.BLOCK_COMMENT, marker)
+        parser.add_if_commented(text, index, marker)
+    elif marker.jtype == '-':
+        error = (f"Unsupported marker type '-' for {style.name} doc on line"
+            f"{line_no} *{text}*")
+        raise ValueError(error)
+    elif marker.jtype == '[':
+        # Header for an open block
+        parser.nest(ParseMode.BLOCK_OPEN, marker)
+        parser.add_if_commented(text, index, marker)
+    elif marker.jtype == ']':
+        # Closing marker for open blocks, reset to normal
+        parser.close_nest()
+        parser.add_if_commented(text, index, marker)
+    elif marker.jtype == '*':
+        # Juli comment, do nothing
+        pass
 
-        # Found a conditional line, behaviour changes based on the type of
-        # conditional, start by removing any closing XML comments, then parse
-        # the marker text
-        line_text = ''
-        closer = text.find("-->")
-        if closer != -1:
-            text = text[0:closer].rstrip()
+# ===========================================================================
+# Streaming Parsers
+# ===========================================================================
 
-        marker = parse_marker(text[index+5:], line_no)
+class LineStream(Parser):
+    """Parses lines one at a time as it is iterated, yielding a `(content,
+    conditional, lower, upper)` tuple for each resulting line instead of
+    storing them. Once iteration is done, :meth:`get_range` and
+    `all_conditional` hold the same summary a full parse would have.
 
-        # Determine line text based on jtype
-        if marker.jtype == '=':
-            # Inline conditional, just this line
-            line_text = text[:index]
-            if marker.comment:
-                line_text += f"<!-- {marker.comment} -->"
+    :param style: :class:`CommentStyle` of the content
+    :param source: iterable of lines or a binary file handle
+    :param encoding: encoding used if `source` is a binary file
+    """
+    def __init__(self, style, source, encoding=None):
+        super().__init__(style)
+        self._chunks = None
+        self._source = source
+        self._line_fn = style.line_fn
+        self._encoding = encoding
+        self._pending = []
 
-            if line_text:
-                parser.add_line(line_text, True, marker.lower, marker.upper)
-        elif marker.jtype == '+':
-            # Header for a block comment
-            parser.nest(ParseMode.BLOCK_COMMENT, marker)
-            parser.add_if_commented(text, index, marker)
-        elif marker.jtype == '-':
-            error = ("Unsupported marker type '-' for XML doc on line"
-                f"{line_no} *{text}*")
-            raise ValueError(error)
-        elif marker.jtype == '[':
-            # Header for an open block
-            parser.nest(ParseMode.BLOCK_OPEN, marker)
-            parser.add_if_commented(text, index, marker)
-        elif marker.jtype == ']':
-            # Closing marker for open blocks, reset to normal
-            parser.close_nest()
-            parser.add_if_commented(text, index, marker)
-        elif marker.jtype == '*':
-            # Juli comment, do nothing
-            pass
+    def add_line(self, text, conditional, lower, upper):
+        self._pending.append((text, conditional, lower, upper))
+        self._update_range(lower, upper)
 
-    return parser
+    def finish(self):
+        pass
+
+    def __iter__(self):
+        lines = _iter_source(self._source, self._encoding)
+        for line_no, text in enumerate(lines):
+            self._line_fn(self, line_no, text)
+            yield from self._pending
+            self._pending.clear()
+
+
+def iter_lines(source, style, encoding=None):
+    """Streaming version of :func:`parse_content`, takes an iterable of
+    lines or a binary file handle. Returns a :class:`LineStream`."""
+    return LineStream(style, source, encoding)
+
+
+def iter_pound_lines(source, encoding=None):
+    """Streaming version of :func:`parse_pound_content`, takes an iterable of
+    lines or a binary file handle. Returns a :class:`LineStream`."""
+    return LineStream(POUND_STYLE, source, encoding)
+
+
+def iter_xml_lines(source, encoding=None):
+    """Streaming version of :func:`parse_xml_content`, takes an iterable of
+    lines or a binary file handle. Returns a :class:`LineStream`."""
+    return LineStream(XML_STYLE, source, encoding)
+
+
+def emit_lines(stream, outputs):
+    """Renders a :class:`LineStream` for several chapters in a single pass.
+
+    :param stream: :class:`LineStream` to consume
+    :param outputs: dictionary mapping chapter numbers to a function that
+        writes a string, each gets the content for their chapter
+    :returns: the consumed stream, for its range summary
+    """
+    outputs = list(outputs.items())
+    for content, conditional, lower, upper in stream:
+        line = content + "\n"
+        for chapter, write in outputs:
+            if chapter_in_range(chapter, conditional, lower, upper):
+                write(line)
+
+    return stream
+
+
+def emit_pound_lines(source, outputs, encoding=None):
+    """Parses pound-style content from `source` and streams the rendered
+    result for each chapter in `outputs`, see :func:`emit_lines`."""
+    return emit_lines(iter_pound_lines(source, encoding), outputs)
+
+
+def emit_xml_lines(source, outputs, encoding=None):
+    """Parses XML-style content from `source` and streams the rendered result
+    for each chapter in `outputs`, see :func:`emit_lines`."""
+    return emit_lines(iter_xml_lines(source, encoding), outputs)
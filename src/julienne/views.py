@@ -0,0 +1,92 @@
+# views.py
+#   Read-only, in-memory views of a chapter's files, rendered as they are
+#   asked for
+from collections.abc import Mapping
+from pathlib import PurePosixPath
+
+from julienne.nodes import DirNode, _BaseFileNode
+
+# ===========================================================================
+
+class ChapterView(Mapping):
+    """Mapping of the files in a chapter of a :class:`FileTree` to their
+    content, see :meth:`FileTree.render`. Keys are paths relative to the
+    chapter directory using "/", like "code/mixed.py", values are the bytes
+    that would be written there. Directories aren't included.
+
+    Finding the keys walks the tree, loading any files whose range isn't
+    known yet. Content is rendered each time a file is looked up and isn't
+    kept, reading every value of a large chapter holds one file at a time.
+
+    :param tree: :class:`FileTree` the chapter is from
+    :param chapter: chapter number
+    :param formatter: optional :class:`Formatter`, Python files are passed
+        through it
+    """
+    def __init__(self, tree, chapter, formatter=None):
+        self.tree = tree
+        self.chapter = chapter
+        self.formatter = formatter
+        self._nodes = None
+
+    def _files(self):
+        # Maps the keys to their nodes, found on first use
+        if self._nodes is None:
+            self._nodes = {}
+            self._add_dir(self.tree.root)
+
+        return self._nodes
+
+    def _add_dir(self, node):
+        parent_path = self.tree.base_dir.parent
+        for child in node.children:
+            if isinstance(child, DirNode):
+                if child.should_traverse(self.chapter):
+                    self._add_dir(child)
+            elif child.in_chapter(self.chapter):
+                rel = child.path.relative_to(parent_path).as_posix()
+                self._nodes[rel] = child
+
+    def __getitem__(self, key):
+        node = self._files()[key]
+        formats = self.formatter is not None and self.formatter.applies(
+            PurePosixPath(key))
+
+        if not isinstance(node, _BaseFileNode):
+            # Copied files are formatted too, the same as the writers do
+            if not formats:
+                return node.path.read_bytes()
+
+            encoding = self.tree.encoding
+            code = node.path.read_text(encoding=encoding)
+            return self.formatter.format(code, PurePosixPath(key)).encode(
+                encoding)
+
+        loaded = node.loaded
+        try:
+            if node.verbatim and not formats:
+                # Same bytes as the copy that gets written
+                data = node.path.read_bytes()
+                if not data.endswith(b"\n"):
+                    data += b"\n"
+
+                return data
+
+            content = node.render(self.chapter)
+            if formats:
+                content = self.formatter.format(content, PurePosixPath(key))
+
+            return content.encode(node.encoding)
+        finally:
+            if self.tree.file_major and not loaded:
+                # Only one file's parse results are kept at a time
+                node.release()
+
+    def __iter__(self):
+        return iter(self._files())
+
+    def __len__(self):
+        return len(self._files())
+
+    def __contains__(self, key):
+        return key in self._files()
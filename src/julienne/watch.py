@@ -0,0 +1,512 @@
+# watch.py
+#   Watches the source tree and configuration, regenerating only what changed
+import ctypes
+import ctypes.util
+import errno
+import os
+from pathlib import Path
+import select
+import struct
+import sys
+import time
+
+import tomli
+
+from julienne.filemodel import (generate_files, _convert_path,
+    _manifest_hash)
+from julienne.formatters import Formatter
+from julienne.manifest import Manifest
+from julienne.nodes import DirNode, _BaseFileNode
+from julienne.writers import FileWriter
+
+# ===========================================================================
+
+DEBOUNCE = 0.2          # seconds without changes before rebuilding
+POLL_INTERVAL = 0.5     # seconds between scans when polling
+
+# inotify constants, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# struct inotify_event: wd, mask, cookie, len, followed by the name
+EVENT_HEADER = struct.Struct('iIII')
+
+# ===========================================================================
+# Watchers
+# ===========================================================================
+#
+# Watchers block in wait() until something changes, returning the set of
+# string paths that changed. A None in the set means changes may have been
+# missed and everything should be looked at again.
+
+def _skip_none(path):
+    return False
+
+
+class PollingWatcher:
+    """Finds changes by scanning the modification time and size of
+    everything being watched.
+
+    :param roots: directories to watch, including all of their
+        sub-directories
+    :param files: individual files to watch
+    :param skip_dir: function that is passed a directory's string path,
+        returning True if it shouldn't be watched
+    :param interval: seconds between scans
+    """
+    def __init__(self, roots, files, skip_dir=None, interval=POLL_INTERVAL):
+        self.roots = [str(root) for root in roots]
+        self.files = [str(path) for path in files]
+        self.skip_dir = skip_dir or _skip_none
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for root in self.roots:
+            for dir_path, dir_names, file_names in os.walk(root):
+                dir_names[:] = [name for name in dir_names if not
+                    self.skip_dir(os.path.join(dir_path, name))]
+
+                for name in dir_names + file_names:
+                    path = os.path.join(dir_path, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+        for path in self.files:
+            try:
+                stat = os.stat(path)
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                pass
+
+        return snapshot
+
+    def _changes(self):
+        old = self._snapshot
+        self._snapshot = self._scan()
+        return {path for path in old.keys() | self._snapshot.keys() if
+            old.get(path) != self._snapshot.get(path)}
+
+    def wait(self, debounce=DEBOUNCE):
+        """Blocks until something changes, then until nothing has changed
+        for `debounce` seconds. Returns the set of changed paths."""
+        while True:
+            time.sleep(self.interval)
+            changed = self._changes()
+            if not changed:
+                continue
+
+            while True:
+                time.sleep(debounce)
+                more = self._changes()
+                if not more:
+                    return changed
+
+                changed |= more
+
+    def close(self):
+        pass
+
+
+def _libc():
+    # Returns the C library if it has inotify, otherwise None
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+            use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+        ctypes.c_uint32]
+    return libc
+
+
+class InotifyWatcher:
+    """Finds changes using the Linux inotify API. Takes the same arguments
+    as :class:`PollingWatcher`, less the `interval`. Raises OSError if
+    inotify isn't available."""
+    def __init__(self, roots, files, skip_dir=None):
+        self._libc = _libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        self.skip_dir = skip_dir or _skip_none
+        self.files = {str(path) for path in files}
+
+        # Watch descriptor -> directory path, and the descriptors of the
+        # directories only being watched for one of the files
+        self._dirs = {}
+        self._file_dirs = set()
+
+        for root in roots:
+            self._add_tree(str(root))
+
+        for path in self.files:
+            directory = os.path.dirname(path)
+            if directory in self._dirs.values():
+                continue
+
+            wd = self._add_watch(directory)
+            if wd is not None:
+                self._file_dirs.add(wd)
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path),
+            WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                # Gone before it could be watched
+                return None
+
+            raise OSError(error, f"Can't watch {path}: {os.strerror(error)}")
+
+        self._dirs[wd] = path
+        self._file_dirs.discard(wd)
+        return wd
+
+    def _add_tree(self, root):
+        self._add_watch(root)
+        for dir_path, dir_names, _ in os.walk(root):
+            dir_names[:] = [name for name in dir_names if not
+                self.skip_dir(os.path.join(dir_path, name))]
+
+            for name in dir_names:
+                self._add_watch(os.path.join(dir_path, name))
+
+    def _read(self, timeout):
+        # Returns the paths from the events that arrive within `timeout`
+        # seconds, or None if there weren't any
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return None
+
+        data = os.read(self.fd, 64 * 1024)
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped
+                paths.add(None)
+                continue
+
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+
+            if mask & IN_IGNORED:
+                # Watch was removed, the directory is gone
+                del self._dirs[wd]
+                self._file_dirs.discard(wd)
+                continue
+
+            path = os.path.join(directory, name) if name else directory
+            if wd in self._file_dirs and path not in self.files:
+                continue
+
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and \
+                    not self.skip_dir(path):
+                self._add_tree(path)
+
+            paths.add(path)
+
+        return paths
+
+    def wait(self, debounce=DEBOUNCE):
+        """Blocks until something changes, then until nothing has changed
+        for `debounce` seconds. Returns the set of changed paths."""
+        changed = set()
+        timeout = None
+        while True:
+            paths = self._read(timeout)
+            if paths is None:
+                return changed
+
+            changed |= paths
+            if changed:
+                timeout = debounce
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def make_watcher(roots, files, skip_dir=None, polling=False):
+    """Returns an :class:`InotifyWatcher` if the platform supports it,
+    otherwise (or if `polling` is True) a :class:`PollingWatcher`."""
+    if not polling:
+        try:
+            return InotifyWatcher(roots, files, skip_dir)
+        except OSError as e:
+            print(f"Can't use inotify ({e.strerror}), polling for changes")
+
+    return PollingWatcher(roots, files, skip_dir)
+
+# ===========================================================================
+# Rebuilding
+# ===========================================================================
+
+class Rebuilder:
+    """Keeps a :class:`FileTree` in memory between builds. When a single
+    file changes only that file is loaded again and written into the
+    chapters it is part of. Changes to the configuration, to the tree's
+    structure or to the range of chapters cause a full rebuild.
+
+    Arguments are the same as :func:`generate_files`.
+    """
+    def __init__(self, config_file, verbose=False, single_chapter=None,
+            jobs=None, file_major=None, incremental=None, cache_dir=None,
+            chapters=None, skip_unchanged=None):
+        self.config_file = os.path.abspath(config_file)
+        self.verbose = verbose
+        self.single_chapter = single_chapter
+        self.jobs = jobs
+        self.file_major = file_major
+        self.incremental = incremental
+        self.cache_dir = cache_dir
+        self.chapters = chapters
+        self.skip_unchanged = skip_unchanged
+
+        self.tree = None
+        self.failed = False
+
+    def build(self):
+        """Generates everything, same as a normal run."""
+        self.failed = True
+
+        path = Path(self.config_file)
+        config_text = path.read_text()
+        self.config = tomli.loads(config_text)
+        self.output_dir = _convert_path(path.parent,
+            Path(self.config['output_dir']))
+        if self.config.get('output_format', 'dir') != 'dir':
+            raise ValueError("Watching needs output_format to be \"dir\"")
+
+        self.tree = generate_files(self.config_file, self.verbose, False,
+            self.single_chapter, '', self.jobs, self.file_major,
+            self.incremental, self.cache_dir, self.chapters,
+            self.skip_unchanged)
+        self.failed = False
+
+        selection = None
+        if self.chapters is not None:
+            selection = self.tree.select_chapters(self.chapters)
+
+        self.targets = self.tree.chapter_targets(self.output_dir,
+            self.single_chapter, selection)
+        formatter = Formatter(self.config.get('isort', False),
+            self.config.get('black', False), self.tree.cache, self.output_dir)
+        skip_unchanged = self.skip_unchanged
+        if skip_unchanged is None:
+            skip_unchanged = self.config.get('skip_unchanged', False)
+
+        self.writer = FileWriter(self.config.get('link_mode', 'copy'),
+            formatter=formatter, compare=skip_unchanged,
+            encoding=self.tree.encoding)
+
+        # Same manifest as the build, when there is one
+        self.manifest_hash = None
+        incremental = self.incremental
+        if incremental is None:
+            incremental = self.config.get('incremental', False)
+        if incremental:
+            self.manifest_hash = _manifest_hash(config_text, formatter)
+
+        self._index()
+
+    def _index(self):
+        # Maps string paths to the tree's nodes, and each file to the
+        # directories above it
+        self.dirs = {}
+        self.files = {}
+        self.parents = {}
+
+        def walk(node, ancestors):
+            self.dirs[str(node.path)] = node
+            ancestors = ancestors + [node, ]
+            for child in node.children:
+                if isinstance(child, DirNode):
+                    walk(child, ancestors)
+                else:
+                    self.files[str(child.path)] = child
+                    self.parents[str(child.path)] = ancestors
+
+        walk(self.tree.root, [])
+
+    def skip_dir(self, path):
+        """Returns True for directories that are never part of the tree."""
+        return self.tree is not None and not self.tree.includes(path, True)
+
+    def update(self, paths):
+        """Regenerates whatever is affected by the set of changed `paths`.
+
+        :returns: True if everything was rebuilt
+        """
+        if self.failed or None in paths or self.config_file in paths:
+            self.build()
+            return True
+
+        changed = []
+        for path in sorted(paths):
+            node = self.files.get(path)
+            if node is not None:
+                if not os.path.isfile(path):
+                    # Deleted
+                    self.build()
+                    return True
+
+                changed.append(node)
+            elif path in self.dirs:
+                if not os.path.isdir(path):
+                    self.build()
+                    return True
+            elif self._is_new(path):
+                self.build()
+                return True
+
+        for node in changed:
+            if not self._refresh(node):
+                self.build()
+                return True
+
+        return False
+
+    def _is_new(self, path):
+        # True if the changed path isn't in the tree but should be
+        if os.path.dirname(path) not in self.dirs or not os.path.exists(path):
+            return False
+
+        return self.tree.includes(path, os.path.isdir(path))
+
+    def _refresh(self, node):
+        # Loads a changed file again and writes it into its chapters.
+        # Returns False if the change needs a full rebuild instead
+        path = str(node.path)
+        if isinstance(node, _BaseFileNode):
+            node.reset()
+            node.ensure_loaded()
+
+            # Chapter numbers in the file may change the chapter range, and
+            # with it the directory names
+            biggest = None
+            if self.tree.chapter is None:
+                biggest = self.tree.biggest
+
+            self.tree.invalidate()
+            if biggest is not None and self.tree.biggest != biggest:
+                return False
+
+        print(f'Updating {path}')
+
+        # Incremental builds have the file's entries in the manifest brought
+        # up to date, so the next full build carries on from them
+        manifest = None
+        if self.manifest_hash is not None:
+            manifest = Manifest(self.output_dir, self.manifest_hash)
+            manifest.source_changed(node.path)
+
+        removed = []
+        parent_path = self.tree.base_dir.parent
+        self.writer.manifest = manifest
+        try:
+            for num, output_path in self.targets:
+                if not all(parent.should_traverse(num) for parent in
+                        self.parents[path]):
+                    continue
+
+                # Outputs are replaced, unless the writer can leave ones that
+                # are the same alone
+                dest = output_path / node.path.relative_to(parent_path)
+                writes = not isinstance(node, _BaseFileNode) or \
+                    node.should_write(num)
+                if not (writes and self.writer.compare):
+                    dest.unlink(missing_ok=True)
+                if not writes:
+                    removed.append(dest)
+
+                node.copy(num, parent_path, output_path, self.writer)
+        finally:
+            self.writer.manifest = None
+
+        if isinstance(node, _BaseFileNode) and self.tree.file_major:
+            node.release()
+
+        if manifest is not None:
+            manifest.update(removed)
+
+        return True
+
+
+def watch(config_file, verbose=False, single_chapter=None, jobs=None,
+        file_major=None, incremental=None, cache_dir=None, chapters=None,
+        skip_unchanged=None, debounce=DEBOUNCE, polling=False):
+    """Generates the chapters, then watches the source directory and the
+    configuration file, regenerating what changes until interrupted.
+    Arguments are the same as :func:`generate_files`.
+
+    :param debounce: seconds to wait for things to settle after a change
+    :param polling: if True, scan for changes instead of using inotify
+    """
+    rebuilder = Rebuilder(config_file, verbose, single_chapter, jobs,
+        file_major, incremental, cache_dir, chapters, skip_unchanged)
+    rebuilder.build()
+
+    root = rebuilder.tree.base_dir
+    watcher = make_watcher([root, ], [rebuilder.config_file, ],
+        rebuilder.skip_dir, polling)
+
+    print('\n**Watching for changes, press Ctrl-C to stop')
+    try:
+        while True:
+            paths = watcher.wait(debounce)
+            try:
+                rebuilder.update(paths)
+            except Exception as e:
+                print(f'!!! {e.__class__.__name__}: {e}')
+                rebuilder.failed = True
+                continue
+
+            if rebuilder.tree.base_dir != root:
+                # The configuration moved the source directory
+                watcher.close()
+                root = rebuilder.tree.base_dir
+                watcher = make_watcher([root, ], [rebuilder.config_file, ],
+                    rebuilder.skip_dir, polling)
+    except KeyboardInterrupt:
+        print('\n**Stopped watching')
+    finally:
+        watcher.close()
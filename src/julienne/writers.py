@@ -0,0 +1,431 @@
+# writers.py
+#   Output writers, the nodes use these to put chapter content on disk
+from contextlib import contextmanager
+import errno
+import filecmp
+import hashlib
+import os
+import shutil
+
+from julienne.manifest import hash_bytes
+
+try:
+    import fcntl
+except ImportError:     # pragma: no cover, not available on Windows
+    fcntl = None
+
+# ===========================================================================
+
+LINK_MODES = ('copy', 'hardlink', 'reflink')
+
+DEFAULT_ENCODING = 'utf-8'
+
+# ioctl request for cloning a file on Linux (btrfs, XFS, etc.)
+FICLONE = 0x40049409
+
+# Errors that mean the file system (or OS) can't do the requested linking
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EINVAL,
+    errno.ENOTTY, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS}
+
+# ===========================================================================
+
+def _reflink(src, dest):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflink not supported on this platform")
+
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def _fast_copy(src, dest):
+    # Copies file contents, letting the kernel move the data where possible
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, "rb") as s, open(dest, "wb") as d:
+                size = os.fstat(s.fileno()).st_size
+                while size > 0:
+                    sent = os.copy_file_range(s.fileno(), d.fileno(), size)
+                    if sent == 0:
+                        break
+                    size -= sent
+
+                if size <= 0:
+                    return
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+
+    # shutil uses sendfile() or similar where it is available
+    shutil.copyfile(src, dest)
+
+
+def _unshare(dest):
+    # A destination left over from a previous run may be hard linked to
+    # other chapters, writing into it would change all of them
+    try:
+        if dest.stat().st_nlink > 1:
+            dest.unlink()
+    except FileNotFoundError:
+        pass
+
+# ===========================================================================
+
+class FileWriter:
+    """Writes chapter content into directories on disk.
+
+    :param link_mode: one of "copy", "hardlink" or "reflink". With "copy"
+        every file is written in full. Otherwise content that is the same as
+        something already written during this run is linked to that first
+        copy. If the file system doesn't support the chosen kind of link the
+        writer falls back to "copy".
+    :param manifest: optional :class:`Manifest` from a previous run, when
+        given outputs that are the same as last time aren't rewritten
+    :param formatter: optional :class:`Formatter`, Python files are passed
+        through it before they are written
+    :param compare: if True, existing files are compared with the new
+        content, first by size then byte by byte, and left untouched if they
+        are the same. This keeps their modification times for tools
+        downstream. Everything produced is recorded in :attr:`outputs`.
+    :param encoding: encoding of the files written, content is encoded once
+        and written in binary with a single call
+    """
+    def __init__(self, link_mode='copy', manifest=None, formatter=None,
+            compare=False, encoding=DEFAULT_ENCODING):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link_mode *{link_mode}*, must be one of "
+                + ",".join(LINK_MODES))
+
+        self.link_mode = link_mode
+        self.manifest = manifest
+        self.formatter = formatter
+        self.compare = compare
+        self.encoding = encoding
+
+        # Each chapter is written separately, so they can be spread across
+        # processes
+        self.single_stream = False
+
+        # Counts of files written and files left as they were
+        self.written = 0
+        self.unchanged = 0
+
+        # String paths of the files and directories produced, when comparing
+        self.outputs = set()
+
+        # Maps content keys to the first file written with that content
+        self._firsts = {}
+
+        # Last string encoded and its bytes, a file's render is usually
+        # written to several chapters in a row
+        self._encoded = (None, None)
+
+    def mkdir(self, path):
+        path.mkdir(parents=True, exist_ok=True)
+
+        if self.manifest is not None:
+            self.manifest.add_dir(path)
+
+        if self.compare:
+            self.outputs.add(str(path))
+
+    def is_current(self, src, dest):
+        """Returns True if `dest` is known to be up to date with `src`,
+        meaning there is no need to render it."""
+        if self.manifest is None:
+            return False
+
+        if self.manifest.is_current(src, dest):
+            self._keep(dest)
+            return True
+
+        return False
+
+    def write(self, dest, content, key=None):
+        """Writes a string to the file `dest`.
+
+        :param key: hashable value identifying `content`, files written with
+            the same key are expected to be identical and can be linked.
+        """
+        data = self._encode(content)
+        if self.manifest is not None:
+            digest = hash_bytes(data)
+            if self.manifest.output_unchanged(dest, digest):
+                self._keep(dest)
+                return
+
+        if self._link(dest, key):
+            return
+
+        if self._formats(dest):
+            data = self.formatter.format(content, dest).encode(self.encoding)
+
+        self._write_bytes(dest, data)
+        self._remember(dest, key)
+
+    def copy(self, src, dest):
+        """Copies the file `src` to `dest` along with its metadata."""
+        if self.manifest is not None:
+            digest = self.manifest.source_hash(src)
+            if self.manifest.output_unchanged(dest, digest):
+                self._keep(dest)
+                return
+
+        key = ('copy', src)
+        if self._link(dest, key):
+            return
+
+        if self._formats(dest):
+            code = src.read_text(encoding=self.encoding)
+            data = self.formatter.format(code, dest).encode(self.encoding)
+            if self._write_bytes(dest, data):
+                shutil.copystat(src, dest)
+        elif not self._same_file(src, dest):
+            _unshare(dest)
+            shutil.copy2(src, dest)
+            self._wrote(dest)
+
+        self._remember(dest, key)
+
+    def copy_text(self, src, dest, add_newline=False):
+        """Copies the contents of the text file `src` to `dest`, the same as
+        if it had been parsed and written without any changes. Metadata
+        isn't copied.
+
+        :param add_newline: if True a newline is added to the end of the file
+        """
+        if self.manifest is not None:
+            digest = self.manifest.source_hash(src)
+            if add_newline:
+                digest += ':newline'
+
+            if self.manifest.output_unchanged(dest, digest):
+                self._keep(dest)
+                return
+
+        key = ('text', src)
+        if self._link(dest, key):
+            return
+
+        if self._formats(dest):
+            code = src.read_text(encoding=self.encoding)
+            if add_newline:
+                code += "\n"
+
+            code = self.formatter.format(code, dest)
+            self._write_bytes(dest, code.encode(self.encoding))
+        elif add_newline:
+            if not self._same(dest, src.read_bytes() + b"\n"):
+                _unshare(dest)
+                _fast_copy(src, dest)
+                with open(dest, "ab") as f:
+                    f.write(b"\n")
+
+                self._wrote(dest)
+        elif not self._same_file(src, dest):
+            _unshare(dest)
+            _fast_copy(src, dest)
+            self._wrote(dest)
+
+        self._remember(dest, key)
+
+    @contextmanager
+    def open_stream(self, dest):
+        """Context manager for writing `dest` a piece at a time, yields a
+        function that takes the strings to write. Used for files too large to
+        render in memory, their content is never linked. If the file needs
+        formatting it is done once the whole file is written. When comparing,
+        the content goes to a temporary file first."""
+        target = dest
+        if self.compare and dest.exists():
+            target = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+        else:
+            _unshare(dest)
+
+        digest = hashlib.sha256() if self.manifest is not None else None
+        try:
+            with open(target, "w", encoding=self.encoding) as f:
+                if digest is None:
+                    yield f.write
+                else:
+                    def write(text):
+                        f.write(text)
+                        digest.update(text.encode(self.encoding))
+
+                    yield write
+        except BaseException:
+            if target != dest:
+                target.unlink(missing_ok=True)
+            raise
+
+        if digest is not None:
+            self.manifest.output_unchanged(dest, digest.hexdigest())
+
+        if self._formats(dest):
+            self.formatter.format_file(target, self.encoding)
+
+        if target != dest:
+            if self._same_file(target, dest):
+                target.unlink()
+                return
+
+            # Replacing the name leaves any hard linked copies alone
+            os.replace(target, dest)
+
+        self._wrote(dest)
+
+    def _formats(self, dest):
+        return self.formatter is not None and self.formatter.applies(dest)
+
+    def _encode(self, content):
+        last, data = self._encoded
+        if content is not last:
+            data = content.encode(self.encoding)
+            self._encoded = (content, data)
+
+        return data
+
+    def _write_bytes(self, dest, data):
+        # Returns True if `dest` was written, False if it was the same
+        if self._same(dest, data):
+            return False
+
+        _unshare(dest)
+        with open(dest, "wb") as f:
+            f.write(data)
+
+        self._wrote(dest)
+        return True
+
+    # --- Change tracking
+    def _keep(self, dest):
+        self.unchanged += 1
+        if self.compare:
+            self.outputs.add(str(dest))
+
+    def _wrote(self, dest):
+        self.written += 1
+        if self.compare:
+            self.outputs.add(str(dest))
+
+    def _same(self, dest, data):
+        # Returns True if comparing and `dest` already holds the bytes `data`
+        if not self.compare:
+            return False
+
+        try:
+            if dest.stat().st_size != len(data):
+                return False
+
+            with open(dest, "rb") as f:
+                same = f.read() == data
+        except FileNotFoundError:
+            return False
+
+        if same:
+            self._keep(dest)
+
+        return same
+
+    def _same_file(self, src, dest):
+        # Returns True if comparing and `dest` has the same content as `src`
+        if not self.compare:
+            return False
+
+        try:
+            same = filecmp.cmp(src, dest, shallow=False)
+        except FileNotFoundError:
+            return False
+
+        if same:
+            self._keep(dest)
+
+        return same
+
+    def remove_others(self, output_dir):
+        """Removes everything in `output_dir` that wasn't produced by this
+        writer, used in place of deleting the whole directory when
+        comparing. Only possible when :attr:`compare` is set.
+
+        :returns: number of files removed
+        """
+        removed = 0
+        for root, dirs, files in os.walk(output_dir, topdown=False):
+            for name in files:
+                path = os.path.join(root, name)
+                if path not in self.outputs:
+                    os.unlink(path)
+                    removed += 1
+
+            for name in dirs:
+                path = os.path.join(root, name)
+                if path not in self.outputs and os.path.islink(path):
+                    os.unlink(path)
+                elif path not in self.outputs and not os.listdir(path):
+                    os.rmdir(path)
+
+        return removed
+
+    def close_chapter(self, output_path):
+        """Called once a chapter has been written, there is nothing to
+        finish for directories."""
+
+    def close(self):
+        """Called once everything has been written."""
+
+    # --- Results from worker processes
+    def take_results(self):
+        results = (self.written, self.unchanged, self.outputs)
+        self.written = 0
+        self.unchanged = 0
+        self.outputs = set()
+
+        if self.manifest is not None:
+            return results, self.manifest.take_results()
+
+        return results, None
+
+    def merge_results(self, results):
+        (written, unchanged, outputs), results = results
+        self.written += written
+        self.unchanged += unchanged
+        self.outputs.update(outputs)
+
+        if results is not None:
+            self.manifest.merge_results(results)
+
+    # --- Linking
+    def _remember(self, dest, key):
+        if self.link_mode != 'copy' and key is not None:
+            self._firsts.setdefault(key, dest)
+
+    def _link(self, dest, key):
+        # Returns True if dest was created as a link to an identical file
+        if self.link_mode == 'copy' or key is None:
+            return False
+
+        first = self._firsts.get(key)
+        if first is None:
+            return False
+
+        if self._same_file(first, dest):
+            return True
+
+        try:
+            dest.unlink(missing_ok=True)
+            if self.link_mode == 'hardlink':
+                os.link(first, dest)
+            else:
+                _reflink(first, dest)
+                shutil.copystat(first, dest)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+
+            print(f"Can't {self.link_mode} {dest} ({e.strerror}), falling "
+                "back to copying files")
+            self.link_mode = 'copy'
+            self._firsts = {}
+            return False
+
+        self._wrote(dest)
+        return True
@@ -0,0 +1,95 @@
+import io
+from pathlib import Path
+import shutil
+import tarfile
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import zipfile
+
+import tomli
+
+from julienne.archives import ArchiveWriter
+from julienne.filemodel import generate_files, FileTree
+
+# ============================================================================
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        here = Path(__file__).parent
+        self.config_path = here / Path('data/sample.toml')
+        self.config = tomli.loads(self.config_path.read_text())
+        self.code = here / Path('data/code')
+        self.expected = here / Path('data/expected')
+
+    def expected_files(self):
+        # Maps member names to the content they should have
+        return {path.relative_to(self.expected).as_posix(): path.read_bytes()
+            for path in self.expected.rglob('*') if path.is_file()}
+
+    def test_zip(self):
+        with TemporaryDirectory() as td:
+            output = Path(td)
+            tree = FileTree(self.config, self.config_path.parent, self.code)
+            writer = ArchiveWriter(output, 'zip')
+            tree.generate(output, jobs=2, writer=writer)
+
+            found = {}
+            for path in output.glob('*.zip'):
+                with zipfile.ZipFile(path) as zf:
+                    for info in zf.infolist():
+                        self.assertTrue(info.filename.startswith(path.stem))
+                        if not info.is_dir():
+                            found[info.filename] = zf.read(info)
+
+            self.assertEqual(self.expected_files(), found)
+            self.assertEqual(len(found), writer.written)
+            self.assertFalse((output / 'chap1').exists())
+
+    def test_tar_gz(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            shutil.copytree(self.code, tmp / 'code')
+            path = tmp / 'sample.toml'
+            path.write_text('output_format = "tar.gz"\n'
+                + self.config_path.read_text())
+
+            generate_files(str(path))
+            output = tmp / 'last_output'
+            self.assertEqual(6, len(list(output.glob('*.tar.gz'))))
+
+            with tarfile.open(output / 'chapFour.tar.gz') as tf:
+                data = tf.extractfile('chapFour/code/mixed.py').read()
+                names = tf.getnames()
+
+            expected = self.expected / 'chapFour/code/mixed.py'
+            self.assertEqual(expected.read_bytes(), data)
+            self.assertIn('chapFour/code/after4', names)
+
+            # Bad formats are caught
+            path.write_text('output_format = "rar"\n'
+                + self.config_path.read_text())
+            with self.assertRaises(ValueError):
+                generate_files(str(path))
+
+    def test_stream(self):
+        with TemporaryDirectory() as td:
+            output = Path(td)
+            stream = io.BytesIO()
+            tree = FileTree(self.config, self.config_path.parent, self.code)
+            writer = ArchiveWriter(output, stream=stream)
+            tree.generate(output, jobs=3, writer=writer)
+            self.assertEqual([], list(output.iterdir()))
+
+            # Everything is in one archive, repeated content is a link
+            stream.seek(0)
+            found = {}
+            links = 0
+            with tarfile.open(fileobj=stream) as tf:
+                for info in tf:
+                    if info.islnk():
+                        links += 1
+                    if info.isfile() or info.islnk():
+                        found[info.name] = tf.extractfile(info).read()
+
+            self.assertEqual(self.expected_files(), found)
+            self.assertEqual(18, links)
@@ -0,0 +1,62 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from julienne.cache import ParseCache
+from julienne.nodes import PoundFileNode
+
+# ============================================================================
+
+CODE = """\
+a = 1
+b = 2  #@= 2-3
+"""
+
+def fail_parse(content, style):
+    # Stand-in for the real parser
+    raise AssertionError("Parser called on a cached file")
+
+# ----------------------------------------------------------------------------
+
+class ParseCacheTestCase(TestCase):
+
+    def test_cache(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            path = tmp / 'code.py'
+            path.write_text(CODE)
+            cache = ParseCache(tmp / 'cache')
+
+            node = PoundFileNode(path)
+            node.parse_file(cache)
+            self.assertEqual((2, 3, 3), (node.bottom, node.top, node.biggest))
+            self.assertEqual(1, len(list(cache.path.glob('*/*.pickle'))))
+
+            # Second parse comes from the cache, parser isn't used
+            cached = PoundFileNode(path)
+            cached._parser_fn = fail_parse
+            cached.parse_file(cache)
+
+            self.assertEqual((2, 3, 3, False), (cached.bottom, cached.top,
+                cached.biggest, cached.all_conditional))
+            self.assertEqual(node.parser.render(2), cached.parser.render(2))
+
+            # Changing the content misses the cache
+            path.write_text(CODE + "c = 3\n")
+            node = PoundFileNode(path)
+            node.parse_file(cache)
+            self.assertEqual("a = 1\nc = 3\n", node.parser.render(1))
+            self.assertEqual(2, len(list(cache.path.glob('*/*.pickle'))))
+
+    def test_evict(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            cache = ParseCache(tmp / 'cache', max_size=0.001)
+
+            for num in range(5):
+                cache.put(cache.key(str(num).encode(), 'test'), 'x' * 500)
+
+            self.assertEqual(3, cache.evict())
+            total = sum(p.stat().st_size for p in
+                cache.path.glob('*/*.pickle'))
+            self.assertLessEqual(total, cache.max_size)
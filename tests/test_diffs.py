@@ -0,0 +1,132 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import shutil
+import subprocess
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipIf
+
+import tomli
+
+from julienne.diffs import chapter_diff, write_patches, ChapterChange
+from julienne.filemodel import FileTree, generate_files
+from julienne.parsers import parse_pound_content
+
+# ============================================================================
+
+CONTENT = """\
+a = 1
+b = 2  #@= 2-
+c = 3  #@= -1
+d = 4
+"""
+
+class DiffTestCase(TestCase):
+    def setUp(self):
+        here = Path(__file__).parent
+        self.config_path = here / Path('data/sample.toml')
+        self.config = tomli.loads(self.config_path.read_text())
+        self.code = here / Path('data/code')
+        self.expected = here / Path('data/expected')
+
+    def test_changes(self):
+        parser = parse_pound_content(CONTENT)
+        self.assertEqual([], parser.changes(2, 3))
+
+        # Positions are the lines before the changed one in each chapter
+        self.assertEqual([(1, 1, 1, False), (2, 1, 2, True)],
+            parser.changes(1, 2))
+        self.assertEqual([(1, 1, 1, True), (2, 2, 1, False)],
+            parser.changes(2, 1))
+
+    def test_index(self):
+        tree = FileTree(self.config, self.config_path.parent, self.code)
+        self.assertEqual(5, len(tree.changes(1)))
+        self.assertEqual([], tree.changes(7))
+
+        changes = {change.path: change for change in tree.changes(3)}
+        self.assertEqual(ChapterChange('code/mixed.py', 'changed',
+            [(8, 9), (14, 16)], [(5, 5), (8, 8), (12, 13)]),
+            changes['code/mixed.py'])
+        self.assertEqual('removed',
+            changes['code/between24/two_only.py'].status)
+        self.assertNotIn('code/copy24.txt', changes)
+
+        changes = {change.path: change.status for change in tree.changes(4)}
+        self.assertEqual('added', changes['code/after4/amixed.py'])
+        self.assertEqual('removed', changes['code/condi.py'])
+
+        # Trees built for one chapter don't have the others to compare with
+        tree = FileTree(self.config, self.config_path.parent, self.code,
+            chapter=3)
+        with self.assertRaises(ValueError):
+            tree.changes(3)
+
+        # Same answers without keeping the parse results
+        tree = FileTree(self.config, self.config_path.parent, self.code,
+            file_major=True)
+        self.assertEqual([(8, 9), (14, 16)], {change.path: change for change
+            in tree.changes(3)}['code/mixed.py'].added)
+
+    def test_diff(self):
+        tree = FileTree(self.config, self.config_path.parent, self.code)
+        self.assertEqual('', chapter_diff(tree, 5, 5))
+
+        diff = chapter_diff(tree, 1, 2)
+        self.assertIn('--- chap1/code/mixed.py\n+++ chap2/code/mixed.py\n'
+            '@@ -3,6 +3,7 @@\n', diff)
+        self.assertIn('+d = "In chapters 2 on"\n', diff)
+        self.assertIn('--- /dev/null\n+++ chap2/code/copy24.txt\n', diff)
+        self.assertNotIn('readme.txt', diff)
+
+        # Trees built for one chapter can't be compared
+        tree = FileTree(self.config, self.config_path.parent, self.code,
+            chapter=2)
+        with self.assertRaises(ValueError):
+            chapter_diff(tree, 1, 2)
+        with TemporaryDirectory() as td:
+            with self.assertRaises(ValueError):
+                write_patches(tree, Path(td) / 'patches')
+
+            self.assertEqual([], list(Path(td).iterdir()))
+
+        # Same result through the command's entry point
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            shutil.copytree(self.code, tmp / 'code')
+            path = tmp / 'sample.toml'
+            path.write_text(self.config_path.read_text())
+
+            out = io.StringIO()
+            with redirect_stdout(out):
+                generate_files(str(path), diff=(1, 2))
+
+            self.assertEqual(diff, out.getvalue())
+            self.assertFalse((tmp / 'last_output').exists())
+
+    @skipIf(shutil.which('patch') is None, "patch not installed")
+    def test_patches(self):
+        tree = FileTree(self.config, self.config_path.parent, self.code)
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            paths = write_patches(tree, tmp / 'patches')
+            self.assertEqual(5, len(paths))
+            self.assertEqual('chap3-chapFour.patch', paths[2].name)
+
+            # Applying the patches in turn steps through every chapter
+            work = tmp / 'work'
+            shutil.copytree(self.expected / 'chap1', work)
+            for path in paths:
+                subprocess.run(['patch', '-p1', '-s', '-i', str(path)],
+                    cwd=work, check=True)
+
+                expected = self.expected / path.stem.split('-', 1)[1]
+                found = {p.relative_to(work): p.read_bytes() for p in
+                    work.rglob('*') if p.is_file()}
+                wanted = {p.relative_to(expected): p.read_bytes() for p in
+                    expected.rglob('*') if p.is_file()}
+                self.assertEqual(wanted, found)
+
+            # A selection compares the chapters it lists
+            paths = write_patches(tree, tmp / 'some', [1, 6])
+            self.assertEqual(['chap1-chap6.patch'], [p.name for p in paths])
@@ -1,9 +1,18 @@
 from difflib import Differ
 from filecmp import cmp
 from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
-from julienne.filemodel import generate_files
+import tomli
+
+from julienne.filemodel import generate_files, FileTree, _walk_node
+from julienne.formatters import format_code
+from julienne.manifest import MANIFEST_NAME
+from julienne.nodes import _BaseFileNode
+from julienne.writers import FileWriter
 
 # ============================================================================
 
@@ -51,6 +60,327 @@ class SampleFilesTestCase(TestCase):
 
         self.assert_directory_match(expected, output)
 
+    def test_jobs(self):
+        here = Path(__file__).parent
+        output = here / Path('data/last_output')
+
+        # Generating with a process pool must give the same results as the
+        # serial run
+        path = here / Path('data/sample.toml')
+        tree = generate_files(str(path), jobs=3)
+        self.assertEqual(6, tree.biggest)
+
+        expected = here / Path('data/expected')
+        self.assert_directory_match(expected, output)
+
+    def test_file_major(self):
+        here = Path(__file__).parent
+        output = here / Path('data/last_output')
+
+        # Rendering a file at a time must give the same results as rendering
+        # a chapter at a time
+        path = here / Path('data/sample.toml')
+        tree = generate_files(str(path), file_major=True)
+        self.assertEqual(6, tree.biggest)
+
+        expected = here / Path('data/expected')
+        self.assert_directory_match(expected, output)
+
+        # Parse results aren't kept around
+        for node in _walk_node(tree.root):
+            if isinstance(node, _BaseFileNode):
+                self.assertIsNone(node.parser)
+
+    def test_stream_size(self):
+        here = Path(__file__).parent
+        path = here / Path('data/sample.toml')
+        config = tomli.loads(path.read_text())
+
+        # Streaming every parsed file gives the same results, both a chapter
+        # at a time and a file at a time
+        config['stream_size'] = 0
+        for file_major in (False, True):
+            tree = FileTree(config, path.parent, here / Path('data/code'),
+                file_major=file_major)
+            self.assertEqual(6, tree.biggest)
+
+            for node in _walk_node(tree.root):
+                if isinstance(node, _BaseFileNode):
+                    self.assertTrue(node.streamed)
+                    self.assertIsNone(node.parser)
+
+            with TemporaryDirectory() as td:
+                output = Path(td)
+                tree.generate(output)
+
+                expected = here / Path('data/expected')
+                self.assert_directory_match(expected, output)
+
+    def test_single_chapter(self):
+        here = Path(__file__).parent
+        path = here / Path('data/sample.toml')
+        config = tomli.loads(path.read_text())
+        code = here / Path('data/code')
+
+        # Ranged files and directories outside of the chapter are left out,
+        # nothing is loaded until it gets rendered
+        tree = FileTree(config, path.parent, code, chapter=1)
+        names = {node.path.name for node in tree.root.children}
+        self.assertNotIn('between24', names)
+        self.assertNotIn('only24.py', names)
+        self.assertNotIn('after4', names)
+        self.assertIn('maxi.py', names)
+
+        for node in _walk_node(tree.root):
+            if isinstance(node, _BaseFileNode):
+                self.assertFalse(node.loaded)
+
+        with TemporaryDirectory() as td:
+            output = Path(td)
+            tree.generate(output, single_chapter=1)
+
+            expected = here / Path('data/expected/chap1')
+            self.assert_directory_match(expected, output / 'ch1')
+
+            with self.assertRaises(ValueError):
+                tree.generate(output, single_chapter=2)
+
+        # Chapters inside the ranges get them
+        tree = FileTree(config, path.parent, code, chapter=4)
+        with TemporaryDirectory() as td:
+            output = Path(td)
+            tree.generate(output, single_chapter=4)
+
+            expected = here / Path('data/expected/chapFour')
+            self.assert_directory_match(expected, output / 'ch4')
+
+        # Biggest is still available, but only covers what is in the tree
+        self.assertEqual(6, tree.biggest)
+
+    def test_chapters(self):
+        here = Path(__file__).parent
+        path = here / Path('data/sample.toml')
+        config = tomli.loads(path.read_text())
+        tree = FileTree(config, path.parent, here / Path('data/code'))
+
+        self.assertEqual([2, 3, 5, 6], tree.select_chapters("2-3, 5-"))
+        self.assertEqual([1, 4], tree.select_chapters("-1,4,4"))
+        self.assertEqual([], tree.select_chapters("9-"))
+
+        # Only the selected chapters are generated, named as in a full run
+        with TemporaryDirectory() as td:
+            output = Path(td)
+            paths = tree.generate(output, selection=[3, 4])
+            self.assertEqual(['chap3', 'chapFour'], [p.name for p in paths])
+            self.assertEqual({'chap3', 'chapFour'},
+                {p.name for p in output.iterdir()})
+
+            expected = here / Path('data/expected')
+            for name in ['chap3', 'chapFour']:
+                self.assert_directory_match(expected / name, output / name)
+
+    def test_link_mode(self):
+        here = Path(__file__).parent
+        path = here / Path('data/sample.toml')
+        config = tomli.loads(path.read_text())
+        tree = FileTree(config, path.parent, here / Path('data/code'))
+
+        with TemporaryDirectory() as td:
+            output = Path(td)
+            tree.generate(output, writer=FileWriter('hardlink'))
+
+            expected = here / Path('data/expected')
+            self.assert_directory_match(expected, output)
+
+            # Copy only files and unchanging parsed files are linked
+            path = output / 'chap1/code/copy_only.txt'
+            self.assertEqual(6, path.stat().st_nlink)
+
+            path = output / 'chap2/code/only24.py'
+            self.assertEqual(3, path.stat().st_nlink)
+
+    def test_incremental(self):
+        here = Path(__file__).parent
+        expected = here / Path('data/expected')
+
+        with TemporaryDirectory() as td:
+            # Build a copy of the sample project that can be changed
+            tmp = Path(td)
+            shutil.copytree(here / Path('data/code'), tmp / 'code')
+            config = here / Path('data/sample.toml')
+            path = tmp / 'sample.toml'
+            path.write_text("incremental = true\n" + config.read_text())
+            output = tmp / 'last_output'
+
+            generate_files(str(path))
+            manifest = output / MANIFEST_NAME
+            self.assertTrue(manifest.exists())
+            manifest.rename(tmp / MANIFEST_NAME)
+            self.assert_directory_match(expected, output)
+            (tmp / MANIFEST_NAME).rename(manifest)
+
+            # Nothing changed, nothing gets written
+            before = {p: p.stat().st_mtime_ns for p in output.rglob('*')
+                if p.is_file() and p != manifest}
+            generate_files(str(path))
+            after = {p: p.stat().st_mtime_ns for p in output.rglob('*')
+                if p.is_file() and p != manifest}
+            self.assertEqual(before, after)
+
+            # Change one file, only its outputs get written
+            mixed = tmp / 'code/mixed.py'
+            mixed.write_text(mixed.read_text() + "z = 1\n")
+            generate_files(str(path))
+            for p in output.rglob('*'):
+                if p.is_file() and p != manifest:
+                    if p.name == 'mixed.py':
+                        self.assertTrue(p.read_text().endswith("z = 1\n"))
+                    else:
+                        self.assertEqual(before[p], p.stat().st_mtime_ns)
+
+            # Removed sources have their outputs removed
+            shutil.rmtree(tmp / 'code/after4')
+            generate_files(str(path))
+            self.assertFalse((output / 'chapFour/code/after4').exists())
+            self.assertTrue((output / 'chapFour/code/mixed.py').exists())
+
+    def test_formatters(self):
+        here = Path(__file__).parent
+        expected = here / Path('data/expected')
+
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            shutil.copytree(here / Path('data/code'), tmp / 'code')
+            config = here / Path('data/sample.toml')
+            path = tmp / 'sample.toml'
+            path.write_text("black = true\nincremental = true\n"
+                + config.read_text())
+            output = tmp / 'last_output'
+
+            generate_files(str(path), jobs=2, cache_dir=tmp / 'cache')
+            for result in output.rglob('*.py'):
+                source = expected / result.relative_to(output)
+                self.assertEqual(format_code(source.read_text(),
+                    use_black=True), result.read_text())
+
+            # Formatted results are cached, unchanged files aren't formatted
+            # again
+            mixed = tmp / 'code/mixed.py'
+            mixed.write_text(mixed.read_text() + "z = {  'a':1 }\n")
+            with patch('julienne.formatters.format_code',
+                    wraps=format_code) as mock:
+                generate_files(str(path), cache_dir=tmp / 'cache')
+                count = mock.call_count
+                self.assertEqual(5, count)
+
+                path.write_text(path.read_text() + "\n")
+                generate_files(str(path), cache_dir=tmp / 'cache')
+                self.assertEqual(count, mock.call_count)
+
+            result = output / 'chap1/code/mixed.py'
+            self.assertTrue(result.read_text().endswith('z = {"a": 1}\n'))
+
+    def test_skip_unchanged(self):
+        here = Path(__file__).parent
+        expected = here / Path('data/expected')
+
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            shutil.copytree(here / Path('data/code'), tmp / 'code')
+            config = here / Path('data/sample.toml')
+            path = tmp / 'sample.toml'
+            path.write_text(config.read_text())
+            output = tmp / 'last_output'
+
+            generate_files(str(path), skip_unchanged=True)
+            self.assert_directory_match(expected, output)
+
+            # Only changed outputs get written, with delete_output anything
+            # else in the output is removed
+            before = {p: p.stat().st_mtime_ns for p in output.rglob('*')
+                if p.is_file()}
+            (output / 'chap1/extra.txt').write_text("extra")
+            mixed = tmp / 'code/mixed.py'
+            mixed.write_text(mixed.read_text() + "z = 1\n")
+
+            generate_files(str(path), skip_unchanged=True)
+            self.assertFalse((output / 'chap1/extra.txt').exists())
+            for p, mtime in before.items():
+                if p.name == 'mixed.py':
+                    self.assertTrue(p.read_text().endswith("z = 1\n"))
+                else:
+                    self.assertEqual(mtime, p.stat().st_mtime_ns)
+
+    def test_encoding(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            code = tmp / 'code'
+            code.mkdir()
+            content = "a = 'caf\u00e9'\nb = '\u00e0 bient\u00f4t'  #@= 2\n"
+            (code / 'mixed.py').write_bytes(content.encode('latin-1'))
+            (code / 'plain.py').write_bytes("c = '\u00e9'\n".encode('latin-1'))
+
+            config = {'encoding': 'latin-1'}
+            tree = FileTree(config, tmp, code)
+            output = tmp / 'output'
+            tree.generate(output, writer=FileWriter(encoding=tree.encoding))
+
+            result = output / 'ch1/code/mixed.py'
+            self.assertEqual("a = 'caf\u00e9'\n".encode('latin-1'),
+                result.read_bytes())
+            result = output / 'ch2/code/mixed.py'
+            self.assertEqual(content.replace('  #@= 2', '').encode('latin-1'),
+                result.read_bytes())
+            result = output / 'ch2/code/plain.py'
+            self.assertEqual("c = '\u00e9'\n".encode('latin-1'),
+                result.read_bytes())
+
+            # Markers aren't the same bytes as in ASCII, nothing is copied
+            # as is
+            content = "a = 1\nb = 2  #@= 2\n"
+            (code / 'mixed.py').write_bytes(content.encode('utf-16'))
+            (code / 'plain.py').write_bytes("c = 3".encode('utf-16'))
+
+            config = {'encoding': 'utf-16'}
+            tree = FileTree(config, tmp, code)
+            self.assertEqual(2, tree.biggest)
+            output = tmp / 'utf16'
+            tree.generate(output, writer=FileWriter(encoding=tree.encoding))
+
+            result = output / 'ch1/code/mixed.py'
+            self.assertEqual("a = 1\n".encode('utf-16'), result.read_bytes())
+            result = output / 'ch2/code/mixed.py'
+            self.assertEqual("a = 1\nb = 2\n".encode('utf-16'),
+                result.read_bytes())
+            result = output / 'ch2/code/plain.py'
+            self.assertEqual("c = 3\n".encode('utf-16'), result.read_bytes())
+
+    def test_ignore_file(self):
+        here = Path(__file__).parent
+        path = here / Path('data/sample.toml')
+        config = tomli.loads(path.read_text())
+
+        with TemporaryDirectory() as td:
+            # Ignore files are relative to where they live, use one above the
+            # source directory
+            tmp = Path(td)
+            base_dir = tmp / 'code'
+            shutil.copytree(here / Path('data/code'), base_dir)
+
+            ignore = tmp / '.gitignore'
+            ignore.write_text("after4/\n*.txt\n!copy_only.txt\n")
+            config['ignore_file'] = str(ignore)
+
+            tree = FileTree(config, path.parent, base_dir)
+
+        names = {str(node.path.relative_to(base_dir)) for node in
+            _walk_node(tree.root)}
+        self.assertIn('copy_only.txt', names)
+        self.assertIn('under/umixed.py', names)
+        self.assertNotIn('copy24.txt', names)
+        self.assertNotIn('under/ucopy_only.txt', names)
+        self.assertNotIn('after4/amixed.py', names)
+
     def test_failures(self):
         here = Path(__file__).parent
         path = here / Path('data/fail.toml')
@@ -62,6 +392,16 @@ class SampleFilesTestCase(TestCase):
         self.assertIn("bad_code/bad_marker.py", str(error))
         self.assertIn("Unknown marker type", str(error))
 
+        # Single chapter trees load files as they are rendered, errors still
+        # name the file
+        with self.assertRaises(Exception) as context:
+            generate_files(str(path), single_chapter=1)
+
+        error = context.exception
+        self.assertIn("Error parsing", str(error))
+        self.assertIn("bad_code/bad_marker.py", str(error))
+        self.assertIn("Unknown marker type", str(error))
+
     def test_darkgrey(self):
         here = Path(__file__).parent
         output = here / Path('data/darkgrey/last_output')
@@ -0,0 +1,137 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from julienne import formatters
+from julienne.cache import ParseCache
+from julienne.formatters import format_code, Formatter
+from julienne.writers import FileWriter
+
+# ============================================================================
+
+UGLY = "import sys\nimport os\nx = {  'a':1 }\n"
+PRETTY = "import os\nimport sys\n\nx = {\"a\": 1}\n"
+
+# ----------------------------------------------------------------------------
+
+class FormattersTestCase(TestCase):
+
+    def test_format_code(self):
+        self.assertEqual(UGLY, format_code(UGLY))
+        self.assertEqual(PRETTY, format_code(UGLY, True, True))
+        self.assertTrue(format_code(UGLY, use_isort=True).startswith(
+            "import os\nimport sys\n"))
+
+    def test_settings(self):
+        code = "from os import path, sep\nx = 'a'\n"
+        skipped = "# isort: skip_file\nimport sys\nimport os\nx = {  1:2 }\n"
+
+        # Files isort is told to skip still get formatted by black
+        formatter = Formatter(True, True)
+        self.assertEqual(
+            "# isort: skip_file\nimport sys\nimport os\n\nx = {1: 2}\n",
+            formatter.format(skipped))
+
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            (tmp / 'pyproject.toml').write_text("[tool.black]\n"
+                "skip-string-normalization = true\n\n"
+                "[tool.isort]\nforce_single_line = true\n")
+
+            # Project settings are found from the output directory, even one
+            # that doesn't exist yet
+            formatter = Formatter(True, True, settings_path=tmp / 'output')
+            self.assertEqual("from os import path\nfrom os import sep\n\n"
+                "x = 'a'\n", formatter.format(code))
+
+            # Different settings have a different cache identity
+            kind = formatter.kind
+            other = tmp / 'other'
+            other.mkdir()
+            (other / 'pyproject.toml').write_text("[tool.black]\n\n"
+                "[tool.isort]\nline_length = 80\n")
+            formatter = Formatter(True, True, settings_path=other)
+            self.assertNotEqual(kind, formatter.kind)
+            self.assertEqual('from os import path, sep\n\nx = "a"\n',
+                formatter.format(code))
+
+    def test_formatter(self):
+        calls = []
+        def counting(code, *args):
+            calls.append(code)
+            return format_code(code, *args)
+
+        with TemporaryDirectory() as td:
+            cache = ParseCache(Path(td) / 'cache')
+
+            # Identical code is only formatted once
+            formatter = Formatter(True, True, cache)
+            with patch.object(formatters, 'format_code', counting):
+                self.assertEqual(PRETTY, formatter.format(UGLY))
+                self.assertEqual(PRETTY, formatter.format(UGLY))
+                self.assertEqual("y = 2\n", formatter.format("y=2\n"))
+
+            self.assertEqual(2, len(calls))
+
+            # Later runs get the results from the cache
+            formatter = Formatter(True, True, cache)
+            with patch.object(formatters, 'format_code', counting):
+                self.assertEqual(PRETTY, formatter.format(UGLY))
+
+            self.assertEqual(2, len(calls))
+
+            # Different options don't share results
+            formatter = Formatter(use_black=True, cache=cache)
+            self.assertNotIn('isort', formatter.kind)
+            with patch.object(formatters, 'format_code', counting):
+                formatter.format(UGLY)
+
+            self.assertEqual(3, len(calls))
+
+        # Bad code is reported and left alone, without being remembered as
+        # a result
+        with TemporaryDirectory() as td:
+            cache = ParseCache(Path(td) / 'cache')
+            formatter = Formatter(use_black=True, cache=cache)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                self.assertEqual("def (:\n", formatter.format("def (:\n",
+                    'x'))
+                self.assertEqual("def (:\n", formatter.format("def (:\n",
+                    'y'))
+
+            self.assertIn('cannot format x', output.getvalue())
+            self.assertIn('cannot format y', output.getvalue())
+            self.assertEqual({}, formatter._memo)
+            key = cache.key("def (:\n".encode(), formatter.kind)
+            self.assertIsNone(cache.get(key))
+
+        formatter = Formatter()
+        self.assertFalse(formatter.applies(Path('a.py')))
+        formatter = Formatter(use_black=True)
+        self.assertTrue(formatter.applies(Path('a.py')))
+        self.assertFalse(formatter.applies(Path('a.txt')))
+
+    def test_writer(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            source = tmp / 'source.py'
+            source.write_text(UGLY)
+            output = tmp / 'output'
+            output.mkdir()
+
+            writer = FileWriter(formatter=Formatter(True, True))
+            writer.write(output / 'a.py', UGLY)
+            writer.write(output / 'a.txt', UGLY)
+            writer.copy(source, output / 'b.py')
+            writer.copy_text(source, output / 'c.py')
+            with writer.open_stream(output / 'd.py') as write:
+                write(UGLY)
+
+            for name in ['a.py', 'b.py', 'c.py', 'd.py']:
+                self.assertEqual(PRETTY, (output / name).read_text())
+
+            self.assertEqual(UGLY, (output / 'a.txt').read_text())
@@ -0,0 +1,77 @@
+import io
+from pathlib import Path
+import shutil
+import subprocess
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipIf
+
+import tomli
+
+from julienne.filemodel import FileTree
+from julienne.gitstream import GitWriter, _quote
+
+# ============================================================================
+
+class GitWriterTestCase(TestCase):
+    def setUp(self):
+        here = Path(__file__).parent
+        path = here / Path('data/sample.toml')
+        config = tomli.loads(path.read_text())
+        self.tree = FileTree(config, path.parent, here / Path('data/code'))
+        self.expected = here / Path('data/expected')
+
+    def generate(self, output, **kwargs):
+        stream = io.BytesIO()
+        writer = GitWriter(output, stream, **kwargs)
+        self.tree.generate(output, jobs=2, writer=writer)
+        return writer, stream.getvalue()
+
+    def test_stream(self):
+        with TemporaryDirectory() as td:
+            output = Path(td)
+            writer, data = self.generate(output)
+            self.assertEqual([], list(output.iterdir()))
+
+            # Each distinct content is only sent once
+            contents = {path.read_bytes() for path in self.expected.rglob('*')
+                if path.is_file()}
+            self.assertEqual(len(contents), data.count(b'\nblob\n') + 1)
+            self.assertEqual(6, data.count(b'\ncommit refs/heads/main\n'))
+            self.assertEqual(1, data.count(b'deleteall'))
+
+            # Only differences from the previous chapter are listed
+            self.assertEqual(data.count(b'\nM 100'), writer.written)
+            self.assertNotEqual(0, writer.unchanged)
+
+        self.assertEqual('a b', _quote('a b'))
+        self.assertEqual('"\\"a\\nb"', _quote('"a\nb'))
+
+    @skipIf(shutil.which('git') is None, "git not installed")
+    def test_import(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            repo = tmp / 'repo'
+            subprocess.run(['git', 'init', '-q', str(repo)], check=True)
+
+            _, data = self.generate(tmp / 'output', branch='book')
+            subprocess.run(['git', '-C', str(repo), 'fast-import', '--quiet'],
+                input=data, check=True)
+
+            # Every chapter's tag has the same files as the directory version
+            for chapter in self.expected.iterdir():
+                result = subprocess.run(['git', '-C', str(repo), 'ls-tree',
+                    '-r', '--name-only', chapter.name], check=True,
+                    capture_output=True, text=True)
+                names = set(result.stdout.split())
+                expected = {path.relative_to(chapter).as_posix() for path in
+                    chapter.rglob('*') if path.is_file()}
+                self.assertEqual(expected, names)
+
+            result = subprocess.run(['git', '-C', str(repo), 'show',
+                'chapFour:code/mixed.py'], check=True, capture_output=True)
+            expected = self.expected / 'chapFour/code/mixed.py'
+            self.assertEqual(expected.read_bytes(), result.stdout)
+
+            result = subprocess.run(['git', '-C', str(repo), 'rev-list',
+                '--count', 'book'], check=True, capture_output=True, text=True)
+            self.assertEqual('6', result.stdout.strip())
@@ -0,0 +1,90 @@
+import os
+from pathlib import Path
+from unittest import TestCase
+
+from waelstow import noted_raise
+
+from julienne.matching import compile_globs, IgnoreRules
+
+# ============================================================================
+
+PATTERNS = [
+    ['**/*.py', ],
+    ['**/*.xml', '**/*.htm', '**/*.html'],
+    ['*.py', ],
+    ['under/*.py', ],
+    ['**/b*.py', '**/*.txt'],
+    ['**/[a-c]*.py', ],
+    ['**/[!a-c]*.py', ],
+    ['*/?mixed.py', ],
+    ['**/under/**/*.txt', ],
+    ['./*.html', ],
+]
+
+class MatchingTestCase(TestCase):
+
+    def test_compile_globs(self):
+        base = Path(__file__).parent / Path('data/code')
+
+        # Every file in the tree, relative and "/" separated
+        files = []
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                files.append(path.relative_to(base).as_posix())
+
+        # Matching has to be the same as Path.glob()
+        for patterns in PATTERNS:
+            with noted_raise("[patterns={patterns}]"):
+                expected = set()
+                for pattern in patterns:
+                    expected.update(p.relative_to(base).as_posix() for p in
+                        base.glob(pattern) if p.is_file())
+
+                regex = compile_globs(patterns)
+                result = {name for name in files if regex.fullmatch(name)}
+                self.assertEqual(expected, result)
+
+        self.assertIsNone(compile_globs([]))
+
+    def test_ignore_rules(self):
+        root = os.sep + 'proj'
+        path = lambda rel: root + os.sep + rel.replace('/', os.sep)
+
+        rules = IgnoreRules(root, """\
+# A comment
+__pycache__/
+*.log
+!keep.log
+/build
+docs/**
+src/**/gen_*.py
+\\#literal
+""".splitlines())
+
+        tests = [
+            ('__pycache__', True, True),
+            ('a/b/__pycache__', True, True),
+            ('__pycache__', False, False),
+            ('x.log', False, True),
+            ('a/x.log', False, True),
+            ('keep.log', False, False),
+            ('a/keep.log', False, False),
+            ('build', True, True),
+            ('a/build', True, False),
+            ('docs', True, False),
+            ('docs/index.html', False, True),
+            ('docs/api/index.html', False, True),
+            ('src/gen_x.py', False, True),
+            ('src/a/b/gen_x.py', False, True),
+            ('src/a/x.py', False, False),
+            ('#literal', False, True),
+        ]
+
+        for rel, is_dir, expected in tests:
+            with noted_raise("[rel={rel}]"):
+                self.assertEqual(expected, rules.ignored(path(rel), is_dir))
+
+        # Paths outside the root are never ignored
+        self.assertFalse(rules.ignored(os.sep + 'other' + os.sep + 'x.log',
+            False))
@@ -0,0 +1,67 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from julienne.nodes import PoundFileNode, XMLFileNode
+from julienne.writers import FileWriter
+
+# ============================================================================
+
+class FileNodeTestCase(TestCase):
+
+    def _generate(self, node_class, content):
+        # Writes content to a file, then parses and copies it for chapter 1,
+        # returns the node and the output bytes
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            src = tmp / 'src'
+            src.mkdir()
+            out = tmp / 'out'
+            out.mkdir()
+
+            path = src / 'sample'
+            path.write_bytes(content)
+
+            node = node_class(path)
+            node.parse_file()
+            node.copy(1, src, out, FileWriter())
+
+            return node, (out / 'sample').read_bytes()
+
+    def test_verbatim(self):
+        # Files without markers are copied, trailing newline is guaranteed
+        for content, expected in [
+                (b"a = 1\nb = 2\n", b"a = 1\nb = 2\n"),
+                (b"a = 1\nb = 2", b"a = 1\nb = 2\n"),
+                (b"", b"\n"),
+                (b"a = 1\n\n", b"a = 1\n\n"),
+                (b"# comment with @ in it\n", b"# comment with @ in it\n"),
+            ]:
+            node, result = self._generate(PoundFileNode, content)
+            self.assertTrue(node.verbatim)
+            self.assertIsNone(node.parser)
+            self.assertFalse(node.all_conditional)
+            self.assertEqual(expected, result)
+
+        # Carriage returns get translated, so need parsing
+        node, result = self._generate(PoundFileNode, b"a = 1\r\nb = 2\r\n")
+        self.assertFalse(node.verbatim)
+        self.assertEqual(b"a = 1\nb = 2\n", result)
+
+        # Files with markers are parsed
+        node, result = self._generate(PoundFileNode, b"a = 1\nb = 2 #@= 2\n")
+        self.assertFalse(node.verbatim)
+        self.assertEqual(b"a = 1\n", result)
+
+        node, result = self._generate(XMLFileNode, b"<p>\n</p>")
+        self.assertTrue(node.verbatim)
+        self.assertEqual(b"<p>\n</p>\n", result)
+
+        node, result = self._generate(XMLFileNode,
+            b"<p>\n<b><!--@= 2 -->\n")
+        self.assertFalse(node.verbatim)
+        self.assertEqual(b"<p>\n", result)
+
+        # A stray block closer is an error, even without an opener
+        with self.assertRaises(ValueError):
+            self._generate(XMLFileNode, b"<p>\n@+-->\n")
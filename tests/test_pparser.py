@@ -1,9 +1,14 @@
+import gc
+import io
 import textwrap
+from unittest.mock import patch
 
 from waelstow import noted_raise
 
 from tests.base import BaseParserTestCase
-from julienne.parsers import parse_pound_content
+from julienne.parsers import (parse_pound_content, iter_pound_lines,
+    emit_pound_lines, scan_lines, range_token, chapter_ranges, POUND_STYLE,
+    XML_STYLE)
 
 # ============================================================================
 
@@ -185,3 +190,142 @@ class PoundParserTestCase(BaseParserTestCase):
         # --- Test an uncommented conditional block
         parser = parse_pound_content(CODE_BLOCK3)
         self.assertParser(parser, True, EXPECTED_BLOCK3, 2, None)
+
+    def test_render(self):
+        code = textwrap.dedent("""\
+            a = 1
+            b = 2  #@= 2-3
+            #@[ 5-
+            c = 3
+            #@]
+            d = 4  #@= 3
+        """)
+        parser = parse_pound_content(code)
+
+        # Compiled output matches a line by line render of each chapter
+        for chapter in range(1, 8):
+            expected = ""
+            for line in parser.lines:
+                content = line.get_content(chapter)
+                if content is not None:
+                    expected += content + "\n"
+
+            self.assertEqual(expected, parser.render(chapter))
+
+        # Chapter 1 and 4 have the same output, but aren't neighbours
+        self.assertEqual([1, 2, 3, 4, 5], parser.breakpoints)
+        self.assertEqual(parser.renders[0], parser.renders[3])
+
+        # Files without markers only have a single render
+        parser = parse_pound_content("x = 1\ny = 2\n")
+        self.assertEqual("x = 1\ny = 2\n", parser.render(12))
+        self.assertEqual([1], parser.breakpoints)
+
+    def test_line_view(self):
+        parser = parse_pound_content(CODE_BLOCK2)
+        lines = parser.lines
+
+        self.assertEqual(4, len(lines))
+        self.assertEqual(EXPECTED_BLOCK2[-1], lines[-1].content)
+        self.assertEqual(EXPECTED_BLOCK2[1:3],
+            [line.content for line in lines[1:3]])
+        self.assertEqual((True, 1, 2), (lines[1].conditional, lines[1].lower,
+            lines[1].upper))
+        self.assertEqual((False, None, None), (lines[0].conditional,
+            lines[0].lower, lines[0].upper))
+
+        with self.assertRaises(IndexError):
+            lines[4]
+
+        # Lines are compact, no per instance dictionary
+        self.assertFalse(hasattr(lines[0], '__dict__'))
+
+    def test_streaming(self):
+        code = textwrap.dedent("""\
+            a = 1
+            b = 2  #@= 2-3
+            #@[ 5-
+            c = 3
+            #@]
+            #@+ 1-2 block header
+            #@- d = 4
+        """)
+        parser = parse_pound_content(code)
+
+        # Streamed lines match the full parse
+        stream = iter_pound_lines(io.StringIO(code))
+        expected = [(line.content, line.conditional, line.lower, line.upper)
+            for line in parser.lines]
+        self.assertEqual(expected, list(stream))
+        self.assertEqual(parser.get_range(), stream.get_range())
+        self.assertEqual(parser.all_conditional, stream.all_conditional)
+
+        # Binary handles get decoded, results for every chapter come from a
+        # single pass
+        outputs = {chapter: io.StringIO() for chapter in range(1, 7)}
+        handle = io.BytesIO(code.encode())
+        emit_pound_lines(handle,
+            {chapter: out.write for chapter, out in outputs.items()})
+
+        for chapter, out in outputs.items():
+            self.assertEqual(parser.render(chapter), out.getvalue())
+
+        # The caller's handle is left open, even once the stream is gone
+        gc.collect()
+        self.assertFalse(handle.closed)
+        handle.seek(0)
+        self.assertEqual(code.encode(), handle.read())
+
+        # Empty content still has a single empty line
+        stream = iter_pound_lines(io.BytesIO(b""))
+        self.assertEqual([("", False, None, None)], list(stream))
+
+    def test_scanner(self):
+        code = textwrap.dedent("""\
+            a = 1
+            b = 2  #@= 2-3
+            #@[ 5-
+            c = 3
+            #@]
+            d = 4
+            e = 5
+        """)
+        self.assertEqual([1, 2, 4], scan_lines(code, POUND_STYLE.scanner))
+        self.assertEqual([], scan_lines("", POUND_STYLE.scanner))
+        self.assertEqual([0, 2], scan_lines("#@ #@\n\n#@", POUND_STYLE.scanner))
+
+        text = "<a>\n<!--@+ 2\n<b>\n @+-->\n"
+        self.assertEqual([1, 3], scan_lines(text, XML_STYLE.scanner))
+
+        # Runs of plain lines give the same results as parsing them one at a
+        # time, including inside blocks. Content dense with markers is
+        # always parsed a line at a time
+        results = []
+        for dense in (0, 100):
+            with patch('julienne.parsers.DENSE_LINES', dense):
+                parser = parse_pound_content(code)
+
+            self.assertEqual(["a = 1", "b = 2", "c = 3", "d = 4", "e = 5"],
+                [line.content for line in parser.lines])
+            self.assertEqual((True, 5, None), (parser.lines[2].conditional,
+                parser.lines[2].lower, parser.lines[2].upper))
+            self.assertFalse(parser.lines[4].conditional)
+            self.assertEqual((5, 3, 5), parser.get_range())
+            results.append([(line.content, line.conditional, line.lower,
+                line.upper) for line in parser.lines])
+
+        self.assertEqual(results[0], results[1])
+
+        # Range tokens are memoized, bad ones still raise
+        self.assertIs(range_token("12-"), range_token("12-"))
+        with self.assertRaises(ValueError):
+            range_token("x")
+
+    def test_chapter_ranges(self):
+        self.assertEqual([(3, 7), (12, 12), (30, None)],
+            chapter_ranges("3-7,12, 30-"))
+        self.assertEqual([(1, 4)], chapter_ranges("-4,"))
+
+        for expression in ["", ",", "a-b", "3-4-5"]:
+            with self.assertRaises(ValueError):
+                chapter_ranges(expression)
@@ -0,0 +1,131 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from julienne.filemodel import FileTree
+from julienne.nodes import StyledFileNode
+from julienne.parsers import (parse_content, parse_pound_content,
+    parse_xml_content, CommentStyle, COMMENT_STYLES)
+
+# ============================================================================
+
+JS_CODE = """\
+let a = 1;
+let b = 2;  //@= 2-3 added later
+//@+ 3-4
+//@- let c = 3;
+//@[ 4-
+let d = 4;
+//@]
+"""
+
+JS_EXPECTED = {
+    1: "let a = 1;\n",
+    2: "let a = 1;\nlet b = 2;  // added later\n",
+    3: "let a = 1;\nlet b = 2;  // added later\nlet c = 3;\n",
+    4: "let a = 1;\nlet c = 3;\nlet d = 4;\n",
+}
+
+CSS_CODE = """\
+p { color: red; }
+a { color: blue; } /*@= 2- links */
+/*@+ 3
+em { color: green; }
+@+*/
+"""
+
+CSS_EXPECTED = {
+    1: "p { color: red; }\n",
+    2: "p { color: red; }\na { color: blue; } /* links */\n",
+    3: "p { color: red; }\na { color: blue; } /* links */\n"
+        "em { color: green; }\n",
+}
+
+# ----------------------------------------------------------------------------
+
+class CommentStyleTestCase(TestCase):
+
+    def test_builtin_styles(self):
+        # Line comment styles behave like the Python parser
+        parser = parse_content(JS_CODE, COMMENT_STYLES['js'])
+        for chapter, expected in JS_EXPECTED.items():
+            self.assertEqual(expected, parser.render(chapter))
+
+        sql = JS_CODE.replace('//', '--')
+        parser = parse_content(sql, COMMENT_STYLES['sql'])
+        self.assertEqual(JS_EXPECTED[2].replace('//', '--'), parser.render(2))
+
+        # Comment styles with closers behave like the XML parser
+        parser = parse_content(CSS_CODE, COMMENT_STYLES['css'])
+        for chapter, expected in CSS_EXPECTED.items():
+            self.assertEqual(expected, parser.render(chapter))
+
+        jinja = "<p>\n{#@[ 2 #}\n{{ name }}\n{#@] #}\n</p>\n"
+        parser = parse_content(jinja, COMMENT_STYLES['jinja'])
+        self.assertEqual("<p>\n</p>\n", parser.render(1))
+        self.assertEqual("<p>\n{{ name }}\n</p>\n", parser.render(2))
+
+        with self.assertRaises(ValueError):
+            parse_content("a\n@+*/\n", COMMENT_STYLES['css'])
+
+    def test_same_as_originals(self):
+        code = JS_CODE.replace('//', '#')
+        self.assertEqual(parse_pound_content(code).render(3),
+            parse_content(code, COMMENT_STYLES['pound']).render(3))
+
+        html = CSS_CODE.replace('/*', '<!--').replace('*/', '-->')
+        self.assertEqual(parse_xml_content(html).render(3),
+            parse_content(html, COMMENT_STYLES['xml']).render(3))
+
+    def test_custom_style(self):
+        style = CommentStyle('lisp', ';;')
+        parser = parse_content("(a)\n(b) ;;@= 2 new\n", style)
+        self.assertEqual("(a)\n(b) ;; new\n", parser.render(2))
+
+        with self.assertRaises(ValueError):
+            CommentStyle('empty', '')
+
+    def test_config(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            code = tmp / 'code'
+            code.mkdir()
+            (code / 'app.js').write_text(JS_CODE)
+            (code / 'site.css').write_text(CSS_CODE)
+            (code / 'query.sql').write_text("select 1;  --@= 2\n")
+            (code / 'notes.lisp').write_text("(a)\n(b) ;;@= 2\n")
+
+            config = {
+                'comment_styles': {
+                    'js': {'globs': ['**/*.js', ]},
+                    'css': {'globs': ['**/*.css', ]},
+                    'lisp': {'opener': ';;', 'globs': ['**/*.lisp', ]},
+                },
+            }
+            tree = FileTree(config, tmp, code)
+            self.assertEqual(4, tree.biggest)
+
+            output = tmp / 'output'
+            tree.generate(output)
+
+            for chapter, expected in JS_EXPECTED.items():
+                result = output / f'ch{chapter}/code/app.js'
+                self.assertEqual(expected, result.read_text())
+
+            result = output / 'ch3/code/site.css'
+            self.assertEqual(CSS_EXPECTED[3], result.read_text())
+            result = output / 'ch1/code/notes.lisp'
+            self.assertEqual("(a)\n", result.read_text())
+
+            # Styles without globs aren't used, the file is copied as is
+            result = output / 'ch1/code/query.sql'
+            self.assertEqual("select 1;  --@= 2\n", result.read_text())
+
+            nodes = [node for node in tree.root.children if
+                isinstance(node, StyledFileNode)]
+            self.assertEqual(3, len(nodes))
+
+            # Unknown styles need an opener
+            config = {'comment_styles': {'nope': {'globs': ['*.x', ]}}}
+            with self.assertRaises(ValueError):
+                FileTree(config, tmp, code)
@@ -0,0 +1,96 @@
+from collections.abc import Mapping
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import tomli
+
+from julienne.filemodel import FileTree
+from julienne.formatters import Formatter
+from julienne.nodes import CopyOnlyFileNode
+from julienne.writers import FileWriter
+
+# ============================================================================
+
+class ChapterViewTestCase(TestCase):
+    def setUp(self):
+        here = Path(__file__).parent
+        self.config_path = here / Path('data/sample.toml')
+        self.config = tomli.loads(self.config_path.read_text())
+        self.code = here / Path('data/code')
+        self.expected = here / Path('data/expected')
+
+    def expected_files(self, name):
+        chapter = self.expected / name
+        return {path.relative_to(chapter).as_posix(): path.read_bytes() for
+            path in chapter.rglob('*') if path.is_file()}
+
+    def assert_chapters(self, tree):
+        for num in range(1, tree.biggest + 1):
+            view = tree.render(num)
+            expected = self.expected_files(tree.chapter_name(num))
+            self.assertEqual(expected, dict(view))
+
+    def test_render(self):
+        tree = FileTree(self.config, self.config_path.parent, self.code)
+        self.assert_chapters(tree)
+
+        view = tree.render(4)
+        self.assertIsInstance(view, Mapping)
+        self.assertIn('code/after4/amixed.py', view)
+        self.assertNotIn('code/condi.py', view)
+        with self.assertRaises(KeyError):
+            view['code/condi.py']
+
+    def test_modes(self):
+        # File major trees keep no parse results, streamed files are parsed
+        # as they are looked up
+        tree = FileTree(self.config, self.config_path.parent, self.code,
+            file_major=True)
+        self.assert_chapters(tree)
+        self.assertTrue(all(node.parser is None for node in
+            tree.root.children if hasattr(node, 'parser')))
+
+        config = dict(self.config, stream_size=0)
+        tree = FileTree(config, self.config_path.parent, self.code)
+        self.assert_chapters(tree)
+
+        # Trees built for a single chapter only render that one
+        tree = FileTree(self.config, self.config_path.parent, self.code,
+            chapter=3)
+        self.assertEqual(self.expected_files('chap3'), dict(tree.render(3)))
+        with self.assertRaises(ValueError):
+            tree.render(2)
+
+    def test_formatter(self):
+        # Python files, including copy only ones, are formatted the same as
+        # the writer formats them
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            code = tmp / 'code'
+            shutil.copytree(self.code, code)
+            (code / 'extra.py').write_text("import sys\nimport os\n"
+                "x = {  1:2 }\n")
+            (code / 'marked.py').write_text("import sys\nimport os\n"
+                "x = {  1:2 }  #@= 2-\n")
+
+            config = dict(self.config, pound_globs=['**/marked.py'])
+            tree = FileTree(config, tmp, code)
+            self.assertIn(CopyOnlyFileNode, {type(node) for node in
+                tree.root.children if node.path.name == 'extra.py'})
+
+            formatter = Formatter(True, True)
+            output = tmp / 'output'
+            tree.generate(output, writer=FileWriter(formatter=formatter))
+
+            for num in range(1, tree.biggest + 1):
+                view = tree.render(num, formatter)
+                chapter = output / tree.chapter_name(num)
+                written = {path.relative_to(chapter).as_posix():
+                    path.read_bytes() for path in chapter.rglob('*')
+                    if path.is_file()}
+                self.assertEqual(written, dict(view))
+
+            self.assertEqual(b"import os\nimport sys\n\nx = {1: 2}\n",
+                tree.render(2, formatter)['code/extra.py'])
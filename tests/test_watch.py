@@ -0,0 +1,148 @@
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipIf
+
+from julienne.watch import (Rebuilder, PollingWatcher, InotifyWatcher,
+    _libc)
+
+# ============================================================================
+
+class WatchTestCase(TestCase):
+    def _copy_sample(self, tmp):
+        here = Path(__file__).parent
+        shutil.copy(here / 'data/sample.toml', tmp / 'sample.toml')
+        shutil.copytree(here / 'data/code', tmp / 'code',
+            ignore=shutil.ignore_patterns('__pycache__'))
+
+        return tmp / 'sample.toml'
+
+    def test_rebuilder(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            config_file = self._copy_sample(tmp)
+            rebuilder = Rebuilder(str(config_file))
+            rebuilder.build()
+            output = tmp / 'last_output'
+
+            # Changing a file only rewrites that file
+            rebuilder.tree.changes(3)
+            source = tmp / 'code/mixed.py'
+            source.write_text("a = 1\nb = 2  #@= 3\n")
+            other = output / 'chap1/code/copy_only.txt'
+            other.unlink()
+
+            self.assertFalse(rebuilder.update({str(source)}))
+            self.assertEqual("a = 1\n",
+                (output / 'chap2/code/mixed.py').read_text())
+            self.assertEqual("a = 1\nb = 2\n",
+                (output / 'chap3/code/mixed.py').read_text())
+            self.assertFalse(other.exists())
+
+            # What was worked out from the old content is forgotten
+            changes = {change.path: change for change in
+                rebuilder.tree.changes(3)}
+            self.assertEqual([(2, 2)], changes['code/mixed.py'].added)
+
+            # Files in ranged directories only go to their chapters
+            source = tmp / 'code/after4/amixed.py'
+            source.write_text("x = 1\n")
+            rebuilder.update({str(source)})
+            self.assertFalse((output / 'chap3/code/after4').exists())
+            self.assertEqual("x = 1\n",
+                (output / 'chap6/code/after4/amixed.py').read_text())
+
+            # New chapter numbers change the directory names, rebuild
+            source = tmp / 'code/mixed.py'
+            source.write_text("a = 1  #@= 12\n")
+            self.assertTrue(rebuilder.update({str(source)}))
+            self.assertEqual(12, rebuilder.tree.biggest)
+            self.assertTrue((output / 'chap12/code/mixed.py').exists())
+
+            # New files and skipped files
+            source = tmp / 'code/new.py'
+            source.write_text("n = 1\n")
+            self.assertTrue(rebuilder.update({str(source)}))
+            self.assertTrue((output / 'chap01/code/new.py').exists())
+
+            source = tmp / 'code/not_here/nope.py'
+            source.write_text("n = 1\n")
+            self.assertFalse(rebuilder.update({str(source)}))
+
+            # Config changes rebuild everything
+            self.assertTrue(rebuilder.update({str(config_file)}))
+
+            # Parse errors in a changed file name it
+            source = tmp / 'code/mixed.py'
+            source.write_text("x  #@- bad\n")
+            with self.assertRaises(ValueError) as context:
+                rebuilder.update({str(source)})
+
+            self.assertIn(f"Error parsing {source}", str(context.exception))
+
+    def test_incremental(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            config_file = self._copy_sample(tmp)
+            rebuilder = Rebuilder(str(config_file), incremental=True)
+            rebuilder.build()
+            output = tmp / 'last_output'
+            other = output / 'chap1/code/copy_only.txt'
+            mtime = other.stat().st_mtime_ns
+
+            # Refreshing a file keeps the manifest up to date with it
+            source = tmp / 'code/mixed.py'
+            source.write_text("a = 1  #@= 3-\n")
+            self.assertFalse(rebuilder.update({str(source)}))
+            self.assertFalse((output / 'chap2/code/mixed.py').exists())
+            written = output / 'chap3/code/mixed.py'
+            written_mtime = written.stat().st_mtime_ns
+
+            # Full rebuilds carry on from it, only removing what is gone
+            shutil.rmtree(tmp / 'code/after4')
+            self.assertTrue(rebuilder.update({str(tmp / 'code/after4')}))
+            self.assertFalse((output / 'chapFour/code/after4').exists())
+            self.assertFalse((output / 'chap2/code/mixed.py').exists())
+            self.assertEqual(mtime, other.stat().st_mtime_ns)
+            self.assertEqual(written_mtime, written.stat().st_mtime_ns)
+
+    def test_polling(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            (tmp / 'skipped').mkdir()
+            path = tmp / 'a.txt'
+            path.write_text("a")
+
+            watcher = PollingWatcher([tmp, ], [],
+                lambda path: path.endswith('skipped'), interval=0.01)
+            (tmp / 'skipped/b.txt').write_text("b")
+            path.write_text("changed")
+
+            changed = watcher.wait(debounce=0.01)
+            self.assertEqual({str(path)}, changed)
+
+    @skipIf(_libc() is None, "inotify not available")
+    def test_inotify(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            code = tmp / 'code'
+            code.mkdir()
+            config = tmp / 'config.toml'
+            config.write_text("")
+
+            watcher = InotifyWatcher([code, ], [config, ])
+            try:
+                # Only the watched file counts in its directory
+                (tmp / 'other.txt').write_text("x")
+                config.write_text("y")
+
+                # New directories are watched as well
+                (code / 'sub').mkdir()
+                changed = watcher.wait(debounce=0.05)
+                self.assertEqual({str(config), str(code / 'sub')}, changed)
+
+                (code / 'sub/a.py').write_text("a = 1\n")
+                changed = watcher.wait(debounce=0.05)
+                self.assertEqual({str(code / 'sub/a.py')}, changed)
+            finally:
+                watcher.close()
@@ -0,0 +1,126 @@
+import errno
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from julienne.writers import FileWriter
+
+# ============================================================================
+
+class FileWriterTestCase(TestCase):
+
+    def test_copy_mode(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            writer = FileWriter()
+
+            writer.write(tmp / 'a.txt', "stuff\n", 'key')
+            writer.write(tmp / 'b.txt', "stuff\n", 'key')
+
+            self.assertEqual("stuff\n", (tmp / 'b.txt').read_text())
+            self.assertNotEqual((tmp / 'a.txt').stat().st_ino,
+                (tmp / 'b.txt').stat().st_ino)
+
+    def test_hardlink(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            writer = FileWriter('hardlink')
+
+            # Same key gets linked, different key gets written
+            writer.write(tmp / 'a.txt', "stuff\n", 'key')
+            writer.write(tmp / 'b.txt', "stuff\n", 'key')
+            writer.write(tmp / 'c.txt', "other\n", 'other')
+
+            a = (tmp / 'a.txt').stat()
+            self.assertEqual(2, a.st_nlink)
+            self.assertEqual(a.st_ino, (tmp / 'b.txt').stat().st_ino)
+            self.assertEqual(1, (tmp / 'c.txt').stat().st_nlink)
+
+            # Copies of the same source are linked
+            src = tmp / 'src.txt'
+            src.write_text("source\n")
+            writer.copy(src, tmp / 'd.txt')
+            writer.copy(src, tmp / 'e.txt')
+            self.assertEqual((tmp / 'd.txt').stat().st_ino,
+                (tmp / 'e.txt').stat().st_ino)
+
+            # Writing over a linked file must not change the other copy
+            writer = FileWriter()
+            writer.write(tmp / 'b.txt', "changed\n")
+            self.assertEqual("stuff\n", (tmp / 'a.txt').read_text())
+            self.assertEqual("changed\n", (tmp / 'b.txt').read_text())
+
+    def test_fallback(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            writer = FileWriter('hardlink')
+
+            error = OSError(errno.EXDEV, "Invalid cross-device link")
+            with patch('julienne.writers.os.link', side_effect=error):
+                writer.write(tmp / 'a.txt', "stuff\n", 'key')
+                writer.write(tmp / 'b.txt', "stuff\n", 'key')
+
+            self.assertEqual('copy', writer.link_mode)
+            self.assertEqual("stuff\n", (tmp / 'b.txt').read_text())
+
+    def test_compare(self):
+        with TemporaryDirectory() as td:
+            tmp = Path(td)
+            src = tmp / 'src.txt'
+            src.write_text("source\n")
+            output = tmp / 'output'
+            output.mkdir()
+
+            def write_all(writer):
+                writer.write(output / 'a.txt', "stuff\n")
+                writer.copy(src, output / 'b.txt')
+                writer.copy_text(src, output / 'c.txt', add_newline=True)
+                with writer.open_stream(output / 'd.txt') as write:
+                    write("streamed\n")
+
+            write_all(FileWriter())
+            paths = [output / name for name in ['a.txt', 'b.txt', 'c.txt',
+                'd.txt']]
+            mtimes = [path.stat().st_mtime_ns - 10**9 for path in paths]
+            for path, mtime in zip(paths, mtimes):
+                os.utime(path, ns=(mtime, mtime))
+
+            # Nothing has changed, nothing is touched
+            writer = FileWriter(compare=True)
+            write_all(writer)
+            self.assertEqual(0, writer.written)
+            self.assertEqual(4, writer.unchanged)
+            self.assertEqual(mtimes, [path.stat().st_mtime_ns for path in
+                paths])
+            self.assertEqual(["d.txt"], [path.name for path in
+                output.glob('d.txt*')])
+
+            # Same size but different content is still written
+            writer = FileWriter(compare=True)
+            writer.write(output / 'a.txt', "STUFF\n")
+            self.assertEqual("STUFF\n", (output / 'a.txt').read_text())
+            self.assertEqual(1, writer.written)
+
+            # Anything not produced can be removed
+            writer.mkdir(output / 'empty')
+            (output / 'old').mkdir()
+            (output / 'old/old.txt').write_text("old")
+            self.assertEqual(4, writer.remove_others(output))
+            self.assertEqual({'a.txt', 'empty'}, {path.name for path in
+                output.iterdir()})
+
+            # Counts are passed back from worker processes
+            writer = FileWriter(compare=True)
+            writer.write(output / 'a.txt', "STUFF\n")
+            results = writer.take_results()
+            self.assertEqual(0, writer.unchanged)
+
+            writer.merge_results(results)
+            self.assertEqual(1, writer.unchanged)
+            self.assertEqual({str(output / 'a.txt')}, writer.outputs)
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            FileWriter('symlink')
@@ -1,9 +1,11 @@
+import io
 import textwrap
 
 from waelstow import noted_raise
 
 from tests.base import BaseParserTestCase
-from julienne.parsers import parse_xml_content
+from julienne.parsers import (parse_xml_content, iter_xml_lines,
+    emit_xml_lines)
 
 # ============================================================================
 
@@ -177,3 +179,21 @@ class XMLParserTestCase(BaseParserTestCase):
         # --- Test an uncommented conditional block
         parser = parse_xml_content(BLOCK3)
         self.assertParser(parser, True, EXPECTED_BLOCK3, 2, None)
+
+    def test_streaming(self):
+        for text in (BLOCK1, BLOCK2):
+            parser = parse_xml_content(text)
+
+            # Streamed lines match the full parse
+            stream = iter_xml_lines(io.StringIO(text))
+            expected = [(line.content, line.conditional, line.lower,
+                line.upper) for line in parser.lines]
+            self.assertEqual(expected, list(stream))
+            self.assertEqual(parser.get_range(), stream.get_range())
+
+            outputs = {chapter: io.StringIO() for chapter in range(1, 6)}
+            emit_xml_lines(io.BytesIO(text.encode()),
+                {chapter: out.write for chapter, out in outputs.items()})
+
+            for chapter, out in outputs.items():
+                self.assertEqual(parser.render(chapter), out.getvalue())